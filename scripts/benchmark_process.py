@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_process.py - process_*スクリプトの処理時間・メモリ使用量を計測するベンチマーク
+
+各処理を data/ の実ファイルと、実ファイルを元に規模を10倍・100倍にした合成データで
+実行し、実行時間・ピークRSS・1秒あたりの処理行数を記録する。保存済みのベースラインと
+比較し、許容範囲を超えて遅くなった（またはメモリが増えた）ケースがあれば終了コード1で終了する。
+
+ケースごとに拡大する次元:
+    cpi_transform / cpi_merge: 月数
+    payroll:                   年数
+    di_excel / di_paste:       月数
+    real_estate:               地域（シート）数
+
+使い方:
+    python scripts/benchmark_process.py                    # 計測してベースラインと比較
+    python scripts/benchmark_process.py --update-baseline  # ベースラインを更新
+    python scripts/benchmark_process.py --case cpi_transform --scale 1 10
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# プロジェクトのルートディレクトリとデータディレクトリの設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+benchmarks_dir = os.path.join(project_root, "benchmarks")
+inputs_dir = os.path.join(benchmarks_dir, ".inputs")
+default_baseline = os.path.join(benchmarks_dir, "process_baseline.json")
+
+# 既定で計測する規模
+DEFAULT_SCALES = [1, 10, 100]
+
+# ベースラインから何割遅くなったら失敗とするか
+DEFAULT_TOLERANCE = 0.25
+
+# 計測誤差を無視する絶対値（秒・MB）
+MIN_TIME_DELTA = 0.05
+MIN_RSS_DELTA = 20.0
+
+# 実ファイル
+REAL_FILES = {
+    'cpi_csv': os.path.join(data_dir, "CPI_中分類指数_全国_月次_前年同月比.csv"),
+    'cpi_yoy': os.path.join(data_dir, "CPI_総合_前年同月比.csv"),
+    'cpi_index': os.path.join(data_dir, "CPI_総合_指数.csv"),
+    'payroll': os.path.join(data_dir, "毎月勤労統計調査.xlsx"),
+    'di': os.path.join(data_dir, "長期系列_CI指数_DI指数_DI景気指標.xlsx"),
+    'real_estate': os.path.join(data_dir, "commercial_real_estate_price_index.xlsx"),
+}
+
+
+# ---------------------------------------------------------------------------
+# 合成データの生成
+# ---------------------------------------------------------------------------
+
+def shift_years(values, offset):
+    """「1970年1月」や 1970000101 のような年を含む値の年をずらす"""
+    def shift(value):
+        if isinstance(value, str):
+            return re.sub(r'(\d{4})(年|00\d{4}$)', lambda m: f"{int(m.group(1)) + offset}{m.group(2)}", value)
+        return value
+    return values.map(shift)
+
+
+def generate_cpi_csv(scale, path):
+    """中分類指数CSVの月数を scale 倍にする"""
+    import pandas as pd
+
+    df = pd.read_csv(REAL_FILES['cpi_csv'], dtype=str, keep_default_na=False)
+    header_end = next(i for i, row in df.iterrows() if any('時間軸コード' in str(v) for v in row)) + 1
+    header, data = df.iloc[:header_end], df.iloc[header_end:]
+
+    years = data.iloc[:, 8].str.extract(r'(\d{4})年')[0].dropna().astype(int)
+    span = years.max() - years.min() + 1
+
+    blocks = [header]
+    for j in range(scale):
+        block = data.copy()
+        for col in (7, 8):
+            block.iloc[:, col] = shift_years(block.iloc[:, col], j * span)
+        blocks.append(block)
+    pd.concat(blocks).to_csv(path, index=False)
+
+
+def generate_cpi_merge(scale, yoy_path, index_path):
+    """総合の前年同月比・指数CSVの月数を scale 倍にする"""
+    import numpy as np
+    import pandas as pd
+
+    months = pd.period_range('1971-01', periods=650 * scale, freq='M')
+    labels = [f"{p.year:04d}/{p.month:02d}" for p in months]
+    rng = np.random.default_rng(0)
+    pd.DataFrame({'年月': labels, '前年同月比': rng.normal(2, 3, len(labels)).round(1)}).to_csv(yoy_path, index=False)
+    pd.DataFrame({'年月': labels, '指数': rng.normal(100, 5, len(labels)).round(1)}).to_csv(index_path, index=False)
+
+
+def generate_payroll(scale, path):
+    """毎月勤労統計調査のTLシートの年数を scale 倍にする（年は1900～2100の範囲で循環させる）"""
+    import pandas as pd
+
+    df = pd.read_excel(REAL_FILES['payroll'], sheet_name='TL', header=None)
+    is_year = df.iloc[:, 0].map(lambda v: isinstance(v, (int, float)) and 1900 <= v <= 2100)
+
+    rows = []
+    for i, row in df.iterrows():
+        if not is_year[i]:
+            rows.append(row)
+            continue
+        for j in range(scale):
+            new_row = row.copy()
+            new_row.iloc[0] = 1900 + (int(row.iloc[0]) - 1900 + j * 75) % 201
+            rows.append(new_row)
+    pd.DataFrame(rows).to_excel(path, sheet_name='TL', header=False, index=False)
+
+
+def generate_di(scale, xlsx_path, paste_path):
+    """景気動向指数の長期系列の月数を scale 倍にし、Excelとタブ区切りテキストで保存する"""
+    import pandas as pd
+
+    df = pd.read_excel(REAL_FILES['di'], header=None)
+    header, data = df.iloc[:6], df.iloc[6:]
+    span = int(data.iloc[:, 1].max() - data.iloc[:, 1].min() + 1)
+
+    blocks = [header]
+    for j in range(scale):
+        block = data.copy()
+        block.iloc[:, 1] = block.iloc[:, 1] + j * span
+        blocks.append(block)
+    scaled = pd.concat(blocks)
+    if xlsx_path:
+        scaled.to_excel(xlsx_path, header=False, index=False)
+    if paste_path:
+        # process_paste_file は年・月の列名をヘッダー行（先行・一致・遅行）より前の行から探し、
+        # ヘッダー行の3行後をデータ開始とみなすので、英語の列名行を先頭に置く
+        lines = pd.concat([scaled.iloc[[3, 2, 4, 5]], scaled.iloc[6:]])
+        text = lines.fillna('').astype(str).apply(lambda r: '\t'.join(r), axis=1)
+        with open(paste_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(text))
+
+
+def generate_real_estate(scale, path):
+    """商業用不動産価格指数の地域（シート）数を scale 倍にする"""
+    import pandas as pd
+
+    sheets = pd.read_excel(REAL_FILES['real_estate'], sheet_name=None, header=None)
+    with pd.ExcelWriter(path) as writer:
+        for j in range(scale):
+            for name, df in sheets.items():
+                sheet_name = name if j == 0 else f"{name[:24]}_{j}"
+                df.to_excel(writer, sheet_name=sheet_name, header=False, index=False)
+
+
+# ---------------------------------------------------------------------------
+# ケース定義
+# ---------------------------------------------------------------------------
+
+def prepare_inputs(case, scale):
+    """ケースの入力ファイルを用意する（合成データは benchmarks/.inputs/ にキャッシュする）"""
+    if case == 'di_paste' and scale == 1:
+        scale_dir = os.path.join(inputs_dir, "x1")
+    elif scale == 1:
+        return {
+            'cpi_transform': {'csv': REAL_FILES['cpi_csv']},
+            'cpi_merge': {'yoy': REAL_FILES['cpi_yoy'], 'index': REAL_FILES['cpi_index']},
+            'payroll': {'xlsx': REAL_FILES['payroll']},
+            'di_excel': {'xlsx': REAL_FILES['di']},
+            'real_estate': {'xlsx': REAL_FILES['real_estate']},
+        }[case]
+    else:
+        scale_dir = os.path.join(inputs_dir, f"x{scale}")
+    os.makedirs(scale_dir, exist_ok=True)
+
+    def cached(filename, generate):
+        path = os.path.join(scale_dir, filename)
+        if not os.path.exists(path):
+            print(f"合成データを生成しています: {path}")
+            generate(path)
+        return path
+
+    if case == 'cpi_transform':
+        return {'csv': cached("cpi.csv", lambda p: generate_cpi_csv(scale, p))}
+    if case == 'cpi_merge':
+        yoy = os.path.join(scale_dir, "cpi_yoy.csv")
+        index = os.path.join(scale_dir, "cpi_index.csv")
+        if not (os.path.exists(yoy) and os.path.exists(index)):
+            generate_cpi_merge(scale, yoy, index)
+        return {'yoy': yoy, 'index': index}
+    if case == 'payroll':
+        return {'xlsx': cached("payroll.xlsx", lambda p: generate_payroll(scale, p))}
+    if case == 'di_excel':
+        return {'xlsx': cached("di.xlsx", lambda p: generate_di(scale, p, None))}
+    if case == 'di_paste':
+        return {'txt': cached("paste.txt", lambda p: generate_di(scale, None, p))}
+    if case == 'real_estate':
+        return {'xlsx': cached("real_estate.xlsx", lambda p: generate_real_estate(scale, p))}
+    raise KeyError(case)
+
+
+def run_case(case, inputs, workdir):
+    """ケースを1回実行する"""
+    import pathlib
+
+    if case == 'cpi_transform':
+        from process_cpi import transform_cpi_csv
+        transform_cpi_csv(inputs['csv'], os.path.join(workdir, "out.csv"), "前年同月比")
+    elif case == 'cpi_merge':
+        from process_cpi import merge_cpi_data
+        merge_cpi_data(inputs['yoy'], inputs['index'], os.path.join(workdir, "out.csv"))
+    elif case == 'payroll':
+        from process_payroll import extract_and_save_tl_data
+        extract_and_save_tl_data(inputs['xlsx'], os.path.join(workdir, "out.csv"))
+    elif case == 'di_excel':
+        from process_di import process_excel_file
+        process_excel_file(pathlib.Path(inputs['xlsx']), pathlib.Path(workdir))
+    elif case == 'di_paste':
+        from process_di import process_paste_file
+        process_paste_file(pathlib.Path(inputs['txt']), pathlib.Path(workdir))
+    elif case == 'real_estate':
+        from process_real_estate import process_real_estate_data
+        process_real_estate_data(inputs['xlsx'], os.path.join(workdir, "out.csv"))
+
+
+def count_input_rows(case, inputs):
+    """入力の行数（rows/secの分母）を数える"""
+    import pandas as pd
+
+    if case == 'cpi_transform':
+        return len(pd.read_csv(inputs['csv'], usecols=[0]))
+    if case == 'cpi_merge':
+        return len(pd.read_csv(inputs['yoy'])) + len(pd.read_csv(inputs['index']))
+    if case == 'di_paste':
+        with open(inputs['txt'], 'r', encoding='utf-8') as f:
+            return sum(1 for _ in f)
+    if case == 'payroll':
+        return len(pd.read_excel(inputs['xlsx'], sheet_name='TL', header=None))
+    if case == 'real_estate':
+        # 地域（シート）を増やしたときに比較できるよう、全シートの行数を合計する
+        return sum(len(df) for df in pd.read_excel(inputs['xlsx'], sheet_name=None, header=None).values())
+    return len(pd.read_excel(inputs['xlsx'], header=None))
+
+
+CASES = ['cpi_transform', 'cpi_merge', 'payroll', 'di_excel', 'di_paste', 'real_estate']
+
+
+def peak_rss_mb():
+    """このプロセスのピークRSS（MB）"""
+    # Linuxでは ru_maxrss が親プロセスから引き継がれることがあるので VmHWM を優先する
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def child_main(case, scale, repeat):
+    """子プロセスでケースを実行し、結果をJSONで標準出力に書き出す"""
+    sys.path.insert(0, script_dir)
+    inputs = prepare_inputs(case, scale)
+
+    # 依存ライブラリやモジュールの読み込みは計測対象から外す
+    import openpyxl  # noqa: F401
+    import layout_cache
+    import process_cpi, process_di, process_payroll, process_real_estate  # noqa: F401
+
+    timings = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(repeat):
+            # 毎回表の配置の検出から計測する（キャッシュは measure() が一時ディレクトリに向けている）
+            if os.path.exists(layout_cache.cache_path()):
+                os.remove(layout_cache.cache_path())
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                run_case(case, inputs, workdir)
+                timings.append(time.perf_counter() - started)
+
+    # 行数を数える前にピークRSSを取得する
+    peak_rss = peak_rss_mb()
+    rows = count_input_rows(case, inputs)
+    wall = min(timings)
+    print(json.dumps({
+        'case': case,
+        'scale': scale,
+        'wall_time': round(wall, 4),
+        'peak_rss_mb': round(peak_rss, 1),
+        'rows': rows,
+        'rows_per_sec': round(rows / wall, 1) if wall > 0 else None,
+    }))
+
+
+def measure(case, scale, repeat):
+    """ケースを別プロセスで実行して計測する（ピークRSSをケースごとに分けるため）"""
+    # 合成データの生成は計測の外で済ませておく
+    prepare_inputs(case, scale)
+    # 実行レポートと表の配置のキャッシュは本番の reports/ でなく一時ディレクトリに書き込む
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = dict(os.environ,
+                   BOJDATA_REPORT=os.path.join(state_dir, "run_report.json"),
+                   BOJDATA_LAYOUT_CACHE=os.path.join(state_dir, "layout_cache.json"))
+        env.pop('BOJDATA_EVENTS', None)
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', case, str(scale), str(repeat)],
+            capture_output=True, text=True, cwd=project_root, env=env,
+        )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError(f"{case} x{scale} の実行に失敗しました")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """ベースラインと比較し、劣化したケースのメッセージのリストを返す"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['wall_time'] > base['wall_time'] * (1 + tolerance) and \
+                result['wall_time'] - base['wall_time'] > MIN_TIME_DELTA:
+            regressions.append(f"{key}: 実行時間 {base['wall_time']:.3f}s -> {result['wall_time']:.3f}s")
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance) and \
+                result['peak_rss_mb'] - base['peak_rss_mb'] > MIN_RSS_DELTA:
+            regressions.append(f"{key}: ピークRSS {base['peak_rss_mb']:.1f}MB -> {result['peak_rss_mb']:.1f}MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="process_*スクリプトのベンチマーク")
+    parser.add_argument('--case', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--scale', nargs='+', type=int, default=DEFAULT_SCALES)
+    parser.add_argument('--repeat', type=int, default=3, help="各ケースの繰り返し回数（最小値を採用）")
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help="計測結果を書き出すJSONファイル")
+    parser.add_argument('--clean', action='store_true', help="キャッシュした合成データを削除する")
+    args = parser.parse_args(argv)
+
+    if args.clean and os.path.exists(inputs_dir):
+        shutil.rmtree(inputs_dir)
+
+    results = {}
+    print(f"{'ケース':<20}{'規模':>6}{'時間(s)':>10}{'RSS(MB)':>10}{'行/秒':>14}")
+    for case in args.case:
+        for scale in args.scale:
+            result = measure(case, scale, args.repeat)
+            results[f"{case}@x{scale}"] = result
+            print(f"{case:<20}{'x' + str(scale):>6}{result['wall_time']:>10.3f}"
+                  f"{result['peak_rss_mb']:>10.1f}{result['rows_per_sec'] or 0:>14,.0f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"ベースラインを更新しました: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("ベースラインがありません。--update-baseline で作成してください。")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nベースラインから{args.tolerance:.0%}以上劣化したケースがあります:")
+        for message in regressions:
+            print(f"- {message}")
+        return 1
+    print("\nすべてのケースがベースラインの範囲内です")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child_main(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        sys.exit(main())
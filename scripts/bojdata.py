@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bojdata.py - 取得・加工スクリプトをまとめて実行するコマンドラインツール
+
+各スクリプトは実行するときに初めて読み込むため、status のような軽いコマンドでは
+pandas・requests・BeautifulSoup を読み込まない。
+
+pip install -e . で導入すると bojdata コマンドとして実行でき、scripts/ の各スクリプトも
+モジュールとして読み込める（pyproject.toml）。
+
+使い方:
+    bojdata status                      # python scripts/bojdata.py status と同じ
+    python scripts/bojdata.py status
+    python scripts/bojdata.py fetch cpi [開始年 開始月 終了年 終了月]
+    python scripts/bojdata.py process di
+    python scripts/bojdata.py run all
+    python scripts/bojdata.py run all --deadline 45 --allow-stale
+
+--deadline を指定すると、各処理を別のプロセスで実行し、処理ごとの上限（STAGE_BUDGETS）と
+全体の期限のうち早いほうを過ぎた処理を打ち切る。後段の処理（派生指標・タイル・変更履歴など）のために
+PUBLISH_RESERVE 秒を残して取得を打ち切るため、期限内に終わった取得の結果は公開される。
+取得・加工が成功しなかったデータソースは実行レポートの sources に stale として記録する。
+"""
+
+import argparse
+import importlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import circuit_breaker
+import metrics
+import profiling
+
+# プロジェクトのルートディレクトリとデータディレクトリの設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+
+# データソースごとの取得・加工処理（モジュール名, 関数名）
+# 並び順はワークフローでの実行順
+SOURCES = {
+    'call_rate': {
+        'fetch': ('get_boj_unsecured_call_rate', 'main'),
+    },
+    'cgpi': {
+        'fetch': ('get_boj_corporate_price_index', 'main'),
+    },
+    'cpi': {
+        'fetch': ('get_cpi', 'main'),
+        'process': ('process_cpi', 'main'),
+    },
+    'payroll': {
+        'fetch': ('get_payroll', 'main'),
+        'process': ('process_payroll', 'main'),
+    },
+    'real_estate': {
+        'fetch': ('get_real_estate', 'main'),
+        'process': ('process_real_estate', 'process_real_estate_data'),
+    },
+    'di': {
+        'fetch': ('get_di', 'main'),
+        'process': ('process_di', 'main'),
+    },
+    'gdp': {
+        'fetch': ('get_fred_gdp', 'main'),
+    },
+    # 改定される系列の公表ごとの値（取得した後、派生指標の前に記録する）
+    'vintages': {
+        'process': ('vintage_store', 'record_vintages'),
+    },
+    # 取得済みの系列から作る派生指標とパネル（他のデータソースの後に実行する）
+    'derived': {
+        'process': ('derived', 'main'),
+    },
+    'panel': {
+        'process': ('panel', 'main'),
+    },
+    'lead_lag': {
+        'process': ('lead_lag', 'main'),
+    },
+    'tiles': {
+        'process': ('publish_tiles', 'main'),
+    },
+    'feed': {
+        'process': ('change_feed', 'record_changes'),
+    },
+    'partitions': {
+        'process': ('partitions', 'write_partitions'),
+    },
+}
+
+
+# --deadline を指定した場合の処理ごとの上限（秒）。指定のない処理は DEFAULT_STAGE_BUDGET
+STAGE_BUDGETS = {
+    ('cpi', 'fetch'): 900,
+    ('payroll', 'fetch'): 600,
+    ('real_estate', 'fetch'): 600,
+    ('di', 'fetch'): 600,
+    ('lead_lag', 'process'): 600,
+}
+DEFAULT_STAGE_BUDGET = 300
+
+# 取得を打ち切ってでも後段の処理のために残す時間（秒）
+PUBLISH_RESERVE = 300
+
+# 残り時間がこれより短い処理は開始しない（秒）
+MIN_STAGE_TIME = 10
+
+# 打ち切る処理に終了を求めてから強制終了するまでの時間（秒）
+TERMINATE_GRACE = 15
+
+
+def resolve(module_name, func_name):
+    """スクリプトを読み込んで関数を返す"""
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def run_step(source, action, extra_args=()):
+    """
+    1つのデータソースの取得または加工を実行する
+
+    Returns:
+        bool: 成功した場合True（例外・0以外の終了コード・Falseの戻り値は失敗）
+    """
+    module_name, func_name = SOURCES[source][action]
+    print(f"\n=== {action} {source} ({module_name}.{func_name}) ===")
+    started = time.perf_counter()
+    # スクリプトは sys.argv から引数を読むため、単体で実行した場合と同じ形にそろえる
+    saved_argv = sys.argv
+    sys.argv = [os.path.join(script_dir, f"{module_name}.py")] + list(extra_args)
+    # 遮断中のホストを使った場合に、実行レポートでどのデータソースが古いままかを記録するため（circuit_breaker.py）
+    os.environ['BOJDATA_SOURCE'] = source
+    if action == 'fetch':
+        circuit_breaker.install()
+    try:
+        with metrics.stage(f"bojdata.{action}.{source}"):
+            result = resolve(module_name, func_name)()
+        ok = result is not False
+    except SystemExit as e:
+        ok = e.code in (None, 0)
+    except Exception as e:
+        print(f"{module_name}.{func_name} の実行中にエラーが発生しました: {e}")
+        ok = False
+    finally:
+        sys.argv = saved_argv
+        os.environ.pop('BOJDATA_SOURCE', None)
+    print(f"=== {action} {source}: {'成功' if ok else '失敗'} ({time.perf_counter() - started:.1f}秒) ===")
+    return ok
+
+
+def run_step_process(source, action, timeout):
+    """
+    1つのデータソースの取得または加工を別のプロセスで実行し、上限を過ぎたら打ち切る
+
+    Returns:
+        str: 'ok'、'failed'（失敗）、'timeout'（打ち切り）
+    """
+    print(f"\n=== {action} {source}（上限 {timeout:.0f}秒） ===", flush=True)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), action, source], cwd=project_root)
+    try:
+        status = 'ok' if process.wait(timeout=timeout) == 0 else 'failed'
+    except subprocess.TimeoutExpired:
+        # SIGTERM で実行レポートを書き出してから終了させ、応答がなければ強制終了する
+        process.terminate()
+        try:
+            process.wait(timeout=TERMINATE_GRACE)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        status = 'timeout'
+    label = {'ok': '成功', 'failed': '失敗', 'timeout': '打ち切り'}[status]
+    print(f"=== {action} {source}: {label} ({time.perf_counter() - started:.1f}秒) ===", flush=True)
+    return status
+
+
+def select_sources(name, action):
+    if name == 'all':
+        return [source for source, actions in SOURCES.items() if action in actions]
+    if name not in SOURCES:
+        raise SystemExit(f"不明なデータソースです: {name}（{', '.join(SOURCES)}, all から指定してください）")
+    if action not in SOURCES[name]:
+        raise SystemExit(f"{name} には {action} の処理がありません")
+    return [name]
+
+
+def command_fetch(args, action='fetch'):
+    sources = select_sources(args.source, action)
+    if args.args and len(sources) > 1:
+        raise SystemExit("追加の引数はデータソースを1つ指定した場合のみ使用できます")
+    results = {source: run_step(source, action, args.args) for source in sources}
+    return 0 if all(results.values()) else 1
+
+
+def command_process(args):
+    return command_fetch(args, action='process')
+
+
+def command_run(args):
+    """
+    取得と加工を続けて実行する（取得に失敗しても既存のファイルで加工を続ける）
+
+    --deadline を指定した場合は各処理を上限付きで実行し、期限までに終わらない処理は打ち切るか開始しない。
+    """
+    if args.source != 'all' and args.source not in SOURCES:
+        raise SystemExit(f"不明なデータソースです: {args.source}（{', '.join(SOURCES)}, all から指定してください）")
+    sources = list(SOURCES) if args.source == 'all' else [args.source]
+    deadline = args.deadline or (float(os.environ['BOJDATA_DEADLINE']) if os.environ.get('BOJDATA_DEADLINE') else None)
+    if deadline is not None:
+        # 別のプロセスで実行する各処理の計測結果を1つの実行レポートにまとめる
+        os.environ.setdefault('BOJDATA_RUN_ID', datetime.now().strftime('%Y%m%dT%H%M%S'))
+        ends_at = time.monotonic() + deadline * 60
+        # 後段の処理を含む場合だけ、そのための時間を残して取得を打ち切る
+        reserve = PUBLISH_RESERVE if any('fetch' not in SOURCES[source] for source in sources) else 0
+
+    results = {}
+    for source in sources:
+        for action in ('fetch', 'process'):
+            if action not in SOURCES[source]:
+                continue
+            if deadline is None:
+                results[(source, action)] = 'ok' if run_step(source, action) else 'failed'
+                continue
+            remaining = ends_at - time.monotonic()
+            if 'fetch' in SOURCES[source]:
+                remaining -= reserve
+            budget = min(STAGE_BUDGETS.get((source, action), DEFAULT_STAGE_BUDGET), remaining)
+            if budget < MIN_STAGE_TIME:
+                print(f"\n=== {action} {source}: 期限までの時間が足りないため実行しません ===")
+                results[(source, action)] = 'skipped'
+            else:
+                results[(source, action)] = run_step_process(source, action, budget)
+
+    # 取得・加工が成功しなかったデータソースは、前回までのデータのまま（stale）として記録する
+    stale = []
+    for source in sources:
+        statuses = {action: status for (name, action), status in results.items() if name == source}
+        is_stale = any(status != 'ok' for status in statuses.values())
+        metrics.record_source(source, stale=is_stale, **statuses)
+        if is_stale:
+            stale.append(source)
+
+    failed = [f"{action} {source}({status})" for (source, action), status in results.items() if status != 'ok']
+    print(f"\n{len(results) - len(failed)}/{len(results)} 件の処理が成功しました")
+    if failed:
+        print(f"失敗・打ち切り: {', '.join(failed)}")
+        print(f"前回までのデータのままのデータソース: {', '.join(stale)}")
+    if args.allow_stale:
+        # 後段の処理（公開するファイルの作成）が成功していれば、古いままのデータソースがあっても成功とする
+        return 1 if any(status != 'ok' for (source, _), status in results.items()
+                        if 'fetch' not in SOURCES[source]) else 0
+    return 1 if failed else 0
+
+
+def count_lines(path):
+    """ファイルの行数を数える（CSVを読み込まずにヘッダーを除いた行数の目安を得る）"""
+    with open(path, 'rb') as f:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1024 * 1024), b''))
+
+
+def command_status(args):
+    """データファイルの更新日時・サイズ・行数と、直近の実行レポートの概要を表示する"""
+    if not os.path.isdir(data_dir):
+        print(f"データディレクトリがありません: {data_dir}")
+        return 1
+
+    print(f"データディレクトリ: {data_dir}")
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
+        rows = f"{max(count_lines(path) - 1, 0):>6}行" if name.endswith('.csv') else ' ' * 7
+        print(f"  {modified}  {stat.st_size:>10,} bytes  {rows}  {name}")
+
+    report_path = os.environ.get('BOJDATA_REPORT') or os.path.join(metrics.reports_dir, "run_report.json")
+    if os.path.exists(report_path):
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        print(f"\n直近の実行: {report.get('run_id')}（{report.get('started_at')} 〜 {report.get('finished_at')}）")
+        for stage, entry in sorted(report.get('stages', {}).items()):
+            print(f"  {entry.get('status', 'ok'):<6} {entry.get('wall_time', 0):8.2f}秒  {stage}")
+        stale = [source for source, entry in sorted(report.get('sources', {}).items()) if entry.get('stale')]
+        if stale:
+            print(f"  前回までのデータのまま: {', '.join(stale)}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='bojdata', description="経済指標データの取得・加工")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    source_names = ', '.join(list(SOURCES) + ['all'])
+    fetch_parser = subparsers.add_parser('fetch', help="データを取得する")
+    fetch_parser.add_argument('source', help=f"データソース（{source_names}）")
+    fetch_parser.add_argument('args', nargs='*', help="スクリプトに渡す引数（例: cpi の年月）")
+    fetch_parser.set_defaults(handler=command_fetch)
+
+    process_parser = subparsers.add_parser('process', help="取得したデータを加工する")
+    process_parser.add_argument('source', help=f"データソース（{source_names}）")
+    process_parser.add_argument('args', nargs='*', help="スクリプトに渡す引数")
+    process_parser.set_defaults(handler=command_process)
+
+    run_parser = subparsers.add_parser('run', help="取得と加工を続けて実行する")
+    run_parser.add_argument('source', nargs='?', default='all', help=f"データソース（{source_names}）")
+    run_parser.add_argument('--deadline', type=float, default=None,
+                            help="全体の期限（分）。各処理を上限付きで実行する（既定: 環境変数 BOJDATA_DEADLINE）")
+    run_parser.add_argument('--allow-stale', action='store_true',
+                            help="後段の処理が成功していれば、取得できなかったデータソースがあっても終了コードを0にする")
+    run_parser.set_defaults(handler=command_run)
+
+    status_parser = subparsers.add_parser('status', help="データファイルと直近の実行の状態を表示する")
+    status_parser.set_defaults(handler=command_status)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # 打ち切られた場合も SystemExit で終了し、実行レポートを書き出す
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    # --profile はどの位置に付けてもよく、実行する各スクリプトにも環境変数で引き継ぐ
+    profiling.consume_flag(argv)
+    args = parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+change_feed.py - 実行ごとに更新された系列を追記する変更履歴（差分同期用）
+
+ダッシュボードなどの利用側が毎週すべてのCSVを取得し直さなくてよいように、前回の実行から
+新しい観測値が追加された系列・値が改定された系列を、期間と値ごとに data/feed/changes.ndjson に追記する。
+
+    data/feed/changes.ndjson  変更履歴（1行1レコード、追記のみ）
+    data/feed/snapshot.json   前回の実行時点の全系列の値（次回の比較に使う）
+
+レコードの形式:
+    {"seq": 連番, "run_id": 実行ID, "recorded_at": 日時, "series": 系列名, "freq": 頻度,
+     "added": [[期間, 値], ...], "revised": [[期間, 前の値, 新しい値], ...], "removed": [期間, ...]}
+
+利用側は最後に受け取った seq をカーソルとして保持し、それより大きい seq のレコードだけを適用する。
+seq は実行をまたいで単調に増え、既存の行は書き換えないため、ファイルのバイト位置もカーソルとして使える
+（data_server.py の /feed?since=<seq> や Range リクエスト）。
+
+比較はダッシュボードのタイルと同じ桁数（publish_tiles.DECIMALS）で丸めた値で行う。
+
+使い方:
+    python scripts/change_feed.py record
+    python scripts/change_feed.py since <seq>
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import metrics
+import profiling
+import publish_tiles
+import series_store
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+feed_dir = os.path.join(project_root, "data", "feed")
+
+
+def feed_path():
+    return os.path.join(feed_dir, "changes.ndjson")
+
+
+def snapshot_path():
+    return os.path.join(feed_dir, "snapshot.json")
+
+
+def _load_snapshot():
+    """前回の値を {系列名: (頻度, {期間の序数: 値})} で返す"""
+    if not os.path.exists(snapshot_path()):
+        return None
+    with open(snapshot_path(), 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    loaded = {}
+    for name, entry in snapshot.get('series', {}).items():
+        start = entry['start']
+        values = {start + i: value for i, value in enumerate(entry['values']) if value is not None}
+        loaded[name] = (entry['freq'], values)
+    return loaded
+
+
+def _snapshot_entry(freq, ordinals, values):
+    """系列を start からの連続した値の配列にする（欠損はnull）"""
+    if not len(ordinals):
+        return {'freq': freq, 'start': 0, 'values': []}
+    start = int(ordinals.min())
+    dense = [None] * (int(ordinals.max()) - start + 1)
+    for ordinal, value in zip(ordinals, values):
+        dense[int(ordinal) - start] = float(value)
+    return {'freq': freq, 'start': start, 'values': dense}
+
+
+def diff_series(freq, old, ordinals, values):
+    """
+    前回の値と今回の値を比べる
+
+    Args:
+        freq: 頻度
+        old: 前回の値 {期間の序数: 値}
+        ordinals, values: 今回の系列（丸め済み）
+
+    Returns:
+        dict: added・revised・removed（変更がなければ空のリスト）
+    """
+    current = {int(ordinal): float(value) for ordinal, value in zip(ordinals, values)}
+    label = lambda ordinal: series_store.period_label(ordinal, freq)
+    added = [[label(o), current[o]] for o in sorted(current) if o not in old]
+    revised = [[label(o), old[o], current[o]] for o in sorted(current) if o in old and old[o] != current[o]]
+    removed = [label(o) for o in sorted(old) if o not in current]
+    return {'added': added, 'revised': revised, 'removed': removed}
+
+
+def last_seq():
+    """変更履歴の最後のレコードの seq（ファイルの末尾だけを読む）"""
+    path = feed_path()
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        block = min(size, 64 * 1024)
+        while True:
+            f.seek(size - block)
+            lines = f.read(block).rstrip(b'\n').split(b'\n')
+            if len(lines) > 1 or block == size:
+                return json.loads(lines[-1])['seq']
+            block = min(size, block * 2)
+
+
+@metrics.timed()
+def record_changes(data_root=None):
+    """
+    全系列を前回の実行時点と比べ、変更があった系列のレコードを追記する
+
+    初回（snapshot.json がない場合）は比較の基準を保存するだけでレコードは追記しない。
+
+    Returns:
+        list: 追記したレコード
+    """
+    import numpy as np
+
+    previous = _load_snapshot()
+    collected = publish_tiles.collect_series(data_root)
+    run_id = os.environ.get('BOJDATA_RUN_ID') or datetime.now().strftime('%Y%m%dT%H%M%S')
+    recorded_at = datetime.now().isoformat(timespec='seconds')
+
+    records = []
+    snapshot = {}
+    seq = last_seq()
+    for name, (freq, ordinals, values) in sorted(collected.items()):
+        values = np.round(values, publish_tiles.DECIMALS)
+        snapshot[name] = _snapshot_entry(freq, ordinals, values)
+        if previous is None:
+            continue
+        old_freq, old = previous.get(name, (freq, {}))
+        if old_freq != freq:
+            old = {}
+        changes = diff_series(freq, old, ordinals, values)
+        if not any(changes.values()):
+            continue
+        seq += 1
+        records.append({'seq': seq, 'run_id': run_id, 'recorded_at': recorded_at,
+                        'series': name, 'freq': freq, **changes})
+
+    # 系列そのものがなくなった場合
+    for name in sorted(set(previous or {}) - set(snapshot)):
+        old_freq, old = previous[name]
+        seq += 1
+        records.append({'seq': seq, 'run_id': run_id, 'recorded_at': recorded_at, 'series': name, 'freq': old_freq,
+                        'added': [], 'revised': [], 'removed': [series_store.period_label(o, old_freq) for o in sorted(old)]})
+
+    os.makedirs(feed_dir, exist_ok=True)
+    if records:
+        with open(feed_path(), 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        metrics.record_output(feed_path(), rows=len(records))
+
+    tmp_path = snapshot_path() + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'series': snapshot}, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, snapshot_path())
+
+    if previous is None:
+        print(f"比較の基準を保存しました（{len(snapshot)}系列）: {snapshot_path()}")
+    else:
+        summary = ', '.join(f"{r['series']}(+{len(r['added'])}/~{len(r['revised'])}/-{len(r['removed'])})" for r in records)
+        print(f"変更があった系列: {len(records)}件{'（' + summary + '）' if records else ''}")
+    return records
+
+
+def read_since(cursor, path=None):
+    """カーソル（seq）より後のレコードを返す"""
+    path = path or feed_path()
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record['seq'] > cursor:
+                    records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="更新された系列の変更履歴を記録・表示する")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('record', help="前回の実行からの変更を追記する")
+    since_parser = subparsers.add_parser('since', help="カーソルより後のレコードを表示する")
+    since_parser.add_argument('cursor', type=int, nargs='?', default=0, help="最後に受け取った seq")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_changes()
+        return True
+    for record in read_since(args.cursor):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return True
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+circuit_breaker.py - 取得元のホストごとの遮断（サーキットブレーカー）
+
+e-Statや日本銀行のサイトが停止していると、各スクリプトがそれぞれ再試行を繰り返して時間を使う。
+ここではホストごとに連続した失敗（接続エラー・タイムアウト・5xx）を数え、FAILURE_THRESHOLD 回続いたら
+そのホストを一定時間「遮断」し、以降のリクエストは送らずにすぐ失敗させる（CircuitOpenError）。
+状態は reports/circuit_breaker.json に保存し、実行をまたいで引き継ぐ。
+
+遮断の時間が過ぎたら、最初のリクエストの前にホストのトップページへのHEADリクエストを1回だけ送って
+回復したかを確かめる。成功すれば遮断を解除し、失敗すれば遮断の時間を倍にして遮断を続ける。
+
+遮断中のホストから取得するデータソースは前回までのファイル（書き込みはすべてアトミック）をそのまま使い、
+実行レポートの sources に stale として、遮断したホストと最後に成功した日時を記録する。
+
+requests.Session.send を置き換えるため、requests.get なども含めてすべてのリクエストが対象になる。
+install() は、bojdata.py が取得を始める時点、各get_*スクリプトを単体で実行した時点、
+http_utils の probe_candidates() / download_to_path() の最初の呼び出しで行う（何度呼んでもよい）。
+環境変数 BOJDATA_CIRCUIT_BREAKER=0 で無効にできる。
+
+使い方:
+    python scripts/circuit_breaker.py status         # ホストごとの状態を表示する
+    python scripts/circuit_breaker.py reset [ホスト]  # 遮断を解除する
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import metrics
+
+# プロジェクトのルートディレクトリと状態の保存先
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+state_path = os.path.join(project_root, "reports", "circuit_breaker.json")
+
+# この回数続けて失敗したらホストを遮断する
+FAILURE_THRESHOLD = 3
+
+# 遮断する時間（秒）。回復の確認に失敗するたびに倍にする
+OPEN_SECONDS = 30 * 60
+MAX_OPEN_SECONDS = 12 * 60 * 60
+
+# 回復を確認するリクエストのタイムアウト（接続, 読み込み）
+PROBE_TIMEOUT = (5, 10)
+
+_lock = threading.RLock()
+_state = None
+_probing = set()
+_recorded_success = set()
+_installed = False
+
+# install() で requests の ConnectionError のサブクラスとして作る
+CircuitOpenError = None
+
+
+def enabled():
+    return os.environ.get('BOJDATA_CIRCUIT_BREAKER', '1') not in ('0', 'false', '')
+
+
+def host_of(url):
+    """URLのホスト名（リプレイサーバー経由の場合は本来のホスト名）"""
+    base_url = os.environ.get('BOJDATA_BASE_URL')
+    if base_url and url.startswith(base_url):
+        return url[len(base_url):].lstrip('/').split('/', 1)[0]
+    return urlsplit(url).netloc
+
+
+def _probe_url(url):
+    """回復の確認に使うURL（リクエスト先のホストのトップページ）"""
+    base_url = os.environ.get('BOJDATA_BASE_URL')
+    if base_url and url.startswith(base_url):
+        return f"{base_url.rstrip('/')}/{host_of(url)}/"
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+def load_state():
+    """ホスト -> {'failures', 'open_until', 'open_seconds', 'last_success', 'last_failure', 'last_error'}"""
+    global _state
+    with _lock:
+        if _state is None:
+            _state = {}
+            if os.path.exists(state_path):
+                try:
+                    with open(state_path, 'r', encoding='utf-8') as f:
+                        _state = json.load(f)
+                except (OSError, ValueError):
+                    _state = {}
+        return _state
+
+
+def _save_state():
+    with _lock:
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        tmp_path = f"{state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_state, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp_path, state_path)
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def is_open(host):
+    """ホストが遮断中かどうか（遮断の時間が過ぎていれば False）"""
+    entry = load_state().get(host, {})
+    return entry.get('open_until', 0) > time.time()
+
+
+def record_success(host):
+    with _lock:
+        entry = load_state().setdefault(host, {})
+        was_open = 'open_until' in entry
+        changed = was_open or entry.get('failures', 0) > 0
+        entry.update(failures=0, last_success=_now())
+        entry.pop('open_until', None)
+        entry.pop('open_seconds', None)
+        # 成功のたびに書き込まないよう、状態が変わった場合と、このプロセスでのホストごとの最初の成功のみ保存する
+        if changed or host not in _recorded_success:
+            _recorded_success.add(host)
+            _save_state()
+    if was_open:
+        print(f"{host} は回復しました。遮断を解除します")
+
+
+def record_failure(host, error, probe=False):
+    """失敗を記録し、しきい値に達したか回復の確認に失敗した場合は遮断する"""
+    with _lock:
+        entry = load_state().setdefault(host, {})
+        entry['failures'] = entry.get('failures', 0) + 1
+        entry.update(last_failure=_now(), last_error=str(error)[:200])
+        # 並行したリクエストの失敗で遮断の時間を延ばさないよう、遮断中でない場合のみ遮断する
+        if probe or (entry['failures'] >= FAILURE_THRESHOLD and not is_open(host)):
+            seconds = min(entry.get('open_seconds', OPEN_SECONDS // 2) * 2, MAX_OPEN_SECONDS)
+            entry.update(open_seconds=seconds, open_until=time.time() + seconds)
+            print(f"{host} への接続に続けて失敗したため、{seconds // 60}分間遮断します")
+        _save_state()
+
+
+def _mark_stale(host):
+    """遮断中のホストを使うデータソースを、前回までのデータのまま（stale）として実行レポートに記録する"""
+    source = os.environ.get('BOJDATA_SOURCE') or os.path.splitext(os.path.basename(sys.argv[0] or ''))[0]
+    entry = load_state().get(host, {})
+    metrics.record_source(source, stale=True, circuit_open=host, last_success=entry.get('last_success'))
+
+
+def _probe(session, send, url, kwargs):
+    """遮断の時間が過ぎたホストに、回復を確かめるHEADリクエストを1回だけ送る（成功した場合True）"""
+    import requests
+
+    host = host_of(url)
+    request = requests.Request('HEAD', _probe_url(url), headers={'User-Agent': session.headers.get('User-Agent', '')})
+    print(f"{host} の回復を確認しています...")
+    try:
+        response = send(session, session.prepare_request(request), timeout=PROBE_TIMEOUT,
+                        allow_redirects=False, proxies=kwargs.get('proxies'), verify=kwargs.get('verify', True))
+        response.close()
+        if response.status_code >= 500:
+            raise requests.exceptions.HTTPError(f"ステータスコード {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        record_failure(host, e, probe=True)
+        return False
+    record_success(host)
+    return True
+
+
+def install():
+    """requests.Session.send を置き換えて、ホストごとの遮断を有効にする"""
+    global _installed, CircuitOpenError
+    if _installed or not enabled():
+        return
+    try:
+        import requests
+    except ImportError:
+        return
+    _installed = True
+
+    class CircuitOpenError(requests.exceptions.ConnectionError):
+        """遮断中のホストへのリクエスト（再試行しない）"""
+        circuit_open = True
+
+    original_send = requests.Session.send
+
+    def send(self, request, **kwargs):
+        host = host_of(request.url)
+        entry = load_state().get(host, {})
+        if 'open_until' in entry:
+            with _lock:
+                # 遮断中、または他のスレッドが回復を確認している間はリクエストを送らない
+                waiting = is_open(host) or host in _probing
+                if not waiting:
+                    _probing.add(host)
+            if waiting:
+                _mark_stale(host)
+                raise CircuitOpenError(f"{host} は遮断中のためリクエストを送りません（前回の成功: {entry.get('last_success')}）")
+            try:
+                recovered = _probe(self, original_send, request.url, kwargs)
+            finally:
+                with _lock:
+                    _probing.discard(host)
+            if not recovered:
+                _mark_stale(host)
+                raise CircuitOpenError(f"{host} はまだ回復していません")
+
+        try:
+            response = original_send(self, request, **kwargs)
+        except requests.exceptions.RequestException as e:
+            record_failure(host, e)
+            raise
+        if response.status_code >= 500:
+            record_failure(host, f"ステータスコード {response.status_code}")
+        else:
+            record_success(host)
+        return response
+
+    requests.Session.send = send
+
+
+def main():
+    parser = argparse.ArgumentParser(description="取得元のホストごとの遮断の状態を表示・解除する")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="ホストごとの状態を表示する")
+    reset_parser = subparsers.add_parser('reset', help="遮断を解除する")
+    reset_parser.add_argument('host', nargs='?', default=None, help="ホスト（省略時はすべて）")
+    args = parser.parse_args()
+
+    state = load_state()
+    if args.command == 'status':
+        for host, entry in sorted(state.items()):
+            if is_open(host):
+                until = datetime.fromtimestamp(entry['open_until']).strftime('%Y-%m-%d %H:%M')
+                status = f"遮断中（{until} まで）"
+            elif 'open_until' in entry:
+                status = "回復の確認待ち"
+            else:
+                status = f"正常（連続失敗 {entry.get('failures', 0)}回）"
+            print(f"  {host:<32} {status}  前回の成功: {entry.get('last_success') or '-'}")
+        return True
+    for host in [args.host] if args.host else list(state):
+        if host in state:
+            state[host].update(failures=0)
+            state[host].pop('open_until', None)
+            state[host].pop('open_seconds', None)
+            print(f"{host} の遮断を解除しました")
+    _save_state()
+    return True
+
+
+if __name__ == "__main__":
+    main()
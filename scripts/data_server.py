@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+data_server.py - 加工済みのデータと系列を配信するローカルHTTPサーバー
+
+汎用の静的ホスティングの代わりに、外部のサービスなしで data/ 以下の出力と系列の問い合わせを配信する。
+
+    GET /data/<パス>              data/ 以下のファイル（CSV・JSONタイルなど）
+    GET /series                  系列の一覧
+    GET /feed?since=<seq>        変更履歴のうちカーソルより後のレコード（NDJSON、change_feed.py）
+    GET /series/<系列名>?freq=Q&start=2020Q1&end=2024Q4
+                                 系列の値（JSON、freq を指定すると panel.py と同じ規則で頻度を変換）
+
+- ETag は強いETagで、タイルは data/tiles/index.json、元のCSVは data/panel/manifest.json のSHA-256を使う
+  （一覧にないファイルは内容のハッシュを更新日時・サイズごとに覚えておく）。If-None-Match が一致すれば304を返す。
+- Accept-Encoding が br・gzip を含み、圧縮済みの .br・.gz があればそれをそのまま返す（その場で圧縮しない）。
+- 圧縮していない応答は Range（bytes=開始-終了、bytes=-末尾のバイト数）に対応し、206を返す。
+- よく使われる系列は読み込んだ結果をプロセス内のLRUに保持する。
+
+使い方:
+    python scripts/data_server.py [--port 8767] [--cache-size 64]
+    curl -H 'Accept-Encoding: br, gzip' http://127.0.0.1:8767/data/tiles/cpi_yoy.json
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import change_feed
+import panel
+import series_store
+
+# プロジェクトのルートディレクトリとデータディレクトリの設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+
+# 圧縮済みファイルの拡張子（優先する順）
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# 拡張子ごとの Content-Type（mimetypes に任せると環境によって異なるもの）
+CONTENT_TYPES = {
+    '.csv': 'text/csv; charset=utf-8',
+    '.json': 'application/json',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class LRUCache:
+    """スレッドセーフなLRUキャッシュ"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+
+class ETags:
+    """
+    ファイルの強いETag
+
+    data/tiles/index.json と data/panel/manifest.json に記録されたSHA-256を使い、
+    一覧を読み直すのは一覧のファイルが更新された場合のみ。一覧にないファイルは
+    (更新日時, サイズ) が変わらない間は前回計算したハッシュを使う。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.manifests = {}
+        self.computed = {}
+
+    def _manifest_hashes(self, manifest_path, extract):
+        try:
+            stat = os.stat(manifest_path)
+        except FileNotFoundError:
+            return {}
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.manifests.get(manifest_path)
+        if cached is None or cached[0] != key:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                hashes = extract(json.load(f))
+            cached = (key, {relpath: (digest, stat.st_mtime_ns) for relpath, digest in hashes.items()})
+            self.manifests[manifest_path] = cached
+        return cached[1]
+
+    def known_hashes(self):
+        """data/ からの相対パス -> (SHA-256, 記録した一覧の更新日時)"""
+        def tiles(index):
+            hashes = {}
+            for entry in index.get('tiles', {}).values():
+                for tile in [entry] + list(entry.get('levels', {}).values()):
+                    hashes[f"tiles/{tile['path']}"] = tile['sha256']
+            return hashes
+
+        def sources(manifest):
+            return {filename: digest for filename, digest in manifest.get('sources', {}).items() if digest}
+
+        hashes = {}
+        hashes.update(self._manifest_hashes(os.path.join(self.root, "tiles", "index.json"), tiles))
+        hashes.update(self._manifest_hashes(os.path.join(self.root, "panel", "manifest.json"), sources))
+        return hashes
+
+    def file_hash(self, relpath, stat):
+        """
+        ファイルのSHA-256（一覧に記録されたハッシュは、ファイルが一覧より新しくなければ使う）
+        """
+        with self.lock:
+            known = self.known_hashes().get(relpath)
+            if known and stat.st_mtime_ns <= known[1]:
+                return known[0]
+
+            key = (stat.st_mtime_ns, stat.st_size)
+            cached = self.computed.get(relpath)
+            if cached and cached[0] == key:
+                return cached[1]
+
+        hasher = hashlib.sha256()
+        with open(os.path.join(self.root, relpath), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self.lock:
+            self.computed[relpath] = (key, digest)
+        return digest
+
+
+def parse_range(range_header, size):
+    """
+    Rangeヘッダー（単一の範囲のみ）を解釈する
+
+    Returns:
+        tuple or None: (開始, 終了) を返す。範囲外なら (None, None)、解釈できなければNone（全体を返す）
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, _, last = range_header[len('bytes='):].strip().partition('-')
+    if first.isdigit():
+        start = int(first)
+        end = min(int(last), size - 1) if last.isdigit() else size - 1
+        if last.isdigit() and int(last) < start:
+            return None
+    elif last.isdigit() and int(last) > 0:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size:
+        return None, None
+    return start, end
+
+
+class DataHandler(BaseHTTPRequestHandler):
+    """data/ 以下のファイルと系列の問い合わせに応答するハンドラー"""
+
+    protocol_version = 'HTTP/1.1'
+
+    # build_server() で設定する
+    options = None
+    etags = None
+    series_cache = None
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        if path.startswith('/data/'):
+            self.serve_file(path[len('/data/'):], send_body)
+        elif path.rstrip('/') == '/series':
+            payload = {'series': {name: spec['freq'] for name, spec in series_store.SERIES.items()}}
+            body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            self.send_body(200, body, 'application/json', '"' + hashlib.sha256(body).hexdigest() + '"', send_body)
+        elif path.startswith('/series/'):
+            self.serve_series(path[len('/series/'):], dict(parse_qsl(parts.query)), send_body)
+        elif path.rstrip('/') == '/feed':
+            self.serve_feed(dict(parse_qsl(parts.query)), send_body)
+        else:
+            self.send_simple(404, b'not found', send_body)
+
+    def not_modified(self, etag):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', self.options.cache_control)
+            self.end_headers()
+            return True
+        return False
+
+    def serve_file(self, relpath, send_body):
+        root = os.path.realpath(self.options.data_dir)
+        full_path = os.path.realpath(os.path.join(root, relpath))
+        # data/ の外のファイルと、キャッシュなどのドットファイルは配信しない
+        if not full_path.startswith(root + os.sep) or any(part.startswith('.') for part in relpath.split('/')):
+            self.send_simple(404, b'not found', send_body)
+            return
+        if not os.path.isfile(full_path):
+            self.send_simple(404, b'not found', send_body)
+            return
+        relpath = os.path.relpath(full_path, root).replace(os.sep, '/')
+
+        # 圧縮済みのファイルがあり、クライアントが受け付けるならそれを返す
+        accepted = {token.split(';')[0].strip() for token in self.headers.get('Accept-Encoding', '').split(',')}
+        encoding, suffix = None, ''
+        for name, candidate in ENCODINGS:
+            if name in accepted and os.path.isfile(full_path + candidate):
+                encoding, suffix = name, candidate
+                break
+        has_variants = any(os.path.isfile(full_path + candidate) for _, candidate in ENCODINGS)
+
+        stat = os.stat(full_path + suffix)
+        digest = self.etags.file_hash(relpath + suffix, stat)
+        # 表現ごとに異なるETagにする（圧縮の有無でバイト列が異なるため）
+        etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+        if self.not_modified(etag):
+            return
+
+        content_type = CONTENT_TYPES.get(os.path.splitext(full_path)[1]) or \
+            mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        size = stat.st_size
+        byte_range = None
+        if encoding is None and self.headers.get('If-Range') in (None, etag):
+            byte_range = parse_range(self.headers.get('Range'), size)
+        if byte_range == (None, None):
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end = byte_range if byte_range else (0, size - 1)
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', self.options.cache_control)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        else:
+            self.send_header('Accept-Ranges', 'bytes')
+        if has_variants:
+            self.send_header('Vary', 'Accept-Encoding')
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if not send_body:
+            return
+
+        with open(full_path + suffix, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def load_series(self, name, freq):
+        """系列を読み込む（元のファイルの更新日時をキーにLRUに保持する）"""
+        spec = series_store.SERIES[name]
+        path = os.path.join(self.options.series_root or series_store.data_dir, spec['file'])
+        key = (name, freq, os.stat(path).st_mtime_ns)
+        cached = self.series_cache.get(key)
+        if cached is not None:
+            return cached
+
+        ordinals, values = series_store.load_series(name, self.options.series_root)
+        ordinals, values = panel.convert(ordinals, values, spec['freq'], freq, series_store.series_rules(name))
+        labels = [series_store.period_label(ordinal, freq) for ordinal in ordinals]
+        loaded = (ordinals, labels, [round(float(v), 6) for v in values])
+        self.series_cache.put(key, loaded)
+        return loaded
+
+    def serve_series(self, name, query, send_body):
+        if name not in series_store.SERIES:
+            self.send_simple(404, f"unknown series: {name}".encode('utf-8'), send_body)
+            return
+        freq = query.get('freq', series_store.SERIES[name]['freq'])
+        if freq not in panel.OUTPUTS:
+            self.send_simple(400, f"unknown freq: {freq}".encode('utf-8'), send_body)
+            return
+        try:
+            ordinals, labels, values = self.load_series(name, freq)
+        except FileNotFoundError:
+            self.send_simple(404, f"no data: {name}".encode('utf-8'), send_body)
+            return
+
+        # start・end は表示用の期間の文字列（YYYY/MM, YYYYQn, YYYY）で指定する
+        lo, hi = 0, len(labels)
+        if 'start' in query:
+            lo = next((i for i, label in enumerate(labels) if label >= query['start']), len(labels))
+        if 'end' in query:
+            hi = next((i for i, label in enumerate(labels) if label > query['end']), len(labels))
+        payload = {'name': name, 'freq': freq, 'periods': labels[lo:hi], 'values': values[lo:hi]}
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.send_body(200, body, 'application/json', '"' + hashlib.sha256(body).hexdigest() + '"', send_body)
+
+    def serve_feed(self, query, send_body):
+        since = query.get('since', '0')
+        if not since.isdigit():
+            self.send_simple(400, f"invalid cursor: {since}".encode('utf-8'), send_body)
+            return
+        records = change_feed.read_since(int(since), os.path.join(self.options.data_dir, "feed", "changes.ndjson"))
+        body = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in records)
+        body = body.encode('utf-8')
+        self.send_body(200, body, 'application/x-ndjson', '"' + hashlib.sha256(body).hexdigest() + '"', send_body)
+
+    def send_body(self, status, body, content_type, etag, send_body):
+        if self.not_modified(etag):
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', self.options.cache_control)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def send_simple(self, status, body, send_body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+def build_server(options):
+    """設定済みのサーバーを作成する（ポート0なら空いているポートを使う）"""
+    handler = type('ConfiguredDataHandler', (DataHandler,), {
+        'options': options,
+        'etags': ETags(options.data_dir),
+        'series_cache': LRUCache(options.cache_size),
+    })
+    return ThreadingHTTPServer((options.host, options.port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="加工済みのデータと系列を配信するローカルHTTPサーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--data-dir', default=data_dir, help="配信するデータディレクトリ")
+    parser.add_argument('--series-root', default=None, help="系列を読み込むディレクトリ（省略時は data/）")
+    parser.add_argument('--cache-size', type=int, default=64, help="プロセス内に保持する系列の数")
+    parser.add_argument('--cache-control', default='public, max-age=0, must-revalidate',
+                        help="応答の Cache-Control ヘッダー")
+    parser.add_argument('--verbose', action='store_true', help="アクセスログを表示する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    server = build_server(options)
+    print(f"データサーバーを起動しました: http://{options.host}:{server.server_port}/data/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+derived.py - 保存済みの系列から派生指標（前月比・前年比・年率換算の前期比・移動平均・スプレッド）を計算するスクリプト
+
+派生指標は DERIVED に宣言する。頻度ごとに全系列を共通の期間にそろえた行列にし、
+同じ演算・同じパラメーターの指標はまとめて1回のNumPyの配列演算で計算する。
+
+前回の入力と結果を data/derived/.cache_<頻度>.npz に保存し、次回は入力が変わった期間
+（新しく追加された観測値など）から各演算が参照する期間だけさかのぼって再計算する。
+
+出力:
+    data/derived/derived_monthly.csv    月次（年月: YYYY/MM）
+    data/derived/derived_quarterly.csv  四半期（期間: YYYYQn）
+    data/derived/derived_annual.csv     年次（年: YYYY）
+
+使い方:
+    python scripts/derived.py [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import metrics
+import output_writer
+import profiling
+import series_store
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+derived_dir = os.path.join(project_root, "data", "derived")
+
+# 派生指標の定義
+# op: pct_change（変化率%）, annualized（年率換算の変化率%）, rolling_mean（移動平均）, spread（差）
+# sources: 元の系列（spread は [被減数, 減数]）
+DERIVED = {
+    # 月次
+    'cgpi_index_mom': {'op': 'pct_change', 'sources': ['cgpi_index'], 'periods': 1},
+    'cgpi_index_yoy': {'op': 'pct_change', 'sources': ['cgpi_index'], 'periods': 12},
+    'cpi_index_mom': {'op': 'pct_change', 'sources': ['cpi_index'], 'periods': 1},
+    'cpi_index_yoy': {'op': 'pct_change', 'sources': ['cpi_index'], 'periods': 12},
+    'ci_leading_yoy': {'op': 'pct_change', 'sources': ['ci_leading'], 'periods': 12},
+    'ci_coincident_yoy': {'op': 'pct_change', 'sources': ['ci_coincident'], 'periods': 12},
+    'ci_coincident_3m_avg': {'op': 'rolling_mean', 'sources': ['ci_coincident'], 'window': 3},
+    'cpi_yoy_3m_avg': {'op': 'rolling_mean', 'sources': ['cpi_yoy'], 'window': 3},
+    'call_rate_12m_avg': {'op': 'rolling_mean', 'sources': ['call_rate'], 'window': 12},
+    # 実質コールレート = 無担保コールレート（月平均）- CPI総合 前年同月比
+    'real_call_rate': {'op': 'spread', 'sources': ['call_rate', 'cpi_yoy']},
+    # 四半期
+    'us_gdp_qoq_saar': {'op': 'annualized', 'sources': ['us_gdp'], 'periods': 1},
+    'japan_gdp_qoq_saar': {'op': 'annualized', 'sources': ['japan_gdp'], 'periods': 1},
+    'us_gdp_yoy': {'op': 'pct_change', 'sources': ['us_gdp'], 'periods': 4},
+    'japan_gdp_yoy': {'op': 'pct_change', 'sources': ['japan_gdp'], 'periods': 4},
+    # 年次
+    'world_gdp_yoy': {'op': 'pct_change', 'sources': ['world_gdp'], 'periods': 1},
+    'payroll_index_yoy': {'op': 'pct_change', 'sources': ['payroll_index'], 'periods': 1},
+    'tokyo_office_yoy': {'op': 'pct_change', 'sources': ['tokyo_office'], 'periods': 1},
+}
+
+# 頻度ごとの出力ファイルと期間の列名
+OUTPUTS = {
+    'M': ("derived_monthly.csv", '年月'),
+    'Q': ("derived_quarterly.csv", '期間'),
+    'A': ("derived_annual.csv", '年'),
+}
+
+# 年率換算で使う1年あたりの期間数
+PERIODS_PER_YEAR = {'M': 12, 'Q': 4, 'A': 1}
+
+
+def definition_freq(spec):
+    return series_store.SERIES[spec['sources'][0]]['freq']
+
+
+def lookback(spec):
+    """その指標の値を計算するのに必要な過去の期間数"""
+    if spec['op'] in ('pct_change', 'annualized'):
+        return spec['periods']
+    if spec['op'] == 'rolling_mean':
+        return spec['window'] - 1
+    return 0
+
+
+def _lagged_ratio(x, k):
+    import numpy as np
+
+    out = np.full(x.shape, np.nan)
+    if len(x) > k:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[k:] = x[k:] / x[:-k]
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def pct_change(x, k):
+    """k期前からの変化率（%）を全列まとめて計算する"""
+    return (_lagged_ratio(x, k) - 1) * 100
+
+
+def annualized(x, k, per_year):
+    """k期前からの変化率を年率換算する（%）"""
+    import numpy as np
+
+    with np.errstate(invalid='ignore'):
+        return (np.power(_lagged_ratio(x, k), per_year / k) - 1) * 100
+
+
+def rolling_mean(x, window):
+    """
+    後方移動平均（窓内に欠損がある期間はNaN）を全列まとめて計算する
+
+    累積和の差分は計算を始める期間によって丸め誤差が変わり、末尾だけ再計算した結果と
+    全期間を計算した結果が一致しなくなるため、窓ごとに平均する。
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        out[window - 1:] = sliding_window_view(x, window, axis=0).mean(axis=-1)
+    return out
+
+
+def compute(matrix, source_index, names, freq):
+    """
+    派生指標を計算する
+
+    Args:
+        matrix: 元の系列の行列（期間×系列）
+        source_index: 系列名 -> 行列の列番号
+        names: 計算する派生指標の名前（出力の列順）
+        freq: 頻度
+
+    Returns:
+        numpy.ndarray: 派生指標の行列（期間×指標）
+    """
+    import numpy as np
+
+    out = np.full((matrix.shape[0], len(names)), np.nan)
+
+    # 同じ演算・同じパラメーターの指標をまとめて計算する
+    groups = {}
+    for j, name in enumerate(names):
+        spec = DERIVED[name]
+        key = (spec['op'], spec.get('periods'), spec.get('window'))
+        groups.setdefault(key, []).append(j)
+
+    for (op, periods, window), columns in groups.items():
+        if op == 'spread':
+            left = matrix[:, [source_index[DERIVED[names[j]]['sources'][0]] for j in columns]]
+            right = matrix[:, [source_index[DERIVED[names[j]]['sources'][1]] for j in columns]]
+            out[:, columns] = left - right
+            continue
+
+        x = matrix[:, [source_index[DERIVED[names[j]]['sources'][0]] for j in columns]]
+        if op == 'pct_change':
+            out[:, columns] = pct_change(x, periods)
+        elif op == 'annualized':
+            out[:, columns] = annualized(x, periods, PERIODS_PER_YEAR[freq])
+        elif op == 'rolling_mean':
+            out[:, columns] = rolling_mean(x, window)
+        else:
+            raise ValueError(f"不明な演算です: {op}")
+    return out
+
+
+def _signature(names, sources):
+    """定義が変わったらキャッシュを使わないように、定義のハッシュを作る"""
+    payload = json.dumps({'derived': {name: DERIVED[name] for name in names}, 'sources': sources}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _first_changed_row(old_periods, old_matrix, periods, matrix):
+    """前回の入力と最初に異なる行（期間の先頭がずれた場合は0）を返す"""
+    import numpy as np
+
+    if len(old_periods) == 0 or len(periods) == 0 or old_periods[0] != periods[0]:
+        return 0
+    n = min(len(old_periods), len(periods))
+    old, new = old_matrix[:n], matrix[:n]
+    same = (old == new) | (np.isnan(old) & np.isnan(new))
+    differing = np.flatnonzero(~same.all(axis=1))
+    return int(differing[0]) if len(differing) else n
+
+
+def compute_incremental(freq, names, full=False, data_root=None):
+    """
+    頻度ごとに派生指標を計算する（前回から変わった期間とその影響範囲のみ再計算）
+
+    Returns:
+        tuple: (期間の序数の配列, 派生指標の行列, 再計算した行数)
+    """
+    import numpy as np
+
+    sources = sorted({source for name in names for source in DERIVED[name]['sources']})
+    source_index = {source: i for i, source in enumerate(sources)}
+    periods, matrix = series_store.load_aligned(sources, freq, data_root)
+    signature = _signature(names, sources)
+
+    cache_path = os.path.join(derived_dir, f".cache_{freq}.npz")
+    start_row = 0
+    cached = None
+    if not full and os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as npz:
+            if str(npz['signature']) == signature:
+                cached = {key: npz[key] for key in ('periods', 'inputs', 'outputs')}
+    if cached is not None:
+        start_row = _first_changed_row(cached['periods'], cached['inputs'], periods, matrix)
+        metrics.cache_hit('derived', hit=start_row > 0)
+
+    if cached is not None and start_row == len(periods) == len(cached['periods']):
+        outputs = cached['outputs']
+    else:
+        # 変わった行の値は、その行から各指標が参照する期間だけさかのぼった範囲から計算できる
+        window_start = max(0, start_row - max(lookback(DERIVED[name]) for name in names))
+        tail = compute(matrix[window_start:], source_index, names, freq)
+        outputs = np.full((len(periods), len(names)), np.nan)
+        if start_row:
+            outputs[:start_row] = cached['outputs'][:start_row]
+        outputs[start_row:] = tail[start_row - window_start:]
+
+    os.makedirs(derived_dir, exist_ok=True)
+    np.savez(cache_path, signature=np.array(signature), periods=periods, inputs=matrix, outputs=outputs)
+    return periods, outputs, len(periods) - start_row
+
+
+@metrics.timed()
+def build_derived(full=False, data_root=None):
+    """
+    全頻度の派生指標を計算してCSVに保存する
+
+    Returns:
+        list: 保存したファイルのパス
+    """
+    import pandas as pd
+
+    by_freq = {}
+    for name, spec in DERIVED.items():
+        by_freq.setdefault(definition_freq(spec), []).append(name)
+
+    os.makedirs(derived_dir, exist_ok=True)
+    output_files = []
+    for freq, names in by_freq.items():
+        periods, outputs, recomputed = compute_incremental(freq, names, full=full, data_root=data_root)
+        filename, period_column = OUTPUTS[freq]
+        output_csv = os.path.join(derived_dir, filename)
+
+        result_df = pd.DataFrame(outputs, columns=names).round(4)
+        result_df.insert(0, period_column, [series_store.period_label(p, freq) for p in periods])
+        # 先頭のすべて欠損の期間は出力しない
+        has_value = result_df[names].notna().any(axis=1).to_numpy()
+        if has_value.any():
+            result_df = result_df.iloc[has_value.argmax():]
+
+        output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
+        print(f"保存しました: {output_csv}（{len(result_df)}期間, 再計算 {recomputed}期間）")
+        output_files.append(output_csv)
+    return output_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済みの系列から派生指標を計算する")
+    parser.add_argument('--full', action='store_true', help="キャッシュを使わずにすべての期間を再計算する")
+    args = parser.parse_args()
+    return bool(build_derived(full=args.full))
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
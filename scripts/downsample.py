@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+downsample.py - チャート向けに長い系列の点の数を減らす（LTTB・最小/最大バケット）
+
+Largest-Triangle-Three-Buckets（LTTB）は、先頭と末尾の点を残し、間の点を同じ数ずつのバケットに分けて、
+各バケットから「前に選んだ点」と「次のバケットの平均」とで作る三角形の面積が最大の点を1つ選ぶ。
+山や谷が残るため、点を大きく減らしても折れ線の形が保たれる。
+
+最小/最大バケットは、各バケットの最小値と最大値の点を残す（スパイクを確実に残したい場合向け）。
+
+どちらも x（期間の序数）と y（値）の欠損を除いた配列を受け取り、残す点の位置（インデックス）を返す。
+
+使い方:
+    python scripts/downsample.py <系列名> [点の数] [--method lttb|minmax]
+"""
+
+import argparse
+
+
+def _bucket_edges(n_points, n_buckets):
+    """先頭と末尾を除いた点を n_buckets 個のバケットに分けたときの境界（長さ n_buckets+1）"""
+    import numpy as np
+
+    return np.floor(np.linspace(1, n_points - 1, n_buckets + 1)).astype(np.int64)
+
+
+def lttb(x, y, threshold):
+    """
+    LTTBで残す点のインデックスを返す
+
+    各バケットの候補点の面積はまとめて配列演算で求める（バケット間は前に選んだ点に依存するため順に処理する）。
+
+    Args:
+        x, y: 点の座標（x は昇順）
+        threshold: 残す点の数
+
+    Returns:
+        numpy.ndarray: 残す点のインデックス（昇順）
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = _bucket_edges(n, threshold - 2)
+    starts, ends = edges[:-1], edges[1:]
+
+    # 次のバケットの平均（最後のバケットの次は末尾の点）を先にまとめて求める
+    sum_x = np.add.reduceat(x[:n - 1], starts)
+    sum_y = np.add.reduceat(y[:n - 1], starts)
+    counts = ends - starts
+    next_x = np.append((sum_x / counts)[1:], x[-1])
+    next_y = np.append((sum_y / counts)[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        # 三角形の面積の2倍（比較にしか使わないので1/2は省く）
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, threshold):
+    """
+    最小/最大バケットで残す点のインデックスを返す（先頭と末尾の点も残す）
+
+    バケットごとの最小値・最大値の位置は、バケット番号と値で並べ替えてまとめて求める。
+
+    Args:
+        x, y: 点の座標（x は昇順）
+        threshold: 残す点の数の上限
+
+    Returns:
+        numpy.ndarray: 残す点のインデックス（昇順）
+    """
+    import numpy as np
+
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+
+    n_buckets = (threshold - 2) // 2
+    edges = _bucket_edges(n, n_buckets)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    inner = y[1:n - 1]
+
+    # バケット番号・値の順に並べると、各バケットの先頭が最小値、末尾が最大値になる
+    order = np.lexsort((inner, bucket))
+    bucket_sorted = bucket[order]
+    first = np.flatnonzero(np.r_[True, bucket_sorted[1:] != bucket_sorted[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+
+    picked = np.concatenate(([0], order[first] + 1, order[last] + 1, [n - 1]))
+    return np.unique(picked)
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(x, y, threshold, method='lttb'):
+    """
+    系列の点を減らす（欠損を除いてから点を選ぶ）
+
+    Returns:
+        tuple: (残した点の x, 残した点の y)
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    index = METHODS[method](x, y, threshold)
+    return x[index], y[index]
+
+
+def main():
+    import series_store
+
+    parser = argparse.ArgumentParser(description="系列の点を減らした結果を表示する")
+    parser.add_argument('series', choices=sorted(series_store.SERIES), help="系列名")
+    parser.add_argument('threshold', nargs='?', type=int, default=100, help="残す点の数")
+    parser.add_argument('--method', choices=sorted(METHODS), default='lttb', help="方法")
+    args = parser.parse_args()
+
+    ordinals, values = series_store.load_series(args.series)
+    x, y = downsample(ordinals, values, args.threshold, method=args.method)
+    freq = series_store.SERIES[args.series]['freq']
+    print(f"{args.series}: {len(ordinals)}点 -> {len(x)}点（{args.method}）")
+    for ordinal, value in zip(x, y):
+        print(f"  {series_store.period_label(ordinal, freq)}  {value}")
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+estat_api.py - e-Stat API（JSON）から必要な系列だけを取得してCSVとして保存するスクリプト
+
+get_cpi.py / get_payroll.py がHTML一覧をスクレイピングしてExcelブック全体を
+ダウンロードするのに対し、こちらは statsDataId・分類・時間軸を絞り込んで
+必要なセルだけをJSONで取得する。取得した列は series_store.SERIES に登録された系列として、
+その系列のファイル（process_cpi.py / process_payroll.py と同じ形式のCSV）に保存し、
+series_store で読み戻せることを確認する。
+
+使い方:
+    ESTAT_APP_ID=... python scripts/estat_api.py cpi
+    ESTAT_APP_ID=... ESTAT_PAYROLL_STATS_DATA_ID=... python scripts/estat_api.py payroll
+
+ESTAT_API_BASE_URL を指定すると接続先を差し替えられる（estat_stub_server.py など）。
+"""
+
+import os
+import re
+import sys
+import time
+
+import circuit_breaker
+import metrics
+import output_writer
+import profiling
+import series_store
+from http_utils import retry_delay, source_url
+from process_cpi import merge_cpi_data
+
+# e-Stat APIのベースURL（テスト・ベンチマーク時はスタブサーバーに差し替える）
+API_BASE_URL = os.environ.get('ESTAT_API_BASE_URL', 'https://api.e-stat.go.jp/rest/3.0/app/json')
+
+# 1リクエストあたりの最大取得件数（e-Statの上限は100,000件）
+PAGE_LIMIT = 10000
+
+# プロジェクトのルートディレクトリとデータディレクトリの設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+
+# 取得する系列の定義
+# filters: 全列共通の分類（分類ID -> 名称の部分一致）
+# columns: 出力列名 -> その列に固有の分類
+# store: 出力列名 -> 保存先の series_store の系列名
+ESTAT_SERIES = {
+    'cpi': {
+        'stats_data_id': os.environ.get('ESTAT_CPI_STATS_DATA_ID', '0003427113'),  # 2020年基準 中分類指数 全国 月次
+        'filters': {'cat01': '総合', 'area': '全国'},
+        'columns': {
+            '前年同月比': {'tab': '前年同月比'},
+            '指数': {'tab': '指数'},
+        },
+        'period': 'month',
+        'store': {'前年同月比': 'cpi_yoy', '指数': 'cpi_index'},
+    },
+    'payroll': {
+        'stats_data_id': os.environ.get('ESTAT_PAYROLL_STATS_DATA_ID'),
+        'filters': {'cat01': '調査産業計'},
+        'columns': {
+            '指数': {'tab': '指数'},
+            '前年比': {'tab': '前年比'},
+        },
+        'period': 'year',
+        'store': {'指数': 'payroll_index'},
+    },
+}
+
+
+def api_get(session, endpoint, params):
+    """APIを呼び出してJSONを返す（最大3回試行）"""
+    import requests
+    
+    url = source_url(f"{API_BASE_URL}/{endpoint}")
+    max_attempts = 3
+    for attempt in range(max_attempts):
+        try:
+            response = session.get(url, params=params, timeout=60)
+            response.raise_for_status()
+            return response.json(), len(response.content)
+        except requests.exceptions.RequestException as e:
+            wait_time = retry_delay(e, attempt, max_attempts)
+            if wait_time is not None:
+                print(f"接続エラー: {e} - {wait_time:.1f}秒後に再試行します（{attempt+1}/{max_attempts}）")
+                time.sleep(wait_time)
+            else:
+                raise
+
+
+def check_result(payload, root_key):
+    """RESULT.STATUSを確認してルート要素を返す（0: 正常, 1: 該当データなし）"""
+    root = payload[root_key]
+    status = int(root['RESULT']['STATUS'])
+    if status > 1:
+        raise RuntimeError(f"e-Stat APIエラー: {root['RESULT'].get('ERROR_MSG')}")
+    return root
+
+
+def as_list(value):
+    """要素が1件だけのときは配列でなく単体で返ってくるのでリストにそろえる"""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def get_meta_info(session, app_id, stats_data_id):
+    """
+    メタ情報を取得し、分類IDごとの {コード: 名称} を返す
+
+    Returns:
+        tuple: ({分類ID: {コード: 名称}}, 受信バイト数)
+    """
+    payload, size = api_get(session, 'getMetaInfo', {
+        'appId': app_id,
+        'statsDataId': stats_data_id,
+        'explanationGetFlg': 'N',
+    })
+    root = check_result(payload, 'GET_META_INFO')
+    classes = {}
+    for class_obj in as_list(root['METADATA_INF']['CLASS_INF']['CLASS_OBJ']):
+        classes[class_obj['@id']] = {c['@code']: c['@name'] for c in as_list(class_obj.get('CLASS'))}
+    return classes, size
+
+
+def find_code(classes, class_id, name):
+    """分類名の部分一致でコードを探す（完全一致を優先）"""
+    candidates = classes.get(class_id, {})
+    for code, code_name in candidates.items():
+        if code_name == name:
+            return code
+    for code, code_name in candidates.items():
+        if name in code_name:
+            return code
+    raise KeyError(f"分類 {class_id} に「{name}」が見つかりませんでした")
+
+
+def iter_stats_pages(session, app_id, stats_data_id, selectors, limit=PAGE_LIMIT):
+    """
+    統計データをページ単位で取得するジェネレーター
+
+    NEXT_KEYがある限り次のページを取得する。メモリ上に保持するのは常に1ページ分のみ。
+
+    Yields:
+        tuple: (そのページのVALUE要素のリスト, 受信バイト数)
+    """
+    params = {
+        'appId': app_id,
+        'statsDataId': stats_data_id,
+        'metaGetFlg': 'N',
+        'cntGetFlg': 'N',
+        'explanationGetFlg': 'N',
+        'annotationGetFlg': 'N',
+        'sectionHeaderFlg': 2,
+        'replaceSpChars': 2,
+        'limit': limit,
+    }
+    for class_id, code in selectors.items():
+        params[f"cd{class_id[0].upper()}{class_id[1:]}"] = code
+
+    start_position = 1
+    while True:
+        params['startPosition'] = start_position
+        payload, size = api_get(session, 'getStatsData', params)
+        root = check_result(payload, 'GET_STATS_DATA')
+        statistical_data = root.get('STATISTICAL_DATA', {})
+        values = as_list(statistical_data.get('DATA_INF', {}).get('VALUE'))
+        yield values, size
+
+        next_key = statistical_data.get('RESULT_INF', {}).get('NEXT_KEY')
+        if not next_key or not values:
+            break
+        start_position = int(next_key)
+
+
+def parse_period(time_name, period):
+    """時間軸の名称（例: 2024年1月, 2024年）を出力形式に変換する"""
+    if period == 'month':
+        match = re.search(r'(\d{4})年(\d{1,2})月', time_name)
+        if match:
+            return f"{match.group(1)}/{match.group(2).zfill(2)}"
+    else:
+        # 月次・四半期の時間軸は年次系列には含めない
+        match = re.search(r'(\d{4})年', time_name)
+        if match and '月' not in time_name and '期' not in time_name:
+            return int(match.group(1))
+    return None
+
+
+@metrics.timed()
+def fetch_series(name, app_id, session=None):
+    """
+    定義済みの系列を取得し、期間を行・出力列を列とするDataFrameを返す
+
+    Args:
+        name: ESTAT_SERIES のキー
+        app_id: e-Stat APIのアプリケーションID
+        session: 使い回すrequests.Session
+
+    Returns:
+        tuple: (DataFrame, 受信バイト数)
+    """
+    import pandas as pd
+    import requests
+    
+    spec = ESTAT_SERIES[name]
+    stats_data_id = spec['stats_data_id']
+    if not stats_data_id:
+        raise ValueError(f"{name}のstatsDataIdが設定されていません")
+    session = session or requests.Session()
+
+    classes, total_bytes = get_meta_info(session, app_id, stats_data_id)
+    time_names = classes.get('time', {})
+
+    # 共通の絞り込み条件をコードに変換
+    base_selectors = {class_id: find_code(classes, class_id, value) for class_id, value in spec['filters'].items()}
+
+    columns = {}
+    for column, column_filters in spec['columns'].items():
+        selectors = dict(base_selectors)
+        for class_id, value in column_filters.items():
+            selectors[class_id] = find_code(classes, class_id, value)
+        print(f"{column}を取得しています: {selectors}")
+
+        series = {}
+        for values, size in iter_stats_pages(session, app_id, stats_data_id, selectors):
+            total_bytes += size
+            for value in values:
+                period = parse_period(time_names.get(value['@time'], value['@time']), spec['period'])
+                raw = value.get('$')
+                if period is None or raw in (None, '', '-', '*', '…'):
+                    continue
+                try:
+                    series[period] = float(str(raw).replace(',', ''))
+                except ValueError:
+                    print(f"数値変換エラー: {raw} - 時間軸: {value['@time']}")
+        columns[column] = series
+
+    df = pd.DataFrame(columns).sort_index()
+    return df, total_bytes
+
+
+def save_cpi(df):
+    """process_cpi.py と同じ形式でCPIのCSVを保存する（統合したCSVが系列 cpi_yoy / cpi_index のファイル）"""
+    output_files = {}
+    for column, filename in [('前年同月比', "CPI_総合_前年同月比.csv"), ('指数', "CPI_総合_指数.csv")]:
+        output_csv = os.path.join(data_dir, filename)
+        result_df = df[[column]].dropna().rename_axis('年月').reset_index()
+        output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
+        print(f"保存しました: {output_csv} ({len(result_df)}件)")
+        output_files[column] = output_csv
+
+    output_merged_csv = series_store.series_path('cpi_yoy')
+    merge_cpi_data(output_files['前年同月比'], output_files['指数'], output_merged_csv)
+    return [output_files['前年同月比'], output_files['指数'], output_merged_csv]
+
+
+def save_payroll(df):
+    """process_payroll.py と同じ形式で年平均データのCSVを保存する（系列 payroll_index のファイル）"""
+    output_csv = series_store.series_path('payroll_index')
+    result_df = df.reindex(columns=['指数', '前年比']).rename_axis('年').reset_index()
+    output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
+    print(f"保存しました: {output_csv} ({len(result_df)}件)")
+    return [output_csv]
+
+
+def check_store(name, df):
+    """
+    保存した系列を series_store で読み戻し、取得した期間がすべて含まれているか確認する
+
+    Returns:
+        bool: すべての系列を読み戻せた場合True
+    """
+    ok = True
+    for column, series_name in ESTAT_SERIES[name]['store'].items():
+        ordinals, _ = series_store.load_series(series_name)
+        expected = int(df[column].notna().sum())
+        if len(ordinals) < expected:
+            print(f"系列 {series_name} を読み戻せませんでした（{len(ordinals)}/{expected}期間）")
+            ok = False
+        else:
+            print(f"系列 {series_name} に保存しました（{len(ordinals)}期間）")
+    return ok
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else 'cpi'
+    if name not in ESTAT_SERIES:
+        print(f"不明な系列です: {name}（{', '.join(ESTAT_SERIES)} から指定してください）")
+        sys.exit(1)
+
+    # 環境変数からアプリケーションIDを取得
+    app_id = os.environ.get('ESTAT_APP_ID')
+    if not app_id:
+        print("エラー: ESTAT_APP_IDが環境変数に設定されていません。")
+        sys.exit(1)
+
+    os.makedirs(data_dir, exist_ok=True)
+
+    start_time = time.time()
+    df, total_bytes = fetch_series(name, app_id)
+    print(f"取得完了: {len(df)}期間, 受信 {total_bytes / 1024:.1f} KB, {time.time() - start_time:.2f}秒")
+
+    if name == 'cpi':
+        save_cpi(df)
+    else:
+        save_payroll(df)
+    if not check_store(name, df):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+estat_stub_server.py - e-Stat API（JSON）のローカルスタブサーバー
+
+estat_api.py のテストやベンチマークで本番のe-Statにアクセスしないように、
+getMetaInfo / getStatsData を合成データで応答する。分類による絞り込み
+（cdTab, cdCat01, cdArea, cdTime など）と startPosition / limit によるページングに対応する。
+
+使い方:
+    python scripts/estat_stub_server.py --port 8765
+    ESTAT_APP_ID=stub ESTAT_API_BASE_URL=http://127.0.0.1:8765/rest/3.0/app/json \\
+        ESTAT_PAYROLL_STATS_DATA_ID=STUB_PAYROLL python scripts/estat_api.py payroll
+"""
+
+import argparse
+import json
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# スタブで提供する統計表
+# classes: 分類ID -> [(コード, 名称)]
+STUB_TABLES = {
+    '0003427113': {
+        'title': '2020年基準消費者物価指数 中分類指数 全国 月次（スタブ）',
+        'classes': {
+            'tab': [('1', '指数'), ('3', '前月比'), ('4', '前年同月比')],
+            'cat01': [('0001', '総合')] + [(f"{i:04d}", f"中分類{i}") for i in range(2, 93)],
+            'area': [('00000', '全国')],
+            'time': [(f"{y}00{m:02d}{m:02d}", f"{y}年{m}月") for y in range(1970, 2026) for m in range(1, 13)],
+        },
+    },
+    'STUB_PAYROLL': {
+        'title': '毎月勤労統計調査 長期時系列表（スタブ）',
+        'classes': {
+            'tab': [('1', '指数'), ('2', '前年比')],
+            'cat01': [('00', '調査産業計'), ('01', '製造業')],
+            'time': [(f"{y}000000", f"{y}年") for y in range(1970, 2026)],
+        },
+    },
+}
+
+
+def stub_value(table_id, codes):
+    """分類コードの組み合わせから決定的な値を生成する"""
+    seed = sum(ord(c) * (i + 1) for i, c in enumerate(table_id + ''.join(codes)))
+    return round(100 + 10 * math.sin(seed % 997), 1)
+
+
+def iter_cells(table_id, selected):
+    """絞り込み条件に一致するセルを (分類ID -> コード) の辞書として列挙する"""
+    classes = STUB_TABLES[table_id]['classes']
+    class_ids = list(classes)
+
+    def walk(i, cell):
+        if i == len(class_ids):
+            yield dict(cell)
+            return
+        class_id = class_ids[i]
+        for code, _ in classes[class_id]:
+            if class_id in selected and code not in selected[class_id]:
+                continue
+            cell[class_id] = code
+            yield from walk(i + 1, cell)
+
+    yield from walk(0, {})
+
+
+class EstatStubHandler(BaseHTTPRequestHandler):
+    """getMetaInfo / getStatsData に応答するハンドラー"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip('/').split('/')[-1]
+        table_id = query.get('statsDataId')
+
+        if table_id not in STUB_TABLES:
+            root = 'GET_META_INFO' if endpoint == 'getMetaInfo' else 'GET_STATS_DATA'
+            self.send_json({root: {'RESULT': {'STATUS': 100, 'ERROR_MSG': '統計表IDが不正です。'}}})
+        elif endpoint == 'getMetaInfo':
+            self.send_json(self.meta_info(table_id))
+        elif endpoint == 'getStatsData':
+            self.send_json(self.stats_data(table_id, query))
+        else:
+            self.send_error(404)
+
+    def meta_info(self, table_id):
+        table = STUB_TABLES[table_id]
+        class_objs = [
+            {'@id': class_id, '@name': class_id, 'CLASS': [{'@code': code, '@name': name} for code, name in codes]}
+            for class_id, codes in table['classes'].items()
+        ]
+        return {'GET_META_INFO': {
+            'RESULT': {'STATUS': 0, 'ERROR_MSG': '正常に終了しました。'},
+            'METADATA_INF': {
+                'TABLE_INF': {'@id': table_id, 'TITLE': table['title']},
+                'CLASS_INF': {'CLASS_OBJ': class_objs},
+            },
+        }}
+
+    def stats_data(self, table_id, query):
+        # cdCat01=0001,0002 のような絞り込み条件を分類IDごとに解釈する
+        selected = {}
+        for key, value in query.items():
+            if key.startswith('cd') and not key.endswith(('From', 'To')):
+                class_id = key[2].lower() + key[3:]
+                selected[class_id] = set(value.split(','))
+
+        start = int(query.get('startPosition', 1))
+        limit = int(query.get('limit', 100000))
+
+        values = []
+        total = 0
+        for cell in iter_cells(table_id, selected):
+            total += 1
+            if start <= total < start + limit:
+                value = {f"@{class_id}": code for class_id, code in cell.items()}
+                value['$'] = str(stub_value(table_id, list(cell.values())))
+                values.append(value)
+
+        result_inf = {'TOTAL_NUMBER': total, 'FROM_NUMBER': start, 'TO_NUMBER': start + len(values) - 1}
+        if start + limit <= total:
+            result_inf['NEXT_KEY'] = start + limit
+
+        return {'GET_STATS_DATA': {
+            'RESULT': {'STATUS': 0 if values else 1, 'ERROR_MSG': '正常に終了しました。'},
+            'STATISTICAL_DATA': {
+                'RESULT_INF': result_inf,
+                'DATA_INF': {'VALUE': values},
+            },
+        }}
+
+
+def serve(host='127.0.0.1', port=8765):
+    """スタブサーバーを起動する（Ctrl+Cで終了）"""
+    server = ThreadingHTTPServer((host, port), EstatStubHandler)
+    print(f"e-Stat APIスタブを起動しました: http://{host}:{server.server_port}/rest/3.0/app/json")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="e-Stat APIのローカルスタブサーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    serve(args.host, args.port)
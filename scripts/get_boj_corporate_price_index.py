@@ -1,9 +1,18 @@
-import pandas as pd
-import requests
 import os
 import time
 
+import circuit_breaker
+import metrics
+import output_writer
+import profiling
+import raw_archive
+from http_utils import DEFAULT_TIMEOUT, source_url
+
+@metrics.timed()
 def download_boj_price_index():
+    import pandas as pd
+    import requests
+    
     # スクリプトの場所を基準とした相対パスを作成
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(os.path.dirname(script_dir), 'data')
@@ -15,7 +24,7 @@ def download_boj_price_index():
     csv_filename = os.path.join(data_dir, "boj_corporate_price_index.csv")
     
     # URLを指定
-    url = "https://www.stat-search.boj.or.jp/ssi/mtshtml/pr01_m_1.html"
+    url = source_url("https://www.stat-search.boj.or.jp/ssi/mtshtml/pr01_m_1.html")
     
     # テーブルデータを直接取得
     try:
@@ -28,7 +37,7 @@ def download_boj_price_index():
             main_table = tables[0]
             
             # CSVとして保存
-            main_table.to_csv(csv_filename, encoding='utf-8')
+            output_writer.write_csv(main_table, csv_filename, index=True, encoding='utf-8')
             print(f"データを保存しました: {csv_filename}")
             
             return main_table
@@ -48,19 +57,20 @@ def download_boj_price_index():
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
         
-        response = session.get(url, headers=headers)
+        response = session.get(url, headers=headers, timeout=DEFAULT_TIMEOUT)
         
         # Step 2: CSVダウンロード用のURLを構築
         # 無担保コールレートと同様の構造と仮定
-        download_url = "https://www.stat-search.boj.or.jp/ssi/cgi-bin/famecgi2?cgi=$nme_a000&lstSelection=PR01&exec=download&csv=pr01_m_1"
+        download_url = source_url("https://www.stat-search.boj.or.jp/ssi/cgi-bin/famecgi2?cgi=$nme_a000&lstSelection=PR01&exec=download&csv=pr01_m_1")
         
         # Step 3: CSVをダウンロード
-        response = session.get(download_url, headers=headers)
+        response = session.get(download_url, headers=headers, timeout=DEFAULT_TIMEOUT)
         
         if response.status_code == 200:
             # バイナリとして保存
             with open(csv_filename, 'wb') as f:
                 f.write(response.content)
+            raw_archive.archive_download(csv_filename, url=response.url)
             print(f"CSVファイルを保存しました: {csv_filename}")
             
             # ファイルサイズを確認
@@ -74,6 +84,7 @@ def download_boj_price_index():
                 try:
                     df = pd.read_csv(csv_filename, encoding=encoding)
                     print(f"{encoding}エンコーディングで成功しました")
+                    metrics.record_output(csv_filename, rows=len(df))
                     return df
                 except Exception as e:
                     print(f"{encoding}エンコーディングでの読み込みに失敗: {e}")
@@ -91,7 +102,7 @@ def download_boj_price_index():
     
     return None
 
-if __name__ == "__main__":
+def main():
     df = download_boj_price_index()
     if df is not None:
         print("\n取得したデータ（先頭5行）:")
@@ -101,4 +112,12 @@ if __name__ == "__main__":
         print(f"\nデータの形状: {df.shape}")
         print(f"列名: {df.columns.tolist()}")
     else:
-        print("データが取得できませんでした。")
\ No newline at end of file
+        print("データが取得できませんでした。")
+    
+    return df is not None
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
+    main()
@@ -1,10 +1,19 @@
-import pandas as pd
-import requests
 from io import StringIO
 import time
 import os
 
+import circuit_breaker
+import metrics
+import output_writer
+import profiling
+import raw_archive
+from http_utils import DEFAULT_TIMEOUT, source_url
+
+@metrics.timed()
 def download_boj_data():
+    import pandas as pd
+    import requests
+    
     # スクリプトの場所を基準とした相対パスを作成
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(os.path.dirname(script_dir), 'data')
@@ -16,7 +25,7 @@ def download_boj_data():
     csv_filename = os.path.join(data_dir, "boj_unsecured_call_rate.csv")
     
     # URLを指定
-    url = "https://www.stat-search.boj.or.jp/ssi/mtshtml/fm02_m_1.html"
+    url = source_url("https://www.stat-search.boj.or.jp/ssi/mtshtml/fm02_m_1.html")
     
     # テーブルデータを直接取得
     try:
@@ -29,7 +38,7 @@ def download_boj_data():
             main_table = tables[0]
             
             # CSVとして保存
-            main_table.to_csv(csv_filename, encoding='utf-8')
+            output_writer.write_csv(main_table, csv_filename, index=True, encoding='utf-8')
             print(f"データを保存しました: {csv_filename}")
             
             return main_table
@@ -49,19 +58,20 @@ def download_boj_data():
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
         
-        response = session.get(url, headers=headers)
+        response = session.get(url, headers=headers, timeout=DEFAULT_TIMEOUT)
         
         # Step 2: CSVダウンロード用のURLを構築
         # 実際のフォーム送信先は検証ツールで確認する必要があります
-        download_url = "https://www.stat-search.boj.or.jp/ssi/cgi-bin/famecgi2?cgi=$nme_a000&lstSelection=FM02&exec=download&csv=fm02_m_1"
+        download_url = source_url("https://www.stat-search.boj.or.jp/ssi/cgi-bin/famecgi2?cgi=$nme_a000&lstSelection=FM02&exec=download&csv=fm02_m_1")
         
         # Step 3: CSVをダウンロード
-        response = session.get(download_url, headers=headers)
+        response = session.get(download_url, headers=headers, timeout=DEFAULT_TIMEOUT)
         
         if response.status_code == 200:
             # バイナリとして保存
             with open(csv_filename, 'wb') as f:
                 f.write(response.content)
+            raw_archive.archive_download(csv_filename, url=response.url)
             print(f"CSVファイルを保存しました: {csv_filename}")
             
             # ファイルサイズを確認
@@ -75,6 +85,7 @@ def download_boj_data():
                 try:
                     df = pd.read_csv(csv_filename, encoding=encoding)
                     print(f"{encoding}エンコーディングで成功しました")
+                    metrics.record_output(csv_filename, rows=len(df))
                     return df
                 except Exception as e:
                     print(f"{encoding}エンコーディングでの読み込みに失敗: {e}")
@@ -92,7 +103,7 @@ def download_boj_data():
     
     return None
 
-if __name__ == "__main__":
+def main():
     df = download_boj_data()
     if df is not None:
         print("取得したデータ（先頭5行）:")
@@ -102,4 +113,12 @@ if __name__ == "__main__":
         print(f"\nデータの形状: {df.shape}")
         print(f"列名: {df.columns.tolist()}")
     else:
-        print("データが取得できませんでした。")
\ No newline at end of file
+        print("データが取得できませんでした。")
+    
+    return df is not None
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
+    main()
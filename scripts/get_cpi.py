@@ -1,23 +1,34 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import re
-import pandas as pd
 from datetime import datetime, timedelta
 import time
 import urllib.parse
 import sys
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import circuit_breaker
+import metrics
+import output_writer
+import profiling
+from http_utils import download_to_path, probe_candidates, retry_delay, source_url
 
 # ベースURL
-base_url = 'https://www.e-stat.go.jp'
+base_url = source_url('https://www.e-stat.go.jp')
+
+# 予測したstatInfIdの前後何件までを探索するか
+PROBE_WINDOW = 3
+
+# 期間指定で取得する際の同時実行数
+DEFAULT_MAX_WORKERS = 4
 
 # プロジェクトのルートディレクトリとデータディレクトリの設定
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 data_dir = os.path.join(project_root, "data")
 
-# データディレクトリが存在しない場合は作成
-os.makedirs(data_dir, exist_ok=True)
+# 期間指定で取得した月ごとの公表データの保存先
+releases_dir = os.path.join(data_dir, "cpi_releases")
 
 # 現在の年月から2か月前を計算する関数
 def get_two_months_ago():
@@ -35,21 +46,51 @@ def get_two_months_ago():
 def generate_url(year, month):
     # e-Statの月コードは1月=11010301, 2月=11010302, ...
     month_code = f'1101030{month}'
-    return f'https://www.e-stat.go.jp/stat-search/files?page=1&layout=datalist&toukei=00200573&tstat=000001150147&cycle=1&year={year}0&month={month_code}&tclass1=000001150149&result_back=1&tclass2val=0'
+    return f'{base_url}/stat-search/files?page=1&layout=datalist&toukei=00200573&tstat=000001150147&cycle=1&year={year}0&month={month_code}&tclass1=000001150149&result_back=1&tclass2val=0'
 
 # ファイルをダウンロードする関数
-def download_file(url, filename):
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+def download_file(url, filename, dest_dir=None, session=None):
+    # 一時ファイルに書き込んでから置き換えるので、失敗しても壊れたxlsxが残らない
+    file_path = os.path.join(dest_dir or data_dir, filename)
+    result = download_to_path(url, file_path, session=session, min_size=1000)
+    print(f"SHA-256: {result.sha256} ({result.size} bytes)")
+    return result.path
+
+# 予測したstatInfIdの周辺を並列に探索する関数
+def probe_predicted_excel_url(year, month, window=PROBE_WINDOW, session=None):
+    # 月に基づいてIDを予測する
+    base_id = "000040254992"  # 2025年2月の基準ID
+    month_diff = month - 2  # 2月からの差分
+    
+    if month_diff != 0:
+        print(f"直接リンクが見つからないため、月差分 {month_diff} を使用してIDを予測します")
+    predicted = int(base_id) + month_diff
+    
+    # 予測IDに近い順に候補を並べる（予測, +1, -1, +2, -2, ...）
+    offsets = [0]
+    for d in range(1, window + 1):
+        offsets.extend([d, -d])
+    candidate_urls = [
+        f"{base_url}/stat-search/file-download?statInfId={str(predicted + d).zfill(len(base_id))}&fileKind=0"
+        for d in offsets
+    ]
+    print(f"予測されたID周辺の{len(candidate_urls)}件のURLを並列に確認します")
+    
+    excel_url, response = probe_candidates(candidate_urls, session=session, ordered=True)
+    if response is None:
+        print("予測されたID周辺に有効なExcelファイルが見つかりませんでした")
+        return None
     
-    file_path = os.path.join(data_dir, filename)
-    with open(file_path, 'wb') as file:
-        for chunk in response.iter_content(chunk_size=8192):
-            file.write(chunk)
-    return file_path
+    # 本体は download_file で取得し直すので、ここではレスポンスを閉じる
+    response.close()
+    print(f"予測されたURL: {excel_url}")
+    return excel_url
 
 # 複数のシートをそれぞれCSVに変換する関数
-def convert_excel_to_csv(excel_file, base_name):
+@metrics.timed(check_result=False)
+def convert_excel_to_csv(excel_file, base_name, dest_dir=None):
+    import pandas as pd
+    
     try:
         # Excelファイルを読み込む
         print(f"Excelファイルを読み込んでいます: {excel_file}")
@@ -80,10 +121,10 @@ def convert_excel_to_csv(excel_file, base_name):
                 sheet_suffix = ""
                 
             csv_filename = f"{base_name}{sheet_suffix}.csv"
-            csv_path = os.path.join(data_dir, csv_filename)
+            csv_path = os.path.join(dest_dir or data_dir, csv_filename)
             
             # CSVに変換して保存
-            df.to_csv(csv_path, index=False, encoding='utf-8')
+            output_writer.write_csv(df, csv_path, index=False, encoding='utf-8')
             print(f"CSVに変換しました: {csv_path}")
             
             csv_files.append(csv_path)
@@ -94,13 +135,13 @@ def convert_excel_to_csv(excel_file, base_name):
         print(f"Excel→CSV変換中にエラーが発生しました: {e}")
         return []
 
-# メイン関数
-def download_cpi_data(year=None, month=None):
-    # 年月が指定されていない場合は2か月前を使用
-    if year is None or month is None:
-        year, month = get_two_months_ago()
+# 一覧ページから中分類指数のExcelダウンロードURLを探す関数
+@metrics.timed()
+def find_excel_url(year, month, session=None, predict=True):
+    import requests
+    from bs4 import BeautifulSoup
     
-    print(f"{year}年{month}月の消費者物価指数データ（中分類指数/全国/月次）を取得しています...")
+    http = session or requests
     
     # URLを生成
     target_url = generate_url(year, month)
@@ -110,16 +151,16 @@ def download_cpi_data(year=None, month=None):
     max_attempts = 3
     for attempt in range(max_attempts):
         try:
-            response = requests.get(target_url, timeout=30)
+            response = http.get(target_url, timeout=30)
             response.raise_for_status()
             break
         except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
-            if attempt < max_attempts - 1:
-                wait_time = 5 * (attempt + 1)
-                print(f"接続エラー: {e} - {wait_time}秒後に再試行します（{attempt+1}/{max_attempts}）")
+            wait_time = retry_delay(e, attempt, max_attempts)
+            if wait_time is not None:
+                print(f"接続エラー: {e} - {wait_time:.1f}秒後に再試行します（{attempt+1}/{max_attempts}）")
                 time.sleep(wait_time)
             else:
-                print(f"接続エラー: {e} - 最大試行回数に達しました")
+                print(f"接続エラー: {e} - 再試行しません（{attempt+1}/{max_attempts}）")
                 return None
     
     # HTMLを解析
@@ -165,19 +206,24 @@ def download_cpi_data(year=None, month=None):
                 print(f"最初のExcelリンクを使用します")
     
     # 方法3: 2025年2月で動作した直接URL（最終手段）
-    if not excel_url:
-        # 月に基づいてIDを予測する
-        base_id = "000040254992"  # 2025年2月の基準ID
-        month_diff = month - 2  # 2月からの差分
-        
-        if month_diff != 0:
-            print(f"直接リンクが見つからないため、月差分 {month_diff} を使用してIDを予測します")
-            predicted_id = str(int(base_id) + month_diff).zfill(len(base_id))
-        else:
-            predicted_id = base_id
-        
-        excel_url = f"{base_url}/stat-search/file-download?statInfId={predicted_id}&fileKind=0"
-        print(f"予測されたURL: {excel_url}")
+    # 予測は2025年2月のIDからの月の差分だけで年を考慮しないため、過去の月を取得する場合は使わない
+    if not excel_url and predict:
+        excel_url = probe_predicted_excel_url(year, month, session=session)
+    
+    return excel_url
+
+# メイン関数
+@metrics.timed()
+def download_cpi_data(year=None, month=None):
+    os.makedirs(data_dir, exist_ok=True)
+    
+    # 年月が指定されていない場合は2か月前を使用
+    if year is None or month is None:
+        year, month = get_two_months_ago()
+    
+    print(f"{year}年{month}月の消費者物価指数データ（中分類指数/全国/月次）を取得しています...")
+    
+    excel_url = find_excel_url(year, month)
     
     if excel_url:
         # ファイル名を設定
@@ -221,15 +267,127 @@ def download_cpi_data(year=None, month=None):
     
     return None
 
-if __name__ == "__main__":
+# 開始年月から終了年月までの(年, 月)を列挙する関数
+def iter_months(start, end):
+    year, month = start
+    while (year, month) <= end:
+        yield year, month
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+# 1か月分の公表データをリリースごとのディレクトリに保存する関数
+@metrics.timed()
+def download_cpi_release(year, month, session=None, overwrite=False):
+    release_dir = os.path.join(releases_dir, f"{year}{month:02d}")
+    manifest_path = os.path.join(release_dir, "release.json")
+    
+    # 取得済みの月はスキップ（中断後の再実行で続きから取得できるように）
+    if not overwrite and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        print(f"{year}年{month}月は取得済みのためスキップします")
+        metrics.cache_hit('cpi_release')
+        return [os.path.join(release_dir, name) for name in manifest['files']]
+    
+    metrics.cache_hit('cpi_release', hit=False)
+    excel_url = find_excel_url(year, month, session=session, predict=False)
+    if not excel_url:
+        print(f"{year}年{month}月のダウンロードリンクが見つかりませんでした")
+        return None
+    
+    os.makedirs(release_dir, exist_ok=True)
+    excel_file = download_file(excel_url, "CPI_中分類指数_全国_月次.xlsx", dest_dir=release_dir, session=session)
+    csv_files = convert_excel_to_csv(excel_file, "CPI_中分類指数_全国_月次", dest_dir=release_dir)
+    if not csv_files:
+        print(f"{year}年{month}月のCSV変換に失敗しました。Excelファイルをそのまま保持します。")
+        return [excel_file]
+    os.remove(excel_file)
+    
+    # リリース情報を最後に書き込む（これがあれば取得完了とみなす）
+    manifest = {
+        'year': year,
+        'month': month,
+        'url': excel_url,
+        'fetched_at': datetime.now().isoformat(timespec='seconds'),
+        'files': [os.path.basename(path) for path in csv_files],
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    
+    return csv_files
+
+# 期間を指定して複数月の公表データを並列に取得する関数
+@metrics.timed()
+def download_cpi_range(start, end, max_workers=DEFAULT_MAX_WORKERS, overwrite=False):
+    """
+    start から end までの各月の公表データを並列に取得し、data/cpi_releases/YYYYMM/ に保存する
+    
+    Args:
+        start: 開始年月 (year, month)
+        end: 終了年月 (year, month)
+        max_workers: 同時に取得する月数の上限
+        overwrite: 取得済みの月も取得し直すかどうか
+    
+    Returns:
+        dict: {(year, month): 保存したファイルのリスト（失敗した月はNone）}
+    """
+    import requests
+    
+    months = list(iter_months(start, end))
+    print(f"{start[0]}年{start[1]}月から{end[0]}年{end[1]}月までの{len(months)}か月分を最大{max_workers}並列で取得します")
+    
+    # 接続を使い回すため、同時実行数に合わせたコネクションプールを持つセッションを共有する
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(download_cpi_release, year, month, session, overwrite): (year, month)
+            for year, month in months
+        }
+        for future in as_completed(futures):
+            year, month = futures[future]
+            try:
+                results[(year, month)] = future.result()
+            except Exception as e:
+                print(f"{year}年{month}月の取得中にエラーが発生しました: {e}")
+                results[(year, month)] = None
+    
+    failed = [ym for ym in months if not results.get(ym)]
+    print(f"取得完了: {len(months) - len(failed)}/{len(months)}か月")
+    if failed:
+        print("取得に失敗した月: " + ", ".join(f"{y}/{m:02d}" for y, m in failed))
+    
+    return results
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    
+    # 期間指定モード: python get_cpi.py 開始年 開始月 終了年 終了月
+    if len(argv) > 3:
+        try:
+            start = (int(argv[0]), int(argv[1]))
+            end = (int(argv[2]), int(argv[3]))
+        except ValueError:
+            print("引数の形式が正しくありません。整数の年と月を指定してください。")
+            print("例: python get_cpi.py 2020 1 2024 12")
+            sys.exit(1)
+        
+        results = download_cpi_range(start, end)
+        sys.exit(0 if all(results.values()) else 1)
+    
     # 引数の処理（オプションで年月を指定可能）
     target_year = None
     target_month = None
     
-    if len(sys.argv) > 2:
+    if len(argv) > 1:
         try:
-            target_year = int(sys.argv[1])
-            target_month = int(sys.argv[2])
+            target_year = int(argv[0])
+            target_month = int(argv[1])
             print(f"指定された年月: {target_year}年{target_month}月")
         except ValueError:
             print("引数の形式が正しくありません。整数の年と月を指定してください。")
@@ -249,4 +407,12 @@ if __name__ == "__main__":
             if "_前月比" in file_path:
                 print(f"\n★ 前月比のデータ: {file_path}")
     else:
-        print("データの取得に失敗しました")
\ No newline at end of file
+        print("データの取得に失敗しました")
+    
+    return bool(file_paths)
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
+    main()
@@ -7,15 +7,22 @@ get_di.py - 内閣府ESRIウェブサイトからハイライトされたExcel
 """
 
 import os
-import requests
-from bs4 import BeautifulSoup
 import re
 import pathlib
 import time
 
+import circuit_breaker
+import metrics
+import profiling
+from http_utils import DEFAULT_TIMEOUT, save_response, source_url
+
+@metrics.timed(check_result=False)
 def main():
+    import requests
+    from bs4 import BeautifulSoup
+    
     # ベースURL
-    base_url = "https://www.esri.cao.go.jp/jp/stat/di/di.html"
+    base_url = source_url("https://www.esri.cao.go.jp/jp/stat/di/di.html")
     
     # リクエスト用のセッションを作成
     session = requests.Session()
@@ -27,7 +34,7 @@ def main():
     print("内閣府ESRIウェブサイトにアクセスしています...")
     
     # メインページを取得
-    response = session.get(base_url, headers=headers)
+    response = session.get(base_url, headers=headers, timeout=DEFAULT_TIMEOUT)
     response.encoding = 'utf-8'  # 日本語テキストを適切に処理するためにエンコーディングを設定
     
     if response.status_code != 200:
@@ -67,8 +74,10 @@ def main():
     print(f"ターゲットリンクを見つけました: 「{target_text}」")
     
     # 相対URLを絶対URLに変換（必要な場合）
-    if target_link.startswith('/'):
-        target_link = f"https://www.esri.cao.go.jp{target_link}"
+    if target_link.startswith('http'):
+        target_link = source_url(target_link)
+    elif target_link.startswith('/'):
+        target_link = source_url(f"https://www.esri.cao.go.jp{target_link}")
     elif not target_link.startswith('http'):
         # 元のURLからベースディレクトリを抽出
         base_dir = '/'.join(base_url.split('/')[:-1])
@@ -77,10 +86,11 @@ def main():
     print(f"ファイルをダウンロードしています: {target_link}")
     
     # ファイルをダウンロード
-    file_response = session.get(target_link, headers=headers, stream=True)
+    file_response = session.get(target_link, headers=headers, stream=True, timeout=(10, 60))
     
     if file_response.status_code != 200:
         print(f"ファイルのダウンロードに失敗しました。ステータスコード: {file_response.status_code}")
+        file_response.close()
         return
     
     # Content-Dispositionヘッダーからファイル名を取得するか、デフォルト名を使用
@@ -95,16 +105,17 @@ def main():
     data_dir = pathlib.Path('data')
     data_dir.mkdir(exist_ok=True)
     
-    # ファイルをdataディレクトリに保存
+    # ファイルをdataディレクトリに保存（一時ファイル経由で置き換え、中断時は続きから再開）
     file_path = data_dir / filename
-    with open(file_path, 'wb') as f:
-        for chunk in file_response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    try:
+        result = save_response(file_response, file_path, session=session, headers=headers, min_size=1000)
+    except Exception as e:
+        print(f"ファイルの保存に失敗しました: {e}")
+        return
     
-    print(f"ファイルを '{file_path}' に正常にダウンロードしました")
-
-if __name__ == "__main__":
-    main()
+    print(f"ファイルを '{file_path}' に正常にダウンロードしました (SHA-256: {result.sha256})")
 
 if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
     main()
\ No newline at end of file
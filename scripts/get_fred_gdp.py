@@ -1,12 +1,20 @@
-import pandas as pd
-import requests
 import os
 
+import circuit_breaker
+import metrics
+import output_writer
+import profiling
+from http_utils import DEFAULT_TIMEOUT, source_url
+
+@metrics.timed()
 def get_fred_data(series_id, api_key):
     """FRED APIから指定されたシリーズIDのデータを取得する"""
-    url = f'https://api.stlouisfed.org/fred/series/observations?series_id={series_id}&api_key={api_key}&file_type=json'
+    import pandas as pd
+    import requests
+    
+    url = source_url(f'https://api.stlouisfed.org/fred/series/observations?series_id={series_id}&api_key={api_key}&file_type=json')
     
-    response = requests.get(url)
+    response = requests.get(url, timeout=DEFAULT_TIMEOUT)
     data = response.json()
     
     # DataFrameに変換
@@ -39,7 +47,10 @@ def process_data(df, frequency='quarterly'):
     
     return result
 
+@metrics.timed(check_result=False)
 def main():
+    import pandas as pd
+    
     # 環境変数からAPIキーを取得
     api_key = os.environ.get('FRED_API_KEY')
     
@@ -87,8 +98,10 @@ def main():
         
         # CSVに保存
         output_file = os.path.join('data', 'all_gdp_data.csv')
-        merged_df.to_csv(output_file)
+        output_writer.write_csv(merged_df, output_file, index=True)
         print(f"すべてのGDPデータを{output_file}に保存しました")
 
 if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
     main()
\ No newline at end of file
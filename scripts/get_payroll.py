@@ -1,24 +1,23 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import re
-import pandas as pd
 from datetime import datetime, timedelta
 import time
 import urllib.parse
 import sys
 
+import circuit_breaker
+import metrics
+import profiling
+from http_utils import download_to_path, probe_candidates, retry_delay, source_url
+
 # ベースURL
-base_url = 'https://www.e-stat.go.jp'
+base_url = source_url('https://www.e-stat.go.jp')
 
 # プロジェクトのルートディレクトリとデータディレクトリの設定
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 data_dir = os.path.join(project_root, "data")
 
-# データディレクトリが存在しない場合は作成
-os.makedirs(data_dir, exist_ok=True)
-
 # ファイルをダウンロードする関数
 def download_file(url, filename):
     """指定されたURLからファイルをダウンロードする関数"""
@@ -28,48 +27,21 @@ def download_file(url, filename):
         'Referer': 'https://www.e-stat.go.jp/'
     }
     
-    # セッションを作成
-    session = requests.Session()
-    
-    # ファイルをダウンロード（最大3回まで試行）
-    max_attempts = 3
-    for attempt in range(max_attempts):
-        try:
-            response = session.get(url, headers=headers, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            file_path = os.path.join(data_dir, filename)
-            with open(file_path, 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
-                    
-            # ファイルサイズを確認
-            file_size = os.path.getsize(file_path)
-            if file_size < 1000:  # 1KB未満は不正なファイルの可能性
-                print(f"警告: ダウンロードされたファイルのサイズが小さすぎます ({file_size} bytes)")
-                if attempt < max_attempts - 1:
-                    print(f"再試行します ({attempt+1}/{max_attempts})...")
-                    time.sleep(5)
-                    continue
-                else:
-                    raise Exception("ダウンロードされたファイルが不正です")
-                    
-            return file_path
-            
-        except Exception as e:
-            if attempt < max_attempts - 1:
-                wait_time = 5 * (attempt + 1)
-                print(f"ダウンロードエラー: {e} - {wait_time}秒後に再試行します（{attempt+1}/{max_attempts}）")
-                time.sleep(wait_time)
-            else:
-                print(f"ダウンロードエラー: {e} - 最大試行回数に達しました")
-                raise
-    
-    return None
+    # 一時ファイルに書き込み、1KB未満のファイルは不正とみなす（最大3回まで試行・中断時は続きから再開）
+    file_path = os.path.join(data_dir, filename)
+    result = download_to_path(url, file_path, headers=headers, timeout=60, min_size=1000, max_attempts=3)
+    print(f"SHA-256: {result.sha256} ({result.size} bytes)")
+    return result.path
 
 # 毎月勤労統計調査のデータをダウンロードする関数
+@metrics.timed()
 def download_payroll_data():
     """e-Statから毎月勤労統計調査の長期時系列データをダウンロードする関数"""
+    import requests
+    from bs4 import BeautifulSoup
+    
+    os.makedirs(data_dir, exist_ok=True)
+    
     print("毎月勤労統計調査データのダウンロードを開始します...")
     
     # 統計表示ページのURL（長期時系列表）
@@ -85,16 +57,16 @@ def download_payroll_data():
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
             }
             session = requests.Session()
-            response = session.get(url, headers=headers, timeout=30)
+            response = session.get(source_url(url), headers=headers, timeout=30)
             response.raise_for_status()
             break
         except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
-            if attempt < max_attempts - 1:
-                wait_time = 5 * (attempt + 1)
-                print(f"接続エラー: {e} - {wait_time}秒後に再試行します（{attempt+1}/{max_attempts}）")
+            wait_time = retry_delay(e, attempt, max_attempts)
+            if wait_time is not None:
+                print(f"接続エラー: {e} - {wait_time:.1f}秒後に再試行します（{attempt+1}/{max_attempts}）")
                 time.sleep(wait_time)
             else:
-                print(f"接続エラー: {e} - 最大試行回数に達しました")
+                print(f"接続エラー: {e} - 再試行しません（{attempt+1}/{max_attempts}）")
                 return None
     
     # HTMLを解析
@@ -123,7 +95,7 @@ def download_payroll_data():
             if href.startswith('/'):
                 excel_url = base_url + href
             elif href.startswith('http'):
-                excel_url = href
+                excel_url = source_url(href)
             else:
                 excel_url = base_url + '/' + href
             print(f"ダウンロードリンクを見つけました: {excel_url}")
@@ -134,17 +106,18 @@ def download_payroll_data():
         if len(matches) > 1:
             stat_infid = matches[1].split('&')[0]
             
-            # 複数のfileKindを試す
-            for file_kind in [0, 1, 4]:
-                test_url = f"{base_url}/stat-search/file-download?statInfId={stat_infid}&fileKind={file_kind}"
-                try:
-                    test_resp = session.head(test_url, timeout=10)
-                    if test_resp.status_code == 200 and int(test_resp.headers.get('Content-Length', 0)) > 1000:
-                        excel_url = test_url
-                        print(f"fileKind={file_kind} で有効なURLを見つけました")
-                        break
-                except:
-                    continue
+            # 複数のfileKindを並列に試す（優先度はfileKindの並び順）
+            candidate_urls = [
+                f"{base_url}/stat-search/file-download?statInfId={stat_infid}&fileKind={file_kind}"
+                for file_kind in [0, 1, 4]
+            ]
+            found_url, probe_resp = probe_candidates(candidate_urls, headers=headers, session=session,
+                                                     content_types=None, min_size=1000, ordered=True)
+            if probe_resp is not None:
+                # 本体は download_file で取得し直すので、ここではレスポンスを閉じる
+                probe_resp.close()
+                excel_url = found_url
+                print(f"有効なURLを見つけました: {excel_url}")
     
     if excel_url:
         # ファイル名を設定
@@ -191,16 +164,25 @@ def download_payroll_data():
     return None
 
 # メイン実行部分
-if __name__ == "__main__":
+def main():
     try:
         # データをダウンロード
         excel_file = download_payroll_data()
         
         if excel_file:
             print(f"毎月勤労統計調査データを正常にダウンロードしました: {excel_file}")
+            return True
         else:
             print("データの取得に失敗しました")
+            return False
     except Exception as e:
         print(f"実行中にエラーが発生しました: {e}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
+    main()
@@ -1,18 +1,25 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import re
 from pathlib import Path
 
+import circuit_breaker
+import metrics
+import profiling
+from http_utils import DEFAULT_TIMEOUT, download_to_path, probe_candidates, save_response, source_url
 
+
+@metrics.timed()
 def download_commercial_real_estate_index():
     """
     Download the commercial real estate price index Excel file from MLIT website.
     The file will be saved in the 'data' directory in the project root.
     """
+    import requests
+    from bs4 import BeautifulSoup
+    
     # URL of the webpage containing the Excel file link
-    base_url = "https://www.mlit.go.jp"
-    page_url = "https://www.mlit.go.jp/totikensangyo/totikensangyo_tk5_000085.html"
+    base_url = source_url("https://www.mlit.go.jp")
+    page_url = source_url("https://www.mlit.go.jp/totikensangyo/totikensangyo_tk5_000085.html")
     
     # Get the project root directory and create the data path
     script_dir = Path(__file__).resolve().parent
@@ -30,7 +37,7 @@ def download_commercial_real_estate_index():
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
-        response = requests.get(page_url, headers=headers)
+        response = requests.get(page_url, headers=headers, timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()  # Raise an exception for HTTP errors
         
         # Set the encoding to handle Japanese characters
@@ -62,25 +69,19 @@ def download_commercial_real_estate_index():
         if excel_link.startswith('/'):
             excel_url = base_url + excel_link
         elif excel_link.startswith('http'):
-            excel_url = excel_link
+            excel_url = source_url(excel_link)
         else:
             excel_url = base_url + '/' + excel_link
         
         print(f"Found Excel link: {excel_url}")
         
         # Step 4: Download the Excel file
+        # Step 5: Save the file via a temp file so a failed transfer never replaces the previous workbook
         print(f"Downloading the Excel file...")
-        file_response = requests.get(excel_url, headers=headers, stream=True)
-        file_response.raise_for_status()
-        
-        # Step 5: Save the file
-        with open(output_file, 'wb') as f:
-            for chunk in file_response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        result = download_to_path(excel_url, output_file, headers=headers, min_size=1000)
         
-        file_size = os.path.getsize(output_file) / 1024  # Size in KB
-        print(f"Successfully downloaded to {output_file} ({file_size:.2f} KB)")
+        file_size = result.size / 1024  # Size in KB
+        print(f"Successfully downloaded to {output_file} ({file_size:.2f} KB, sha256 {result.sha256})")
         return True
     
     except requests.exceptions.RequestException as e:
@@ -91,6 +92,7 @@ def download_commercial_real_estate_index():
         return False
 
 
+@metrics.timed()
 def download_by_direct_url():
     """
     Alternative method to download the commercial real estate price index 
@@ -115,33 +117,24 @@ def download_by_direct_url():
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
+    print("Probing direct URLs in parallel:")
     for url in possible_urls:
-        try:
-            print(f"Trying direct URL: {url}")
-            response = requests.get(url, headers=headers, stream=True)
-            
-            if response.status_code == 200:
-                # Check if it's actually an Excel file
-                content_type = response.headers.get('Content-Type', '')
-                if 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' in content_type or \
-                   'application/vnd.ms-excel' in content_type or \
-                   'application/octet-stream' in content_type:
-                    
-                    filename = data_dir / "commercial_real_estate_index_direct.xlsx"
-                    with open(filename, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                    
-                    print(f"Successfully downloaded to {filename}")
-                    return True
-                else:
-                    print(f"URL returned non-Excel content: {content_type}")
-            else:
-                print(f"URL returned status code: {response.status_code}")
-                
-        except Exception as e:
-            print(f"Error with URL {url}: {e}")
+        print(f"  - {url}")
+    
+    # Fire all candidates concurrently and keep the first valid Excel response
+    url, response = probe_candidates(possible_urls, headers=headers)
+    if response is None:
+        print("None of the direct URLs returned a valid Excel file.")
+        return False
+    
+    try:
+        filename = data_dir / "commercial_real_estate_index_direct.xlsx"
+        save_response(response, filename, headers=headers, min_size=1000)
+        
+        print(f"Successfully downloaded {url} to {filename}")
+        return True
+    except Exception as e:
+        print(f"Error with URL {url}: {e}")
     
     return False
 
@@ -162,4 +155,6 @@ def main():
 
 
 if __name__ == "__main__":
+    profiling.consume_flag()
+    circuit_breaker.install()
     main()
\ No newline at end of file
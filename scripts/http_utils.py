@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+http_utils.py - 各get_*スクリプトで共有するHTTPユーティリティ
+
+- probe_candidates(): フォールバック用のダウンロード候補URLを並列に問い合わせ、
+  最初に有効なレスポンスを採用する
+- download_to_path(): 一時ファイルに書き込みながらハッシュを計算し、検証後に
+  アトミックに置き換える。中断した転送はRangeリクエストで再開する
+- source_url(): 環境変数 BOJDATA_BASE_URL が設定されている場合、取得元のURLを
+  リプレイサーバー（replay_server.py）経由のURLに書き換える
+- retry_delay(): 再試行までの待ち時間（試行ごとに倍にする）。遮断中のホスト（circuit_breaker.py）は再試行しない
+
+probe_candidates() / download_to_path() の最初の呼び出しで circuit_breaker.install() により、
+ホストごとの遮断を有効にする（読み込んだだけでは requests を読み込まず、Session.send も置き換えない）。
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import circuit_breaker
+import metrics
+import raw_archive
+
+# ブラウザ相当のUser-Agent（一部のサイトではこれが必要）
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# (接続, 読み込み) のタイムアウト秒数
+DEFAULT_TIMEOUT = (10, 30)
+
+# Excelファイルとして受け入れるContent-Type
+EXCEL_CONTENT_TYPES = (
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.ms-excel',
+    'application/octet-stream',
+)
+
+# エラーページなどダウンロード結果として受け入れないContent-Type
+REJECT_CONTENT_TYPES = ('text/html',)
+
+# 再試行までの待ち時間（秒）。試行ごとに倍にし、最大 RETRY_MAX_DELAY 秒とする
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 30
+
+# 書き込み途中のファイルの拡張子
+PART_SUFFIX = '.part'
+
+# ダウンロード結果
+DownloadResult = namedtuple('DownloadResult', ['path', 'sha256', 'size', 'resumed'])
+
+
+class DownloadError(Exception):
+    """ダウンロードしたファイルが検証に失敗した場合の例外"""
+
+
+def retry_delay(error, attempt, max_attempts):
+    """
+    失敗した試行の後の待ち時間（秒）を返す
+
+    最大試行回数に達した場合と、遮断中のホストへのリクエスト（circuit_breaker.CircuitOpenError）は
+    再試行しないため None を返す。複数のスクリプトが同時に再試行しないよう、待ち時間に揺らぎを加える。
+    """
+    if attempt >= max_attempts - 1 or getattr(error, 'circuit_open', False):
+        return None
+    delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def source_url(url):
+    """
+    取得元のURLにベースURLの上書きを適用する
+
+    BOJDATA_BASE_URL=http://127.0.0.1:8766 のとき
+    https://www.e-stat.go.jp/stat-search/files?x=1 は
+    http://127.0.0.1:8766/www.e-stat.go.jp/stat-search/files?x=1 になる。
+    既に書き換え済みのURLはそのまま返す。
+    """
+    base_url = os.environ.get('BOJDATA_BASE_URL')
+    if not base_url or url.startswith(base_url):
+        return url
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url
+    rewritten = f"{base_url.rstrip('/')}/{parts.netloc}{parts.path or '/'}"
+    if parts.query:
+        rewritten += f"?{parts.query}"
+    return rewritten
+
+
+def _is_valid_response(response, content_types, min_size):
+    """ステータス・Content-Type・サイズからレスポンスが有効か判定する"""
+    if response.status_code != 200:
+        return False, f"ステータスコード {response.status_code}"
+
+    content_type = response.headers.get('Content-Type', '')
+    if content_types and not any(ct in content_type for ct in content_types):
+        return False, f"Content-Typeが不正です: {content_type}"
+
+    # Content-Lengthがない場合はサイズ判定をダウンロード時に委ねる
+    content_length = response.headers.get('Content-Length')
+    if min_size and content_length is not None:
+        try:
+            size = int(content_length)
+        except ValueError:
+            return False, f"Content-Lengthが不正です: {content_length}"
+        if size < min_size:
+            return False, f"サイズが小さすぎます ({content_length} bytes)"
+
+    return True, None
+
+
+def _close_future_response(future):
+    """採用されなかった候補のレスポンスを閉じる"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    response = future.result()
+    if response is not None:
+        response.close()
+
+
+def probe_candidates(urls, headers=None, session=None, content_types=EXCEL_CONTENT_TYPES,
+                     min_size=1000, timeout=DEFAULT_TIMEOUT, max_workers=None, ordered=False):
+    """
+    候補URLを並列にGETし、最初に有効だったレスポンスを返す
+
+    Args:
+        urls: 候補URLのリスト（優先度順）
+        headers: リクエストヘッダー
+        session: 使い回すrequests.Session（省略時は新規作成）
+        content_types: 受け入れるContent-Typeの部分文字列（空なら判定しない）
+        min_size: Content-Lengthの最小バイト数
+        timeout: requestsに渡すタイムアウト
+        max_workers: 同時接続数（省略時は候補数）
+        ordered: Trueの場合、先に並んだ候補の結果が確定するまで後続の候補を採用しない
+
+    Returns:
+        (url, response) のタプル。responseはstream=Trueで開いたままなので呼び出し側で
+        読み込んで閉じること。有効な候補がなければ (None, None)
+    """
+    import requests
+    
+    circuit_breaker.install()
+    urls = list(urls)
+    if not urls:
+        return None, None
+
+    headers = headers or DEFAULT_HEADERS
+    # 自分で作ったセッションは最後に閉じる（採用したレスポンスは閉じた後も読み込める）
+    own_session = session is None
+    session = session or requests.Session()
+    cancelled = threading.Event()
+
+    def fetch(url):
+        # 既に勝者が決まっている場合はリクエストを送らない
+        if cancelled.is_set():
+            return None
+        response = session.get(source_url(url), headers=headers, stream=True, timeout=timeout)
+        if cancelled.is_set():
+            response.close()
+            return None
+        return response
+
+    # 各候補の結果: None=未確定, False=無効, Response=有効
+    results = [None] * len(urls)
+    consumed = set()
+    futures = {}
+    winner = None
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(urls))
+    try:
+        futures = {executor.submit(fetch, url): i for i, url in enumerate(urls)}
+        for future in as_completed(futures):
+            i = futures[future]
+            consumed.add(future)
+            try:
+                response = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"候補URLへの接続に失敗しました: {urls[i]} ({e})")
+                response = None
+
+            if response is not None:
+                valid, reason = _is_valid_response(response, content_types, min_size)
+                if not valid:
+                    print(f"候補URLは無効です: {urls[i]} ({reason})")
+                    response.close()
+                    response = None
+            results[i] = response if response is not None else False
+
+            # 採用できる候補を探す
+            if ordered:
+                # 先頭から見て最初の未確定候補より前にある有効な候補のみ採用できる
+                for j, result in enumerate(results):
+                    if result is None:
+                        break
+                    if result is not False:
+                        winner = j
+                        break
+            elif response is not None:
+                winner = i
+
+            if winner is not None:
+                break
+    finally:
+        # 残りの候補をキャンセルする
+        cancelled.set()
+        for future in futures:
+            if future not in consumed:
+                future.add_done_callback(_close_future_response)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # 採用しなかったレスポンスを閉じる
+        for j, result in enumerate(results):
+            if result is not None and result is not False and j != winner:
+                result.close()
+        if own_session:
+            session.close()
+
+    if winner is None:
+        return None, None
+    return urls[winner], results[winner]
+
+
+def _check_content_type(response, content_types):
+    """Content-Typeを検証する"""
+    content_type = response.headers.get('Content-Type', '')
+    if any(ct in content_type for ct in REJECT_CONTENT_TYPES):
+        raise DownloadError(f"Content-Typeが不正です: {content_type}")
+    if content_types and not any(ct in content_type for ct in content_types):
+        raise DownloadError(f"Content-Typeが不正です: {content_type}")
+
+
+def _read_validator(part_path):
+    """一時ファイルに対応する検証子を読み込む"""
+    try:
+        with open(part_path + '.validator', 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_validator(part_path, validator):
+    """一時ファイルに対応する検証子を保存する（Noneなら削除）"""
+    validator_path = part_path + '.validator'
+    if validator:
+        with open(validator_path, 'w', encoding='utf-8') as f:
+            f.write(validator)
+    elif os.path.exists(validator_path):
+        os.remove(validator_path)
+
+
+def _hash_existing(part_path):
+    """再開時に書き込み済みの部分のハッシュを計算する"""
+    hasher = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def _stream_to_part(response, part_path, dest_path, content_types, min_size, offset=0, hasher=None):
+    """
+    レスポンスを一時ファイルに書き込み、検証後に本来のパスへアトミックに置き換える
+
+    offset > 0 の場合は一時ファイルの末尾に追記する（Rangeリクエストの続き）。
+    途中で失敗した場合、一時ファイルは再開用にそのまま残す。
+    """
+    _check_content_type(response, content_types)
+    hasher = hasher or hashlib.sha256()
+
+    # gzip などで圧縮されたレスポンスは展開後のバイト数が Content-Length（圧縮後のサイズ）と一致せず、
+    # 書き込んだバイト数をRangeの位置にも使えないため、サイズの検証と再開をしない
+    encoded = response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+
+    # 期待される全体サイズ（Content-Lengthは残りのバイト数）
+    expected_size = None
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and not encoded:
+        try:
+            expected_size = offset + int(content_length)
+        except ValueError:
+            raise DownloadError(f"Content-Lengthが不正です: {content_length}")
+
+    # 再開時に同じ内容か確認できるよう、検証子（ETag/Last-Modified）を保存しておく
+    if not offset:
+        validator = None if encoded else response.headers.get('ETag') or response.headers.get('Last-Modified')
+        _write_validator(part_path, validator)
+
+    size = offset
+    with open(part_path, 'ab' if offset else 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f"転送が途中で終了しました ({size}/{expected_size} bytes)")
+    if size < min_size:
+        # 小さすぎるファイルは再開しても正しくならないので破棄する
+        os.remove(part_path)
+        _write_validator(part_path, None)
+        raise DownloadError(f"ダウンロードされたファイルのサイズが小さすぎます ({size} bytes)")
+
+    os.replace(part_path, dest_path)
+    _write_validator(part_path, None)
+    metrics.record_output(dest_path, sha256=hasher.hexdigest())
+    raw_archive.archive_download(dest_path, url=response.url, sha256=hasher.hexdigest())
+    return DownloadResult(str(dest_path), hasher.hexdigest(), size, offset > 0)
+
+
+def download_to_path(url, dest_path, session=None, headers=None, timeout=DEFAULT_TIMEOUT,
+                     content_types=None, min_size=0, max_attempts=3):
+    """
+    URLのファイルを dest_path に安全にダウンロードする
+
+    一時ファイル（dest_path + '.part'）に書き込みながらSHA-256を計算し、
+    サイズ・Content-Typeを検証してから os.replace で置き換える。前回の一時ファイルが
+    残っている場合はRangeリクエストで続きから取得する。失敗しても既存のファイルは
+    変更されない。
+
+    Args:
+        url: ダウンロードするURL
+        dest_path: 保存先のパス
+        session: 使い回すrequests.Session（省略時は新規作成）
+        headers: リクエストヘッダー
+        timeout: requestsに渡すタイムアウト
+        content_types: 受け入れるContent-Typeの部分文字列（省略時はHTML以外すべて）
+        min_size: ファイルの最小バイト数
+        max_attempts: 最大試行回数
+
+    Returns:
+        DownloadResult: (path, sha256, size, resumed)
+    """
+    import requests
+    
+    circuit_breaker.install()
+    session = session or requests.Session()
+    headers = dict(headers or DEFAULT_HEADERS)
+    part_path = str(dest_path) + PART_SUFFIX
+    url = source_url(url)
+
+    # 書き込むバイト数とContent-Length・Rangeの位置が一致するよう、圧縮しないで送ってもらう
+    headers['Accept-Encoding'] = 'identity'
+
+    for attempt in range(max_attempts):
+        request_headers = dict(headers)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = _read_validator(part_path) if offset else None
+        if offset and validator:
+            # 内容が変わっていればサーバーは200で全体を返す
+            request_headers['Range'] = f"bytes={offset}-"
+            request_headers['If-Range'] = validator
+        else:
+            offset = 0
+
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if offset and response.status_code == 206:
+                    if not response.headers.get('Content-Range', '').startswith(f"bytes {offset}-"):
+                        os.remove(part_path)
+                        raise DownloadError("Content-Rangeが要求と一致しません")
+                    print(f"中断したダウンロードを {offset} bytes から再開します")
+                    metrics.cache_hit('download_resume')
+                    return _stream_to_part(response, part_path, dest_path, content_types, min_size,
+                                           offset=offset, hasher=_hash_existing(part_path))
+                if offset and response.status_code == 416:
+                    # 範囲外: 一時ファイルが壊れているので最初から取得し直す
+                    os.remove(part_path)
+                    raise DownloadError("Rangeリクエストが拒否されました")
+
+                # Rangeに対応していないサーバーは200で全体を返すので最初から書き込む
+                response.raise_for_status()
+                return _stream_to_part(response, part_path, dest_path, content_types, min_size)
+
+        except (requests.exceptions.RequestException, DownloadError) as e:
+            wait_time = retry_delay(e, attempt, max_attempts)
+            if wait_time is not None:
+                print(f"ダウンロードエラー: {e} - {wait_time:.1f}秒後に再試行します（{attempt+1}/{max_attempts}）")
+                time.sleep(wait_time)
+            else:
+                print(f"ダウンロードエラー: {e} - 再試行しません（{attempt+1}/{max_attempts}）")
+                raise
+
+
+def save_response(response, dest_path, session=None, headers=None, timeout=DEFAULT_TIMEOUT,
+                  content_types=None, min_size=0, max_attempts=3):
+    """
+    取得済みのレスポンス（stream=True）を dest_path に安全に保存する
+
+    probe_candidates() の結果などをそのまま保存するときに使う。転送が途中で失敗した
+    場合は download_to_path() で同じURLから続きを取得する。
+    """
+    import requests
+    
+    part_path = str(dest_path) + PART_SUFFIX
+    try:
+        response.raise_for_status()
+        return _stream_to_part(response, part_path, dest_path, content_types, min_size)
+    except (requests.exceptions.RequestException, DownloadError) as e:
+        if max_attempts <= 1:
+            raise
+        print(f"ダウンロードエラー: {e} - 再試行します")
+        return download_to_path(response.url, dest_path, session=session, headers=headers, timeout=timeout,
+                                content_types=content_types, min_size=min_size, max_attempts=max_attempts - 1)
+    finally:
+        response.close()
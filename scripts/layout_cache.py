@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+layout_cache.py - Excel・CSVの表の配置（見出しの行・列、データの開始行）を検出してキャッシュする
+
+加工スクリプトは表の見出しやデータの位置を探すためにセルを走査する。表の配置は公表のたびに
+変わることはほとんどないため、一度検出した配置を、その根拠になった見出しのセル（アンカー）と一緒に
+reports/layout_cache.json（環境変数 BOJDATA_LAYOUT_CACHE で変更できる）に保存する。次回はシート名とアンカーのセルの内容のハッシュ（フィンガープリント）
+だけを確かめ、一致すれば保存した配置をそのまま使う。一致しない場合（列の追加・シートの作り直しなど）は
+検出し直してキャッシュを更新する。
+
+使い方:
+    def detect(df):
+        ...
+        return layout, anchors   # anchors: [(行, 列), ...]（検出できなければ None）
+
+    layout = layout_cache.resolve('process_di', df, sheet_name, detect)
+"""
+
+import hashlib
+import json
+import os
+
+import metrics
+
+# プロジェクトのルートディレクトリとキャッシュの保存先（ワークフローでは実行をまたいで復元する）
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+default_cache_path = os.path.join(project_root, "reports", "layout_cache.json")
+
+
+def cell_text(df, row, col):
+    """セルの内容を比較用の文字列にする（範囲外・空のセルは空文字列）"""
+    if row >= df.shape[0] or col >= df.shape[1]:
+        return ''
+    value = df.iat[row, col]
+    if value is None or value != value:  # NaN
+        return ''
+    return str(value).strip()
+
+
+def fingerprint(df, sheet_name, anchors):
+    """シート名とアンカーのセルの内容のハッシュ"""
+    cells = [[row, col, cell_text(df, row, col)] for row, col in anchors]
+    payload = json.dumps([sheet_name or '', cells], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_path():
+    return os.environ.get('BOJDATA_LAYOUT_CACHE') or default_cache_path
+
+
+def _load():
+    path = cache_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(cache):
+    path = cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def resolve(name, df, sheet_name, detect):
+    """
+    表の配置を返す（キャッシュのフィンガープリントが一致すれば検出しない）
+
+    Args:
+        name: キャッシュのキー（表の種類ごとに一意な名前）
+        df: ヘッダーなしで読み込んだ表
+        sheet_name: シート名（CSVの場合は None）
+        detect: df から (配置の辞書, アンカーのセルの位置のリスト) を返す関数。検出できなければ None
+
+    Returns:
+        dict: 配置（検出できなかった場合は None）
+    """
+    cache = _load()
+    entry = cache.get(name)
+    if entry is not None and entry['fingerprint'] == fingerprint(df, sheet_name, entry['anchors']):
+        metrics.cache_hit('layout')
+        return entry['layout']
+
+    metrics.cache_hit('layout', hit=False)
+    detected = detect(df)
+    if detected is None:
+        return None
+    layout, anchors = detected
+    anchors = [[int(row), int(col)] for row, col in anchors]
+    cache[name] = {
+        'sheet': sheet_name,
+        'anchors': anchors,
+        'fingerprint': fingerprint(df, sheet_name, anchors),
+        'layout': layout,
+    }
+    _save(cache)
+    print(f"表の配置を検出しました（{name}）: {layout}")
+    return layout
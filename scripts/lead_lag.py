@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+lead_lag.py - パネルの全系列の組み合わせについて、ラグ付き相関（先行・遅行の関係）を計算するスクリプト
+
+景気動向指数の先行指数がCPI・企業物価・賃金・GDPにどれだけ先行するかを見るため、
+panel.py が作成したパネルの全系列の組み合わせ・全ラグの相関を一度に計算する。
+
+ラグkの相関は corr(x[t], y[t+k]) で、kが正なら x が y に k期先行する。
+ラグごとにずらした y を列方向に並べた行列を作り、欠損を除いたペアの件数・和・二乗和・積和を
+行列積でまとめて求める（系列ごと・ラグごとのループを行わない）。
+
+結果は入力のパネルのハッシュとパラメーターをキーにキャッシュし、入力が変わらなければ計算しない。
+
+出力:
+    data/analytics/lead_lag_<頻度>.csv       全組み合わせ・全ラグの相関（先行系列, 対象系列, ラグ, 相関, 件数）
+    data/analytics/lead_lag_best_<頻度>.csv  組み合わせごとに相関の絶対値が最大のラグ
+
+使い方:
+    python scripts/lead_lag.py [--max-lag 24] [--transform level|diff|yoy] [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import metrics
+import output_writer
+import panel
+import profiling
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+analytics_dir = os.path.join(project_root, "data", "analytics")
+
+# 頻度ごとの既定の最大ラグ（月次は2年、四半期は3年）
+DEFAULT_MAX_LAG = {'M': 24, 'Q': 12}
+
+# 相関を求めるのに必要な最小のペア数
+MIN_OBSERVATIONS = 24
+
+# 1年あたりの期間数（transform='yoy' で使用）
+PERIODS_PER_YEAR = {'M': 12, 'Q': 4}
+
+
+def transform_matrix(x, transform, freq):
+    """相関を取る前の変換（level: そのまま, diff: 前期差, yoy: 前年比%）"""
+    import numpy as np
+
+    if transform == 'level':
+        return x
+    out = np.full(x.shape, np.nan)
+    k = 1 if transform == 'diff' else PERIODS_PER_YEAR[freq]
+    if len(x) <= k:
+        return out
+    if transform == 'diff':
+        out[k:] = x[k:] - x[:-k]
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[k:] = (x[k:] / x[:-k] - 1) * 100
+        out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def lagged_stack(y, lags):
+    """y をラグごとにずらして列方向に並べる（列のブロック i がラグ lags[i]、はみ出した期間はNaN）"""
+    import numpy as np
+
+    t, m = y.shape
+    stacked = np.full((t, m * len(lags)), np.nan)
+    for i, k in enumerate(lags):
+        block = stacked[:, i * m:(i + 1) * m]
+        if k >= 0:
+            block[:t - k] = y[k:]
+        else:
+            block[-k:] = y[:t + k]
+    return stacked
+
+
+def _column_means(x):
+    """列ごとの欠損を除いた平均（すべて欠損の列は0）"""
+    import numpy as np
+
+    valid = ~np.isnan(x)
+    counts = valid.sum(axis=0, keepdims=True)
+    sums = np.where(valid, x, 0.0).sum(axis=0, keepdims=True)
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+
+def lagged_correlations(x, y, lags, min_obs=MIN_OBSERVATIONS):
+    """
+    x の各列と、ラグを付けた y の各列の相関を欠損を除いたペアで計算する
+
+    Args:
+        x: 先行系列の行列（期間×n）
+        y: 対象系列の行列（期間×m）
+        lags: ラグのリスト
+        min_obs: これより少ないペアの相関はNaNにする
+
+    Returns:
+        tuple: (相関の配列 (n, ラグ数, m), ペア数の配列 (n, ラグ数, m))
+    """
+    import numpy as np
+
+    n_x, n_y = x.shape[1], y.shape[1]
+    # 桁落ちを避けるため、各列の平均を引いてから積和を取る（相関は平行移動に依存しない）
+    x = x - _column_means(x)
+    y = y - _column_means(y)
+    ys = lagged_stack(y, lags)
+
+    mx, my = ~np.isnan(x), ~np.isnan(ys)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, ys, 0.0)
+    mx, my = mx.astype(np.float64), my.astype(np.float64)
+
+    count = mx.T @ my
+    sum_x = x0.T @ my
+    sum_y = mx.T @ y0
+    sum_xx = (x0 * x0).T @ my
+    sum_yy = mx.T @ (y0 * y0)
+    sum_xy = x0.T @ y0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = count * sum_xy - sum_x * sum_y
+        var_x = count * sum_xx - sum_x ** 2
+        var_y = count * sum_yy - sum_y ** 2
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(count < min_obs) | ~np.isfinite(corr)] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+
+    shape = (n_x, len(lags), n_y)
+    return corr.reshape(shape), count.reshape(shape)
+
+
+def _cache_key(panel_path, params):
+    hasher = hashlib.sha256()
+    with open(panel_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    hasher.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+@metrics.timed()
+def build_lead_lag(freq='M', max_lag=None, transform='level', full=False):
+    """
+    パネルの全系列の組み合わせのラグ付き相関を計算して保存する
+
+    Returns:
+        list: 出力ファイルのパス
+    """
+    import numpy as np
+    import pandas as pd
+
+    max_lag = DEFAULT_MAX_LAG[freq] if max_lag is None else max_lag
+    filename, _ = panel.OUTPUTS[freq]
+    panel_path = os.path.join(panel.panel_dir, filename)
+    output_csv = os.path.join(analytics_dir, f"lead_lag_{freq}.csv")
+    best_csv = os.path.join(analytics_dir, f"lead_lag_best_{freq}.csv")
+
+    params = {'freq': freq, 'max_lag': max_lag, 'transform': transform, 'min_obs': MIN_OBSERVATIONS}
+    key = _cache_key(panel_path, params)
+    cache_path = os.path.join(analytics_dir, f".lead_lag_{freq}.key")
+    if not full and os.path.exists(cache_path) and os.path.exists(output_csv) and os.path.exists(best_csv):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            if f.read().strip() == key:
+                metrics.cache_hit('lead_lag')
+                print(f"入力に変更がないため、計算をスキップします: {output_csv}")
+                return [output_csv, best_csv]
+    metrics.cache_hit('lead_lag', hit=False)
+
+    df = panel.load_panel(freq)
+    names = list(df.columns)
+    values = transform_matrix(df.to_numpy(dtype=np.float64), transform, freq)
+    lags = list(range(-max_lag, max_lag + 1))
+    corr, count = lagged_correlations(values, values, lags)
+
+    # 全組み合わせ・全ラグを縦持ちにする
+    i, k, j = np.indices(corr.shape)
+    result_df = pd.DataFrame({
+        'leader': np.array(names)[i.ravel()],
+        'target': np.array(names)[j.ravel()],
+        'lag': np.array(lags)[k.ravel()],
+        'corr': corr.ravel().round(4),
+        'n': count.ravel().astype(int),
+    })
+    result_df = result_df[(result_df['leader'] != result_df['target']) & result_df['corr'].notna()]
+
+    # 組み合わせごとに相関の絶対値が最大のラグ
+    best_index = result_df['corr'].abs().groupby([result_df['leader'], result_df['target']]).idxmax()
+    best_df = result_df.loc[best_index.to_numpy()].sort_values(['leader', 'target'])
+
+    os.makedirs(analytics_dir, exist_ok=True)
+    output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
+    output_writer.write_csv(best_df, best_csv, index=False, encoding='utf-8')
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        f.write(key + '\n')
+
+    print(f"保存しました: {output_csv}（{len(names)}系列 × {len(lags)}ラグ）")
+    print(f"保存しました: {best_csv}")
+    return [output_csv, best_csv]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="パネルの全系列の組み合わせのラグ付き相関を計算する")
+    parser.add_argument('--freq', choices=sorted(DEFAULT_MAX_LAG), default=None, help="頻度（省略時は月次と四半期）")
+    parser.add_argument('--max-lag', type=int, default=None, help="最大ラグ（期間数）")
+    parser.add_argument('--transform', choices=['level', 'diff', 'yoy'], default='level', help="相関を取る前の変換")
+    parser.add_argument('--full', action='store_true', help="キャッシュを使わずに計算する")
+    args = parser.parse_args()
+
+    freqs = [args.freq] if args.freq else list(DEFAULT_MAX_LAG)
+    for freq in freqs:
+        build_lead_lag(freq, max_lag=args.max_lag, transform=args.transform, full=args.full)
+    return True
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+metrics.py - get_* / process_* の各処理（ステージ）の計測と実行レポートの出力
+
+各ステージの実行時間・状態、取得元ホストごとのHTTPバイト数とレイテンシ、
+処理した行数、キャッシュのヒット数、出力ファイルのサイズを記録し、
+プロセス終了時に機械可読なJSONの実行レポートを書き出す。
+
+環境変数:
+    BOJDATA_RUN_ID:  実行ID。同じIDの複数プロセスの結果は1つのレポートにまとめる
+    BOJDATA_REPORT:  レポートの出力先（既定: reports/run_report.json）
+    BOJDATA_EVENTS:  指定すると各イベントをJSON Linesで追記する
+    BOJDATA_PROFILE: 指定すると最上位のステージごとにプロファイルを保存する（--profile と同じ、profiling.py）
+
+使い方:
+    @metrics.timed()
+    def process_something(...):
+        ...
+        metrics.record_output(output_file, rows=len(result_df))
+"""
+
+import atexit
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import profiling
+
+# プロジェクトのルートディレクトリとレポートの出力先
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+reports_dir = os.path.join(project_root, "reports")
+
+_lock = threading.RLock()
+_local = threading.local()
+_state = {
+    'run_id': None,
+    'started_at': None,
+    'stages': {},
+    'http': {},
+    'cache': {},
+    'outputs': {},
+    'sources': {},
+}
+_registered = False
+_http_hook_installed = False
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _ensure_started():
+    """最初の記録時に実行IDを決め、終了時のレポート出力を登録する"""
+    global _registered
+    with _lock:
+        if _registered:
+            return
+        _registered = True
+        _state['run_id'] = os.environ.get('BOJDATA_RUN_ID') or datetime.now().strftime('%Y%m%dT%H%M%S')
+        _state['started_at'] = _now()
+        atexit.register(write_report)
+        _install_http_hook()
+
+
+def _relative(path):
+    """プロジェクトルートからの相対パス（レポートを実行環境に依存させない）"""
+    path = os.path.abspath(str(path))
+    if path.startswith(project_root + os.sep):
+        return os.path.relpath(path, project_root).replace(os.sep, '/')
+    return path
+
+
+def emit(event, **fields):
+    """イベントをJSON Linesに追記する（BOJDATA_EVENTS が設定されている場合のみ）"""
+    events_path = os.environ.get('BOJDATA_EVENTS')
+    if not events_path:
+        return
+    record = {'ts': time.time(), 'run_id': _state['run_id'], 'event': event}
+    record.update(fields)
+    line = json.dumps(record, ensure_ascii=False, sort_keys=True)
+    with _lock:
+        os.makedirs(os.path.dirname(os.path.abspath(events_path)), exist_ok=True)
+        with open(events_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def current_stage():
+    """実行中のステージ名（ネストしている場合は最も内側）"""
+    stack = getattr(_local, 'stack', [])
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def stage(name):
+    """
+    ステージの実行時間と状態を記録するコンテキストマネージャー
+
+    同じ名前のステージが複数回実行された場合は回数と合計時間を記録する。
+    """
+    _ensure_started()
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    top_level = not stack
+    stack.append(name)
+
+    with _lock:
+        entry = _state['stages'].setdefault(name, {
+            'calls': 0, 'wall_time': 0.0, 'rows': 0, 'status': 'ok', 'started_at': _now(),
+        })
+        entry['calls'] += 1
+    emit('stage_start', stage=name)
+
+    started = time.perf_counter()
+    status = 'ok'
+    profile_files = []
+    try:
+        with ExitStack() as profile_context:
+            if top_level and profiling.enabled():
+                profile_files = profile_context.enter_context(profiling.profile_stage(name, _state['run_id']))
+            yield entry
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        with _lock:
+            if profile_files:
+                entry['profile'] = [_relative(path) for path in profile_files]
+            entry['wall_time'] = round(entry['wall_time'] + elapsed, 4)
+            # 一度でも例外で終了したステージはエラーとして残す
+            if status == 'error':
+                entry['status'] = 'error'
+        emit('stage_end', stage=name, wall_time=round(elapsed, 4), status=status)
+
+
+def _stage_name(func):
+    """関数から「スクリプト名.関数名」のステージ名を作る（__main__ として実行されても同じ名前）"""
+    module = os.path.splitext(os.path.basename(inspect.getfile(func)))[0]
+    return f"{module}.{func.__name__}"
+
+
+def timed(name=None, check_result=True):
+    """
+    関数の実行をステージとして記録するデコレーター
+
+    Args:
+        name: ステージ名（省略時は「スクリプト名.関数名」）
+        check_result: Trueの場合、NoneやFalseを返したときにステージを失敗として記録する
+    """
+    def decorator(func):
+        stage_name = name or _stage_name(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as entry:
+                result = func(*args, **kwargs)
+                if check_result and (result is None or result is False):
+                    with _lock:
+                        entry['status'] = 'failed'
+                return result
+        return wrapper
+    return decorator
+
+
+def add_rows(rows, stage_name=None):
+    """ステージで処理した行数を加算する"""
+    _ensure_started()
+    stage_name = stage_name or current_stage()
+    if stage_name is None:
+        return
+    with _lock:
+        entry = _state['stages'].setdefault(stage_name, {'calls': 0, 'wall_time': 0.0, 'rows': 0, 'status': 'ok'})
+        entry['rows'] += int(rows)
+
+
+def record_http(url, nbytes, latency, status_code):
+    """HTTPリクエストの結果をホストごとに集計する"""
+    _ensure_started()
+    host = urlsplit(url).netloc
+    # リプレイサーバー経由の場合は本来のホスト名で集計する
+    base_url = os.environ.get('BOJDATA_BASE_URL')
+    if base_url and url.startswith(base_url):
+        host = url[len(base_url):].lstrip('/').split('/', 1)[0]
+    with _lock:
+        entry = _state['http'].setdefault(host, {
+            'requests': 0, 'bytes': 0, 'errors': 0, 'latency_total': 0.0, 'latency_max': 0.0,
+        })
+        entry['requests'] += 1
+        entry['bytes'] += int(nbytes or 0)
+        if status_code is None or status_code >= 400:
+            entry['errors'] += 1
+        entry['latency_total'] = round(entry['latency_total'] + latency, 4)
+        entry['latency_max'] = round(max(entry['latency_max'], latency), 4)
+    emit('http', host=host, url=url, bytes=int(nbytes or 0), latency=round(latency, 4),
+         status=status_code, stage=current_stage())
+
+
+def cache_hit(name, hit=True):
+    """キャッシュのヒット・ミスを記録する"""
+    _ensure_started()
+    with _lock:
+        entry = _state['cache'].setdefault(name, {'hits': 0, 'misses': 0})
+        entry['hits' if hit else 'misses'] += 1
+    emit('cache', name=name, hit=hit, stage=current_stage())
+
+
+def record_output(path, rows=None, sha256=None, changed=None):
+    """出力ファイルのサイズ・行数・ハッシュを記録する（changed: 内容が変わって書き込んだかどうか）"""
+    _ensure_started()
+    if not os.path.exists(path):
+        return
+    if sha256 is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        sha256 = hasher.hexdigest()
+    entry = {'bytes': os.path.getsize(path), 'sha256': sha256, 'stage': current_stage()}
+    if rows is not None:
+        entry['rows'] = int(rows)
+        add_rows(rows)
+    if changed is not None:
+        entry['changed'] = bool(changed)
+    with _lock:
+        _state['outputs'][_relative(path)] = entry
+    emit('output', path=_relative(path), **entry)
+
+
+def record_source(source, **fields):
+    """
+    データソースの取得・加工の結果（状態、データが古いままかどうか）を記録する
+
+    一度 stale=True を記録したデータソースは、同じ実行の中では後から stale=False を記録しても stale のままにする。
+    """
+    _ensure_started()
+    with _lock:
+        entry = _state['sources'].setdefault(source, {})
+        stale = entry.get('stale', False) or fields.get('stale', False)
+        entry.update(fields)
+        if 'stale' in entry:
+            entry['stale'] = stale
+    emit('source', source=source, **fields)
+
+
+def _install_http_hook():
+    """requestsの全リクエストのバイト数とレイテンシを記録する"""
+    global _http_hook_installed
+    if _http_hook_installed:
+        return
+    _http_hook_installed = True
+    try:
+        import requests
+    except ImportError:
+        return
+
+    original_send = requests.Session.send
+
+    @functools.wraps(original_send)
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = original_send(self, request, **kwargs)
+        except Exception:
+            record_http(request.url, 0, time.perf_counter() - started, None)
+            raise
+        # stream=True の場合は本文を読まずにContent-Lengthで数える
+        if kwargs.get('stream'):
+            nbytes = int(response.headers.get('Content-Length') or 0)
+        else:
+            nbytes = len(response.content or b'')
+        record_http(request.url, nbytes, time.perf_counter() - started, response.status_code)
+        return response
+
+    requests.Session.send = send
+
+
+def _merge(existing, current):
+    """同じ実行IDの既存レポートに今回の結果をまとめる"""
+    merged = dict(existing)
+    merged['stages'] = dict(existing.get('stages', {}), **current['stages'])
+    merged['outputs'] = dict(existing.get('outputs', {}), **current['outputs'])
+    merged['sources'] = {name: dict(values) for name, values in existing.get('sources', {}).items()}
+    for name, values in current['sources'].items():
+        target = merged['sources'].setdefault(name, {})
+        stale = target.get('stale', False) or values.get('stale', False)
+        target.update(values)
+        if 'stale' in target:
+            target['stale'] = stale
+    for key in ('http', 'cache'):
+        combined = {name: dict(values) for name, values in existing.get(key, {}).items()}
+        for name, values in current[key].items():
+            target = combined.setdefault(name, {})
+            for field, value in values.items():
+                if field == 'latency_max':
+                    target[field] = max(target.get(field, 0), value)
+                else:
+                    target[field] = round(target.get(field, 0) + value, 4)
+        merged[key] = combined
+    merged['started_at'] = min(existing.get('started_at') or current['started_at'], current['started_at'])
+    return merged
+
+
+def build_report():
+    """現在までの計測結果をレポートの辞書として返す"""
+    with _lock:
+        stages = {name: dict(entry) for name, entry in _state['stages'].items()}
+        return {
+            'run_id': _state['run_id'],
+            'started_at': _state['started_at'],
+            'finished_at': _now(),
+            'stages': stages,
+            'http': {host: dict(values) for host, values in _state['http'].items()},
+            'cache': {name: dict(values) for name, values in _state['cache'].items()},
+            'outputs': {path: dict(values) for path, values in _state['outputs'].items()},
+            'sources': {source: dict(values) for source, values in _state['sources'].items()},
+        }
+
+
+def write_report(path=None):
+    """実行レポートをJSONで書き出す（同じ実行IDのレポートがあれば統合する）"""
+    if not _registered:
+        return None
+    path = path or os.environ.get('BOJDATA_REPORT') or os.path.join(reports_dir, "run_report.json")
+    report = build_report()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _lock:
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    existing = json.load(f)
+                if existing.get('run_id') == report['run_id']:
+                    report = _merge(existing, report)
+            except (OSError, ValueError):
+                pass
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+output_writer.py - 加工済みのファイルを内容が変わった場合だけアトミックに書き込む
+
+DataFrame.to_csv で出力先に直接書き込むと、内容が同じでも毎回ファイルが書き換わり、
+途中で失敗するとダッシュボードが書きかけのファイルを読んでしまう。ここではCSVをメモリ上で作り、
+既存のファイルと同じ内容なら書き込まず、変わった場合は一時ファイルに書いてから os.replace で置き換える。
+
+CSVの作成には pandas（既定）か pyarrow を使う。環境変数 BOJDATA_CSV_ENGINE で選ぶ。
+    pandas:  常に DataFrame.to_csv（既定。これまでの出力とバイト単位で同じ）
+    auto:    FAST_ENGINE_MIN_ROWS 行以上の出力にだけ pyarrow を使う（インストールされている場合）
+    pyarrow: 常に pyarrow を使う
+pyarrow は文字列を引用符で囲むなど書式が pandas と異なるため、同じファイルには同じ方式を使い続けること。
+pyarrow がない場合や、変換できない列（型の混在した列など）がある場合は pandas で書く。
+
+使い方:
+    output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
+"""
+
+import hashlib
+import os
+
+import metrics
+
+# auto の場合にこの行数以上の出力で pyarrow を使う
+FAST_ENGINE_MIN_ROWS = 100_000
+
+
+def _engine(engine, rows, encoding, index):
+    """使う方式を決める（pyarrow が使えない条件では pandas）"""
+    engine = engine or os.environ.get('BOJDATA_CSV_ENGINE', 'pandas')
+    if engine == 'auto':
+        engine = 'pyarrow' if rows >= FAST_ENGINE_MIN_ROWS else 'pandas'
+    if engine == 'pyarrow' and encoding.replace('-', '').lower() != 'utf8':
+        return 'pandas'
+    return engine
+
+
+def _pyarrow_csv(df, index):
+    """pyarrow でCSVを作る（使えない場合は None）"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return None
+    try:
+        table = pa.Table.from_pandas(df.reset_index() if index else df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+    sink = pa.BufferOutputStream()
+    pacsv.write_csv(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def serialize_csv(df, index=False, encoding='utf-8', engine=None):
+    """DataFrameをCSVのバイト列にする"""
+    if _engine(engine, len(df), encoding, index) == 'pyarrow':
+        payload = _pyarrow_csv(df, index)
+        if payload is not None:
+            return payload
+    return df.to_csv(index=index).encode(encoding)
+
+
+def write_bytes(path, payload):
+    """
+    内容が変わった場合のみ、一時ファイル経由で書き込む
+
+    Returns:
+        bool: 書き込んだ場合True（既存のファイルと同じ内容ならFalse）
+    """
+    path = os.fspath(path)
+    if os.path.exists(path) and os.path.getsize(path) == len(payload):
+        with open(path, 'rb') as f:
+            if f.read() == payload:
+                return False
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_csv(df, path, index=False, encoding='utf-8', engine=None):
+    """
+    DataFrameをCSVとして書き込み、実行レポートに記録する
+
+    Args:
+        df: 出力するDataFrame
+        path: 出力先
+        index: インデックスを出力するか（DataFrame.to_csv と同じ）
+        encoding: 文字コード
+        engine: 'pandas' / 'auto' / 'pyarrow'（省略時は BOJDATA_CSV_ENGINE）
+
+    Returns:
+        bool: 書き込んだ場合True（内容が変わらなかった場合False）
+    """
+    payload = serialize_csv(df, index=index, encoding=encoding, engine=engine)
+    changed = write_bytes(path, payload)
+    metrics.record_output(path, rows=len(df), sha256=hashlib.sha256(payload).hexdigest(), changed=changed)
+    return changed
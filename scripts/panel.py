@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+panel.py - 全データソースの系列を月次・四半期・年次にそろえたワイドパネルを作成するスクリプト
+
+series_store.SERIES の各系列を期間（pandasのPeriodと同じ序数）に変換し、
+系列ごとに宣言した規則（series_store.DEFAULT_RULES）で各頻度に変換して、
+期間を行・系列を列とする表を data/panel/ に保存する。
+
+    data/panel/panel_monthly.csv    月次（年月: YYYY/MM）
+    data/panel/panel_quarterly.csv  四半期（期間: YYYYQn）
+    data/panel/panel_annual.csv     年次（年: YYYY）
+    data/panel/manifest.json        元のファイルのフィンガープリントと出力の一覧
+
+元のファイルごとにSHA-256を manifest.json に記録し、変わったファイルの系列だけを読み直す
+（読み込んだ系列は data/panel/.series/ にキャッシュする）。どのファイルも変わっていなければ何もしない。
+
+使い方:
+    python scripts/panel.py [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import metrics
+import output_writer
+import profiling
+import series_store
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+panel_dir = os.path.join(project_root, "data", "panel")
+
+# 頻度ごとの出力ファイルと期間の列名
+OUTPUTS = {
+    'M': ("panel_monthly.csv", '年月'),
+    'Q': ("panel_quarterly.csv", '期間'),
+    'A': ("panel_annual.csv", '年'),
+}
+
+# 高い頻度から低い頻度へ変換するときの1期間あたりの期間数
+SUB_PERIODS = {('M', 'Q'): 3, ('M', 'A'): 12, ('Q', 'A'): 4}
+
+# 頻度の高い順
+FREQ_ORDER = ['M', 'Q', 'A']
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def convert(ordinals, values, source_freq, target_freq, rules):
+    """
+    系列の頻度を変換する
+
+    Args:
+        ordinals, values: 元の系列（期間の序数と値）
+        source_freq, target_freq: 元の頻度と変換後の頻度
+        rules: series_store.series_rules の規則
+
+    Returns:
+        tuple: (変換後の期間の序数, 値)
+    """
+    import numpy as np
+    import pandas as pd
+
+    if source_freq == target_freq:
+        return ordinals, values
+
+    if FREQ_ORDER.index(source_freq) < FREQ_ORDER.index(target_freq):
+        # 高頻度 -> 低頻度: 規則に従って集計する
+        n = SUB_PERIODS[(source_freq, target_freq)]
+        grouped = pd.Series(values).groupby(ordinals // n)
+        aggregated = grouped.agg(rules['agg'])
+        if rules['require_complete']:
+            aggregated = aggregated[grouped.count() == n]
+        return aggregated.index.to_numpy(dtype=np.int64), aggregated.to_numpy(dtype=np.float64)
+
+    # 低頻度 -> 高頻度: 期末の期間にのみ置くか、期間内のすべての期間に置く
+    n = SUB_PERIODS[(target_freq, source_freq)]
+    if rules['upsample'] == 'ffill':
+        offsets = np.arange(n)
+        return (ordinals[:, None] * n + offsets).ravel(), np.repeat(values, n)
+    return ordinals * n + (n - 1), values
+
+
+def _series_cache_path(name):
+    return os.path.join(panel_dir, ".series", f"{name}.npz")
+
+
+def load_series_cached(name, file_hash, data_root=None, full=False):
+    """元のファイルが変わっていなければキャッシュから系列を返す"""
+    import numpy as np
+
+    cache_path = _series_cache_path(name)
+    if not full and os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as npz:
+            if str(npz['file_hash']) == file_hash:
+                metrics.cache_hit('panel_series')
+                return npz['ordinals'], npz['values']
+
+    metrics.cache_hit('panel_series', hit=False)
+    ordinals, values = series_store.load_series(name, data_root)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez(cache_path, file_hash=np.array(file_hash), ordinals=ordinals, values=values)
+    return ordinals, values
+
+
+def build_frame(series, freq):
+    """変換済みの系列 {名前: (序数, 値)} から期間×系列の表を作る"""
+    import numpy as np
+    import pandas as pd
+
+    non_empty = [ordinals for ordinals, _ in series.values() if len(ordinals)]
+    names = list(series)
+    if not non_empty:
+        return pd.DataFrame(columns=names)
+    start = min(int(ordinals.min()) for ordinals in non_empty)
+    end = max(int(ordinals.max()) for ordinals in non_empty)
+    matrix = np.full((end - start + 1, len(names)), np.nan)
+    for j, (ordinals, values) in enumerate(series.values()):
+        matrix[ordinals - start, j] = values
+    return pd.DataFrame(matrix, columns=names,
+                        index=series_store.to_period_index(np.arange(start, end + 1), freq))
+
+
+def load_panel(freq, data_root=None):
+    """
+    保存済みのパネルをPeriodIndexのDataFrameとして読み込む（ダッシュボードなどの利用側向け）
+    """
+    import pandas as pd
+
+    filename, period_column = OUTPUTS[freq]
+    df = pd.read_csv(os.path.join(data_root or panel_dir, filename), dtype={period_column: str})
+    periods = df.pop(period_column)
+    pandas_freq = series_store.PANDAS_FREQ[freq]
+    df.index = pd.PeriodIndex([p.replace('/', '-') for p in periods], freq=pandas_freq)
+    return df
+
+
+@metrics.timed()
+def build_panel(full=False, data_root=None):
+    """
+    全系列を各頻度に変換してパネルを保存する
+
+    Returns:
+        list: 保存したファイルのパス（元のファイルが変わっていなければ空）
+    """
+    root = data_root or series_store.data_dir
+    manifest_path = os.path.join(panel_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path) and not full:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    # 元のファイルのフィンガープリント
+    files = sorted({spec['file'] for spec in series_store.SERIES.values()})
+    fingerprints = {}
+    for filename in files:
+        path = os.path.join(root, filename)
+        fingerprints[filename] = file_sha256(path) if os.path.exists(path) else None
+
+    previous = manifest.get('sources', {})
+    changed = [filename for filename in files if previous.get(filename) != fingerprints[filename]]
+    outputs_exist = all(os.path.exists(os.path.join(panel_dir, filename)) for filename, _ in OUTPUTS.values())
+    rules = {name: series_store.series_rules(name) for name in series_store.SERIES}
+    if not changed and outputs_exist and manifest.get('rules') == rules:
+        print("元のファイルに変更がないため、パネルは最新です")
+        return []
+    print(f"変更された元のファイル: {', '.join(changed) if changed else 'なし（出力を作り直します）'}")
+
+    # 変わったファイルの系列だけを読み直す
+    loaded = {}
+    for name, spec in series_store.SERIES.items():
+        file_hash = fingerprints[spec['file']]
+        if file_hash is None:
+            print(f"ファイルが見つからないため {name} をスキップします: {spec['file']}")
+            continue
+        loaded[name] = load_series_cached(name, file_hash, data_root, full=full)
+
+    os.makedirs(panel_dir, exist_ok=True)
+    output_files = []
+    for freq, (filename, period_column) in OUTPUTS.items():
+        converted = {
+            name: convert(ordinals, values, series_store.SERIES[name]['freq'], freq, series_store.series_rules(name))
+            for name, (ordinals, values) in loaded.items()
+        }
+        panel = build_frame(converted, freq).round(6)
+        panel = panel.dropna(how='all')
+        labels = [series_store.period_label(p.ordinal, freq) for p in panel.index]
+        panel.insert(0, period_column, labels)
+
+        output_csv = os.path.join(panel_dir, filename)
+        output_writer.write_csv(panel, output_csv, index=False, encoding='utf-8')
+        print(f"保存しました: {output_csv}（{len(panel)}期間 × {len(loaded)}系列）")
+        output_files.append(output_csv)
+
+    manifest = {
+        'sources': fingerprints,
+        'rules': rules,
+        'outputs': [os.path.relpath(path, project_root).replace(os.sep, '/') for path in output_files],
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, manifest_path)
+    return output_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全データソースの系列をそろえたワイドパネルを作成する")
+    parser.add_argument('--full', action='store_true', help="キャッシュを使わずにすべての系列を読み直す")
+    args = parser.parse_args()
+    build_panel(full=args.full)
+    return True
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
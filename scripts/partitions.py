@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+partitions.py - 加工済みのCSVを年ごとのファイルに分けて保存するスクリプト
+
+毎週のコミットで data/*.csv 全体が書き換わらないように、各CSVを年ごとのファイルに分けて
+data/partitioned/<ファイル名（拡張子なし）>/ に保存する。新しい月のデータが追加されても、
+変わるのはその年のファイルだけになる。
+
+    data/partitioned/<名前>/_header.csv  列名の行と、日付のない先頭の行（日銀の表の系列名称など）
+    data/partitioned/<名前>/<年>.csv      列名の行と、その年の行
+    data/partitioned/index.json          ファイルごとの年の一覧と各ファイルのSHA-256
+
+行の文字列は元のCSVのまま変えずに分けるため、restore で元のCSVとバイト単位で同じファイルに戻せる
+（改行は LF にそろえ、年は昇順、同じ年の中は元の順序）。日付のない行は直前の行と同じ年に入れる。
+内容が変わらない年のファイルは書き換えない。
+
+使い方:
+    python scripts/partitions.py write            # data/*.csv を年ごとに分ける
+    python scripts/partitions.py restore [--out-dir DIR]  # 年ごとのファイルから元のCSVを作る
+    python scripts/partitions.py verify           # 分けたファイルから元のCSVに戻せるか確認する
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+
+import metrics
+import output_writer
+import profiling
+import series_store
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+partitioned_dir = os.path.join(data_dir, "partitioned")
+
+# e-Statの表形式（時間軸コード 'YYYY00MMMM' の列）のCSV
+ESTAT_LAYOUT = {'column_index': 7, 'pattern': re.compile(r'^(\d{4})\d{6}$')}
+
+
+def partition_specs():
+    """
+    年ごとに分けるCSVと、年を取り出す列の定義
+
+    series_store.SERIES のファイルは日付の列と形式を共有し、e-Statの中分類指数の表は時間軸コードの列を使う。
+
+    Returns:
+        dict: ファイル名 -> {'column': 列名} または {'column_index': 列番号}, 'pattern': 年を取り出す正規表現
+    """
+    specs = {}
+    for spec in series_store.SERIES.values():
+        specs.setdefault(spec['file'], {
+            'column': spec['date_column'],
+            'pattern': series_store.DATE_PATTERNS[spec['date_format']],
+        })
+    # process_cpi.py の中間ファイル（CPI_総合_統合.csv と同じ形式）
+    for filename in ["CPI_総合_前年同月比.csv", "CPI_総合_指数.csv"]:
+        specs.setdefault(filename, {'column': '年月', 'pattern': series_store.DATE_PATTERNS['YYYY/MM']})
+    for filename in ["CPI_中分類指数_全国_月次.csv", "CPI_中分類指数_全国_月次_前年同月比.csv",
+                     "CPI_中分類指数_全国_月次_前月比.csv", "CPI_中分類指数_全国_月次_指数.csv"]:
+        specs[filename] = ESTAT_LAYOUT
+    return specs
+
+
+def _records(text):
+    """CSVの文字列を行ごとの文字列に分ける（引用符の中の改行では分けない）"""
+    records, pending = [], ''
+    for line in text.split('\n'):
+        pending = pending + '\n' + line if pending else line
+        if pending.count('"') % 2 == 0:
+            records.append(pending)
+            pending = ''
+    if pending:
+        records.append(pending)
+    if records and records[-1] == '':
+        records.pop()
+    return records
+
+
+def split_by_year(text, spec):
+    """
+    CSVの文字列を年ごとの行に分ける
+
+    Returns:
+        tuple: (列名の行, 日付のない先頭の行のリスト, {年: 行のリスト})
+    """
+    records = _records(text.replace('\r\n', '\n'))
+    if not records:
+        return '', [], {}
+    header, rows = records[0], records[1:]
+    columns = next(csv.reader([header]))
+    column_index = spec['column_index'] if 'column_index' in spec else columns.index(spec['column'])
+
+    preamble, years = [], {}
+    current = None
+    for row in rows:
+        cells = next(csv.reader([row]), [])
+        match = spec['pattern'].match(cells[column_index].strip()) if len(cells) > column_index else None
+        if match:
+            current = match.group(1)
+        if current is None:
+            preamble.append(row)
+        else:
+            years.setdefault(current, []).append(row)
+    return header, preamble, years
+
+
+def _join(lines):
+    return ''.join(line + '\n' for line in lines).encode('utf-8')
+
+
+def _load_index():
+    index_path = os.path.join(partitioned_dir, "index.json")
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@metrics.timed()
+def write_partitions(filenames=None):
+    """
+    CSVを年ごとのファイルに分けて保存する
+
+    Returns:
+        list: 書き込んだファイルのパス
+    """
+    specs = partition_specs()
+    index = _load_index()
+    written = []
+    for filename in filenames or sorted(specs):
+        path = os.path.join(data_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            header, preamble, years = split_by_year(f.read(), specs[filename])
+
+        name = os.path.splitext(filename)[0]
+        target_dir = os.path.join(partitioned_dir, name)
+        os.makedirs(target_dir, exist_ok=True)
+        parts = {'_header': _join([header] + preamble)}
+        parts.update({year: _join([header] + rows) for year, rows in years.items()})
+
+        for part, payload in parts.items():
+            part_path = os.path.join(target_dir, f"{part}.csv")
+            if output_writer.write_bytes(part_path, payload):
+                metrics.record_output(part_path, rows=payload.count(b'\n') - 1)
+                written.append(part_path)
+        # なくなった年のファイルを削除する
+        for existing in os.listdir(target_dir):
+            if existing.endswith('.csv') and existing[:-len('.csv')] not in parts:
+                os.remove(os.path.join(target_dir, existing))
+
+        index[filename] = {
+            'dir': name,
+            'partitions': {part: hashlib.sha256(payload).hexdigest() for part, payload in sorted(parts.items())},
+        }
+
+    index_payload = (json.dumps(index, ensure_ascii=False, indent=2, sort_keys=True) + '\n').encode('utf-8')
+    os.makedirs(partitioned_dir, exist_ok=True)
+    output_writer.write_bytes(os.path.join(partitioned_dir, "index.json"), index_payload)
+    print(f"年ごとのファイル: {len(index)}件のCSV, 書き込み {len(written)}ファイル: {partitioned_dir}")
+    return written
+
+
+def restore_text(filename, index=None):
+    """年ごとのファイルから元のCSVのバイト列を作る"""
+    entry = (index or _load_index())[filename]
+    target_dir = os.path.join(partitioned_dir, entry['dir'])
+    with open(os.path.join(target_dir, "_header.csv"), 'rb') as f:
+        content = f.read()
+    for part in sorted(entry['partitions']):
+        if part == '_header':
+            continue
+        with open(os.path.join(target_dir, f"{part}.csv"), 'rb') as f:
+            f.readline()  # 列名の行
+            content += f.read()
+    return content
+
+
+@metrics.timed()
+def restore(out_dir=None):
+    """年ごとのファイルから元のCSVを作り直す（内容が同じファイルは書き換えない）"""
+    out_dir = out_dir or data_dir
+    os.makedirs(out_dir, exist_ok=True)
+    restored = []
+    index = _load_index()
+    for filename in sorted(index):
+        path = os.path.join(out_dir, filename)
+        if output_writer.write_bytes(path, restore_text(filename, index)):
+            metrics.record_output(path)
+            restored.append(path)
+    print(f"{len(restored)}件のCSVを作り直しました: {out_dir}")
+    return restored
+
+
+def verify():
+    """元のCSV（改行をLFにそろえたもの）と、年ごとのファイルから作ったCSVが一致するか確認する"""
+    mismatched = []
+    index = _load_index()
+    for filename in sorted(index):
+        path = os.path.join(data_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            original = f.read().replace(b'\r\n', b'\n')
+        if original and not original.endswith(b'\n'):
+            original += b'\n'
+        if restore_text(filename, index) != original:
+            mismatched.append(filename)
+            print(f"一致しません: {filename}")
+    print(f"確認しました: {len(index) - len(mismatched)}/{len(index)}件が一致")
+    return not mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="加工済みのCSVを年ごとのファイルに分けて保存する")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('write', help="data/*.csv を年ごとに分ける")
+    restore_parser = subparsers.add_parser('restore', help="年ごとのファイルから元のCSVを作る")
+    restore_parser.add_argument('--out-dir', default=None, help="出力先（省略時は data/）")
+    subparsers.add_parser('verify', help="年ごとのファイルから元のCSVに戻せるか確認する")
+    args = parser.parse_args()
+
+    if args.command == 'write':
+        write_partitions()
+        return True
+    if args.command == 'restore':
+        restore(args.out_dir)
+        return True
+    return verify()
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    sys.exit(0 if main() else 1)
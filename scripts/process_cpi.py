@@ -1,27 +1,24 @@
-import pandas as pd
 import os
 import re
 from datetime import datetime, timedelta
 
-def transform_cpi_csv(input_csv, output_csv, data_type="前年同月比"):
+import layout_cache
+import metrics
+import output_writer
+import profiling
+
+
+def detect_layout(df):
     """
-    CPIデータを変換するメイン関数
-    
-    Args:
-        input_csv: 入力CSVファイルパス
-        output_csv: 出力CSVファイルパス
-        data_type: データタイプ（"前年同月比"または"指数"）
+    「時間軸コード」のセル（実データの開始行と年月の列）と、類・品目の行の「総合」の列を探す
+
+    Returns:
+        tuple: (配置, アンカーのセルの位置)。時間軸コードが見つからなければ None
     """
-    # CSVファイルの読み込み
-    df = pd.read_csv(input_csv)
-    
-    print(f"読み込んだCSVの列数: {len(df.columns)}")
-    
-    # データの前処理
     # 実データの開始行を特定（「時間軸コード」が含まれる行）
     start_row = None
     time_col_index = None
-    for i, row in df.iterrows():
+    for i, row in enumerate(df.itertuples(index=False)):
         for j, val in enumerate(row):
             if isinstance(val, str) and '時間軸コード' in str(val):
                 start_row = i
@@ -29,24 +26,55 @@ def transform_cpi_csv(input_csv, output_csv, data_type="前年同月比"):
                 break
         if start_row is not None:
             break
-    
     if start_row is None:
-        print("時間軸コードの列が見つかりませんでした")
-        return False
-    
-    print(f"データ開始行: {start_row}, 時間軸コード列インデックス: {time_col_index}")
-    
+        return None
+
     # 「総合」列のインデックスを見つける
     total_col_index = None
-    for j, val in enumerate(df.iloc[start_row-2]):  # 類・品目の行
-        if isinstance(val, str) and '総合' in str(val):
-            total_col_index = j
-            break
-    
+    if start_row >= 2:
+        for j, val in enumerate(df.iloc[start_row-2]):  # 類・品目の行
+            if isinstance(val, str) and '総合' in str(val):
+                total_col_index = j
+                break
+    anchors = [(start_row, time_col_index)]
     if total_col_index is None:
         print("総合列が見つかりませんでした。12列目を使用します")
         total_col_index = 12  # デフォルト値
+    else:
+        anchors.append((start_row - 2, total_col_index))
+
+    layout = {'start_row': start_row, 'time_col_index': time_col_index, 'total_col_index': total_col_index}
+    return layout, anchors
+
+
+@metrics.timed()
+def transform_cpi_csv(input_csv, output_csv, data_type="前年同月比"):
+    """
+    CPIデータを変換するメイン関数
+    
+    Args:
+        input_csv: 入力CSVファイルパス
+        output_csv: 出力CSVファイルパス
+        data_type: データタイプ（"前年同月比"または"指数"）
+    """
+    import pandas as pd
+    
+    # CSVファイルの読み込み
+    df = pd.read_csv(input_csv)
     
+    print(f"読み込んだCSVの列数: {len(df.columns)}")
+    
+    # データの前処理
+    # 実データの開始行と「総合」列の位置（前回と同じ配置ならキャッシュを使う）
+    layout = layout_cache.resolve(f"process_cpi.{data_type}", df, None, detect_layout)
+    if layout is None:
+        print("時間軸コードの列が見つかりませんでした")
+        return False
+    start_row = layout['start_row']
+    time_col_index = layout['time_col_index']
+    total_col_index = layout['total_col_index']
+    
+    print(f"データ開始行: {start_row}, 時間軸コード列インデックス: {time_col_index}")
     print(f"総合列インデックス: {total_col_index}")
     
     # データの抽出
@@ -93,7 +121,7 @@ def transform_cpi_csv(input_csv, output_csv, data_type="前年同月比"):
     })
     
     # CSVに保存
-    result_df.to_csv(output_csv, index=False, encoding='utf-8')
+    output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
     print(f"変換完了: {output_csv}")
     print(f"抽出したデータ数: {len(result_df)}")
     
@@ -106,6 +134,7 @@ def transform_cpi_csv(input_csv, output_csv, data_type="前年同月比"):
     
     return True
 
+@metrics.timed()
 def merge_cpi_data(yoy_csv, index_csv, output_csv):
     """
     前年同月比データと指数データを結合する
@@ -115,6 +144,8 @@ def merge_cpi_data(yoy_csv, index_csv, output_csv):
         index_csv: 指数CSVファイルパス
         output_csv: 出力CSVファイルパス
     """
+    import pandas as pd
+    
     try:
         # 前年同月比データ読み込み
         yoy_df = pd.read_csv(yoy_csv)
@@ -131,7 +162,7 @@ def merge_cpi_data(yoy_csv, index_csv, output_csv):
             print(f"結合後のデータに {missing_count} 個の欠損値があります")
             
         # 結合データを保存
-        merged_df.to_csv(output_csv, index=False, encoding='utf-8')
+        output_writer.write_csv(merged_df, output_csv, index=False, encoding='utf-8')
         print(f"結合完了: {output_csv}")
         print(f"結合データ数: {len(merged_df)}")
         
@@ -146,7 +177,7 @@ def merge_cpi_data(yoy_csv, index_csv, output_csv):
         print(f"データ結合中にエラーが発生しました: {e}")
         return False
 
-if __name__ == "__main__":
+def main():
     # プロジェクトのルートディレクトリへのパスを設定
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(script_dir)
@@ -257,4 +288,11 @@ if __name__ == "__main__":
         print(f"出力ファイル: {output_merged_csv}")
         merge_cpi_data(output_yoy_csv, output_index_csv, output_merged_csv)
     else:
-        print("\n前年同月比と指数の両方のデータが揃っていないため、結合処理はスキップされました")
\ No newline at end of file
+        print("\n前年同月比と指数の両方のデータが揃っていないため、結合処理はスキップされました")
+    
+    return yoy_success and index_success
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
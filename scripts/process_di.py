@@ -7,11 +7,26 @@ CSVとして保存するスクリプト
 """
 
 import os
-import pandas as pd
 import pathlib
 import re
-import numpy as np
+import unicodedata
 
+import layout_cache
+import metrics
+import output_writer
+import profiling
+
+# 抽出する列（出力する列名 -> (指数のグループの見出し, 指数の見出し)）
+INDEX_COLUMNS = {
+    'CI_先行指数': ('CI指数', '先行指数'),
+    'CI_一致指数': ('CI指数', '一致指数'),
+    'CI_遅行指数': ('CI指数', '遅行指数'),
+    'DI_先行指数': ('DI指数', '先行指数'),
+    'DI_一致指数': ('DI指数', '一致指数'),
+    'DI_遅行指数': ('DI指数', '遅行指数'),
+}
+
+@metrics.timed(check_result=False)
 def main():
     print("CI指数とDI指数のデータ処理を開始します...")
     
@@ -45,8 +60,11 @@ def main():
     except Exception as e:
         print(f"Excelファイルの処理に失敗しました: {e}")
 
+@metrics.timed()
 def process_paste_file(paste_file, data_dir):
     """paste.txtファイルを処理する"""
+    import pandas as pd
+    
     with open(paste_file, 'r', encoding='utf-8') as f:
         paste_content = f.read()
     
@@ -176,26 +194,22 @@ def process_paste_file(paste_file, data_dir):
     
     # CSVとして保存
     output_file = data_dir / "景気動向指数.csv"
-    result_df.to_csv(output_file, index=False, encoding='utf-8')
+    output_writer.write_csv(result_df, output_file, index=False, encoding='utf-8')
     
     print(f"処理が完了しました。データは {output_file} に保存されました。")
     print(f"データ件数: {len(result_df)}行")
     return True
 
-def process_excel_file(excel_file, data_dir):
-    """Excelファイルを処理する"""
-    # Excelファイルを読み込む
-    print("Excelファイルを読み込んでいます...")
-    try:
-        # シート名を取得
-        xl = pd.ExcelFile(excel_file)
-        sheet_name = xl.sheet_names[0]  # 最初のシートを使用
-        df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
-        print(f"シート '{sheet_name}' を読み込みました。")
-    except Exception as e:
-        print(f"Excelファイルの読み込みに失敗しました: {e}")
-        return False
-    
+def detect_excel_layout(df):
+    """
+    見出しの行・年と月の列・各指数の列を探す
+
+    指数の列は、見出しの行より上にあるグループの見出し（「ＣＩ指数」「ＤＩ指数」、全角・半角は区別しない）と
+    見出しの行の「先行指数」などが一致する列。「(参考)「外れ値」処理なしＣＩ指数」や「ＤＩ累積指数」の列は使わない。
+
+    Returns:
+        tuple: (配置, アンカーのセルの位置)。見つからなければ None
+    """
     # ヘッダー行を探す
     header_row = None
     for i in range(min(10, len(df))):
@@ -203,44 +217,79 @@ def process_excel_file(excel_file, data_dir):
         if row_values.str.contains('先行指数').any() and row_values.str.contains('一致指数').any() and row_values.str.contains('遅行指数').any():
             header_row = i
             break
-    
     if header_row is None:
-        print("ヘッダー行が見つかりませんでした。")
-        return False
-    
-    # 固定列インデックスを使用（スクリーンショットから判断）
-    # CI指数: D, E, F列 (3, 4, 5)
-    # DI指数: J, K, L列 (9, 10, 11)
-    
-    column_indices = {
-        'CI_先行指数': 3,  # D列
-        'CI_一致指数': 4,  # E列
-        'CI_遅行指数': 5,  # F列
-        'DI_先行指数': 9,  # J列
-        'DI_一致指数': 10, # K列
-        'DI_遅行指数': 11, # L列
-    }
-    
+        return None
+
     # 時間軸の列を特定
-    time_col = None
     year_col = None
     month_col = None
-    
     for j in range(len(df.columns)):
         cell_value = str(df.iloc[header_row, j])
         if "時間軸コード" in cell_value or "Time" in cell_value:
-            time_col = j
-        elif "西暦年" in cell_value or "Calendar" in cell_value:
+            continue
+        if "西暦年" in cell_value or "Calendar" in cell_value:
             year_col = j
         elif "月" in cell_value or "Month" in cell_value:
             month_col = j
-    
     if year_col is None or month_col is None:
-        print("年・月の列が見つかりませんでした。")
+        return None
+
+    # グループの見出しは結合セルの左端にだけ値がある場合もあるため、右へ引き継ぐ
+    anchors = [(header_row, year_col), (header_row, month_col)]
+    column_indices = {}
+    for group_row in range(header_row):
+        group = ''
+        for j in range(len(df.columns)):
+            text = unicodedata.normalize('NFKC', layout_cache.cell_text(df, group_row, j))
+            if text:
+                group = text
+            for name, (group_label, index_label) in INDEX_COLUMNS.items():
+                if name not in column_indices and group == group_label \
+                        and layout_cache.cell_text(df, header_row, j) == index_label:
+                    column_indices[name] = j
+                    anchors.extend([(group_row, j), (header_row, j)])
+        if len(column_indices) == len(INDEX_COLUMNS):
+            break
+    else:
+        return None
+
+    layout = {
+        'header_row': header_row,
+        'year_col': year_col,
+        'month_col': month_col,
+        'column_indices': column_indices,
+        # データの開始行（ヘッダー行の2行後から。年・月のない行は読み飛ばす）
+        'data_start_row': header_row + 2,
+    }
+    return layout, anchors
+
+
+@metrics.timed()
+def process_excel_file(excel_file, data_dir):
+    """Excelファイルを処理する"""
+    import pandas as pd
+    
+    # Excelファイルを読み込む
+    print("Excelファイルを読み込んでいます...")
+    try:
+        # シート名を取得
+        xl = pd.ExcelFile(excel_file)
+        sheet_name = xl.sheet_names[0]  # 最初のシートを使用
+        df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
+        print(f"シート '{sheet_name}' を読み込みました。")
+    except Exception as e:
+        print(f"Excelファイルの読み込みに失敗しました: {e}")
         return False
     
-    # データの開始行を特定（ヘッダー行の2行後から）
-    data_start_row = header_row + 2
+    # 見出しと列の位置（前回と同じ配置ならキャッシュを使う）
+    layout = layout_cache.resolve('process_di', df, sheet_name, detect_excel_layout)
+    if layout is None:
+        print("ヘッダー行、年・月の列、または指数の列が見つかりませんでした。")
+        return False
+    column_indices = layout['column_indices']
+    year_col = layout['year_col']
+    month_col = layout['month_col']
+    data_start_row = layout['data_start_row']
     
     # データを抽出
     data = []
@@ -307,11 +356,12 @@ def process_excel_file(excel_file, data_dir):
     
     # CSVとして保存
     output_file = data_dir / "景気動向指数.csv"
-    result_df.to_csv(output_file, index=False, encoding='utf-8')
+    output_writer.write_csv(result_df, output_file, index=False, encoding='utf-8')
     
     print(f"処理が完了しました。データは {output_file} に保存されました。")
     print(f"データ件数: {len(result_df)}行")
     return True
 
 if __name__ == "__main__":
+    profiling.consume_flag()
     main()
\ No newline at end of file
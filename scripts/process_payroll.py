@@ -1,7 +1,11 @@
-import pandas as pd
 import os
 import re
 
+import metrics
+import output_writer
+import profiling
+
+@metrics.timed()
 def extract_and_save_tl_data(excel_file, output_csv=None):
     """
     毎月勤労統計調査Excelファイルから年平均データを抽出し、CSVとして保存する
@@ -13,6 +17,8 @@ def extract_and_save_tl_data(excel_file, output_csv=None):
     Returns:
         str: 保存したCSVファイルのパス
     """
+    import pandas as pd
+    
     if output_csv is None:
         # 出力ファイル名の設定（デフォルト）
         dir_name = os.path.dirname(excel_file)
@@ -111,7 +117,7 @@ def extract_and_save_tl_data(excel_file, output_csv=None):
         result_df = pd.DataFrame(merged_data)
         
         # CSVに保存
-        result_df.to_csv(output_csv, index=False, encoding='utf-8')
+        output_writer.write_csv(result_df, output_csv, index=False, encoding='utf-8')
         print(f"データをCSVに保存しました: {output_csv}")
         
         return output_csv
@@ -121,7 +127,7 @@ def extract_and_save_tl_data(excel_file, output_csv=None):
         return None
 
 # メイン実行部分
-if __name__ == "__main__":
+def main():
     # ダウンロードしたExcelファイルのパス
     excel_file = os.path.join(os.getcwd(), "data", "毎月勤労統計調査.xlsx")
     
@@ -131,4 +137,11 @@ if __name__ == "__main__":
     if csv_file:
         print(f"年平均データを正常に抽出しました: {csv_file}")
     else:
-        print("データの抽出に失敗しました")
\ No newline at end of file
+        print("データの抽出に失敗しました")
+    
+    return bool(csv_file)
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
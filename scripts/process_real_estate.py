@@ -1,22 +1,97 @@
-import pandas as pd
-import numpy as np
 from pathlib import Path
 import os
 from datetime import datetime
 
-def process_real_estate_data():
+import layout_cache
+import metrics
+import output_writer
+import profiling
+
+# 抽出する不動産タイプ（見出しの日本語名 -> 出力する列名）
+PROPERTY_TYPES = {
+    "商業用不動産総合": "Commercial_Property",
+    "店舗": "Retail",
+    "オフィス": "Office",
+    "倉庫": "Warehouse",
+    "工場": "Factory",
+    "ﾏﾝｼｮﾝ･ｱﾊﾟｰﾄ": "Apartment"
+}
+
+
+def _is_date_cell(value):
+    """1列目のセルが期間（日付または年）かどうか"""
+    if isinstance(value, datetime):
+        return True
+    try:
+        return 1980 <= int(float(str(value).split('-')[0])) <= 2100
+    except ValueError:
+        return False
+
+
+def detect_layout(raw_df):
+    """
+    不動産タイプの見出しの行・各タイプの価格指数の列・データの開始行を探す
+
+    Returns:
+        tuple: (配置, アンカーのセルの位置)。見つからなければ None
+    """
+    rows, cols = raw_df.shape
+    for jp_header_row in range(rows):
+        texts = [layout_cache.cell_text(raw_df, jp_header_row, col) for col in range(cols)]
+        # 各タイプの見出しは「不動産価格指数・対前年比・サンプル数」の3列の先頭にある
+        property_indices = {}
+        for jp_type in PROPERTY_TYPES:
+            col = next((col for col, text in enumerate(texts) if text.startswith(jp_type)), None)
+            if col is not None:
+                property_indices[jp_type] = col
+        if len(property_indices) == len(PROPERTY_TYPES):
+            break
+    else:
+        return None
+
+    first_col = min(property_indices.values())
+    price_index_row = next((row for row in range(jp_header_row + 1, rows)
+                            if layout_cache.cell_text(raw_df, row, first_col).startswith('不動産価格指数')), None)
+    if price_index_row is None:
+        return None
+    data_start_row = next((row for row in range(price_index_row + 1, rows)
+                           if layout_cache.cell_text(raw_df, row, 0) and _is_date_cell(raw_df.iat[row, 0])), None)
+    if data_start_row is None:
+        return None
+
+    layout = {
+        'jp_header_row': jp_header_row,
+        'price_index_row': price_index_row,
+        'data_start_row': data_start_row,
+        'property_indices': property_indices,
+    }
+    anchors = [(row, col) for row in (jp_header_row, price_index_row) for col in property_indices.values()]
+    return layout, anchors
+
+
+@metrics.timed()
+def process_real_estate_data(input_file=None, output_file=None):
     """
     Excelファイルから東京都の商業用不動産価格指数データを抽出し、CSVとして保存します。
     日付形式のデータを年に変換して処理します。
+    
+    Args:
+        input_file: 入力Excelファイルのパス（省略時は data/commercial_real_estate_price_index.xlsx）
+        output_file: 出力CSVファイルのパス（省略時は data/tokyo_commercial_real_estate_price_index.csv）
     """
+    import numpy as np
+    import pandas as pd
+    
     # プロジェクトのルートディレクトリとデータパスを取得
     script_dir = Path(__file__).resolve().parent
     project_root = script_dir.parent
     data_dir = project_root / "data"
     
     # 入力Excelファイルのパス
-    input_file = data_dir / "commercial_real_estate_price_index.xlsx"
-    output_file = data_dir / "tokyo_commercial_real_estate_price_index.csv"
+    if input_file is None:
+        input_file = data_dir / "commercial_real_estate_price_index.xlsx"
+    if output_file is None:
+        output_file = data_dir / "tokyo_commercial_real_estate_price_index.csv"
     
     if not os.path.exists(input_file):
         print(f"エラー: 入力ファイルが見つかりません: {input_file}")
@@ -31,26 +106,21 @@ def process_real_estate_data():
         raw_df = pd.read_excel(input_file, sheet_name=tokyo_sheet, header=None)
         print(f"シートの寸法: {raw_df.shape[0]}行 × {raw_df.shape[1]}列")
         
-        # 画像と確認した内容から特定した情報を直接使用
-        jp_header_row = 5  # 日本語ヘッダー行
-        price_index_row = 8  # 価格指数行
-        data_start_row = 11  # データ開始行
+        # 見出しとデータの位置（前回と同じ配置ならキャッシュを使う）
+        layout = layout_cache.resolve('process_real_estate', raw_df, tokyo_sheet, detect_layout)
+        if layout is None:
+            print("エラー: 不動産タイプの見出しまたはデータの開始行が見つかりませんでした")
+            return False
+        jp_header_row = layout['jp_header_row']  # 日本語ヘッダー行
+        data_start_row = layout['data_start_row']  # データ開始行
         
         # 日本語ヘッダー行の内容を表示
         print(f"\n日本語ヘッダー行（{jp_header_row}行目）の内容:")
         header_values = [str(val) for val in raw_df.iloc[jp_header_row] if pd.notna(val)]
         print(", ".join(header_values[:10]))
         
-        # 不動産タイプの列インデックスを画像と確認した内容から直接設定
-        # 価格指数の列インデックスを特定（各不動産タイプの最初の列）
-        property_indices = {
-            "商業用不動産総合": 2,  # 商業用不動産総合の価格指数列
-            "店舗": 8,            # 店舗の価格指数列
-            "オフィス": 11,        # オフィスの価格指数列
-            "倉庫": 14,           # 倉庫の価格指数列
-            "工場": 17,           # 工場の価格指数列
-            "ﾏﾝｼｮﾝ･ｱﾊﾟｰﾄ": 20      # マンション・アパートの価格指数列
-        }
+        # 価格指数の列インデックス（各不動産タイプの最初の列）
+        property_indices = layout['property_indices']
         
         # 結果データフレームを作成
         result_df = pd.DataFrame()
@@ -107,14 +177,7 @@ def process_real_estate_data():
         print(f"{len(years)}年分のデータを抽出しました: {min(years)}年から{max(years)}年まで")
         
         # 各不動産タイプの価格指数を追加
-        property_mapping = {
-            "商業用不動産総合": "Commercial_Property",
-            "店舗": "Retail",
-            "オフィス": "Office", 
-            "倉庫": "Warehouse",
-            "工場": "Factory",
-            "ﾏﾝｼｮﾝ･ｱﾊﾟｰﾄ": "Apartment"
-        }
+        property_mapping = PROPERTY_TYPES
         
         # デバッグのために各不動産タイプの最初の値を表示
         print("\n各不動産タイプの最初の値（データ開始行）:")
@@ -145,7 +208,7 @@ def process_real_estate_data():
                     print(f"警告: {jp_type}のデータサイズが年の数と一致しません。スキップします。")
         
         # CSVとして保存
-        result_df.to_csv(output_file, index=False)
+        output_writer.write_csv(result_df, output_file, index=False)
         print(f"\n東京都の商業用不動産価格指数データを保存しました: {output_file}")
         print(f"データには{len(result_df)}年分の以下の不動産タイプが含まれています:")
         for col in result_df.columns:
@@ -165,4 +228,5 @@ def process_real_estate_data():
 
 
 if __name__ == "__main__":
+    profiling.consume_flag()
     process_real_estate_data()
\ No newline at end of file
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+profiling.py - 各ステージのプロファイル（cProfile・tracemalloc・サンプリングしたスタック）の取得
+
+bojdata.py や取得・加工の各スクリプトに --profile を付けるか、環境変数 BOJDATA_PROFILE=1 を設定すると、
+metrics.stage の最上位のステージごとに以下を reports/profile/<実行ID>/ に保存する。
+
+    <ステージ名>.pstats            cProfileの統計（python -m pstats や snakeviz で開ける）
+    <ステージ名>.tracemalloc.txt   確保したメモリの多い行の上位
+    <ステージ名>.speedscope.json   サンプリングしたスタック（https://www.speedscope.app で開ける）
+
+サンプリングは BOJDATA_PROFILE_SAMPLE にサンプリング間隔（ミリ秒）を指定した場合のみ行う。
+
+使い方:
+    python scripts/process_real_estate.py --profile
+    BOJDATA_PROFILE=1 BOJDATA_PROFILE_SAMPLE=5 python scripts/get_cpi.py
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# プロジェクトのルートディレクトリとプロファイルの保存先
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+default_profile_dir = os.path.join(project_root, "reports", "profile")
+
+# tracemallocで記録するスタックの深さと出力する上位件数
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+
+# cProfileは同時に1つしか有効にできないため、並列実行中は最初のステージだけを対象にする
+_active_lock = threading.Lock()
+
+
+def consume_flag(argv=None):
+    """
+    コマンドライン引数から --profile を取り除き、環境変数で有効にする
+
+    各スクリプトの引数解析に影響しないように取り除き、子プロセスにも引き継ぐ。
+    読み込んだだけで sys.argv が変わらないよう、各スクリプトの実行時（__main__）と bojdata.main() から呼ぶ。
+    """
+    argv = sys.argv if argv is None else argv
+    if '--profile' in argv:
+        while '--profile' in argv:
+            argv.remove('--profile')
+        os.environ['BOJDATA_PROFILE'] = '1'
+
+
+def enabled():
+    return os.environ.get('BOJDATA_PROFILE', '') not in ('', '0')
+
+
+def profile_dir(run_id):
+    base = os.environ.get('BOJDATA_PROFILE_DIR') or default_profile_dir
+    return os.path.join(base, str(run_id))
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+class StackSampler(threading.Thread):
+    """対象スレッドのスタックを一定間隔で記録し、speedscope形式で出力する"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []
+        self.frame_index = {}
+        self.samples = []
+        self.weights = []
+        self.stop_event = threading.Event()
+        self.started_at = None
+        self.finished_at = None
+
+    def _frame_id(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return index
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        last = self.started_at
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(round(now - last, 6))
+            last = now
+        self.finished_at = time.perf_counter()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def to_speedscope(self, name):
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'bojdata profiling.py',
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': round((self.finished_at or self.started_at) - self.started_at, 6),
+                'samples': self.samples,
+                'weights': self.weights,
+            }],
+        }
+
+
+def _write_tracemalloc(snapshot, path, peak):
+    """確保したメモリの多い行の上位をテキストで書き出す"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+    ))
+    stats = snapshot.statistics('lineno')
+    total = sum(stat.size for stat in stats)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"# ピーク: {peak / 1024 / 1024:.1f} MiB, ステージ終了時点で保持: {total / 1024 / 1024:.1f} MiB\n")
+        for stat in stats[:TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}\n")
+
+
+@contextmanager
+def profile_stage(name, run_id):
+    """
+    ステージをプロファイルし、保存したファイルのパスのリストをyieldした値に追加する
+
+    別のステージのプロファイル中（並列実行）の場合は何もしない。
+    """
+    written = []
+    if not _active_lock.acquire(blocking=False):
+        yield written
+        return
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    else:
+        tracemalloc.reset_peak()
+
+    sampler = None
+    sample_ms = os.environ.get('BOJDATA_PROFILE_SAMPLE')
+    if sample_ms:
+        sampler = StackSampler(threading.get_ident(), float(sample_ms) / 1000)
+        sampler.start()
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield written
+        finally:
+            profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+
+            out_dir = profile_dir(run_id)
+            os.makedirs(out_dir, exist_ok=True)
+            base = os.path.join(out_dir, _safe_name(name))
+
+            profiler.dump_stats(base + '.pstats')
+            written.append(base + '.pstats')
+
+            _, peak = tracemalloc.get_traced_memory()
+            _write_tracemalloc(tracemalloc.take_snapshot(), base + '.tracemalloc.txt', peak)
+            written.append(base + '.tracemalloc.txt')
+
+            if sampler is not None:
+                with open(base + '.speedscope.json', 'w', encoding='utf-8') as f:
+                    json.dump(sampler.to_speedscope(name), f)
+                written.append(base + '.speedscope.json')
+
+            print(f"プロファイルを保存しました: {base}.*")
+            print(summary(base + '.pstats'))
+    finally:
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _active_lock.release()
+
+
+def summary(pstats_path, limit=15):
+    """累積時間の上位の関数を文字列で返す"""
+    stream = io.StringIO()
+    stats = pstats.Stats(pstats_path, stream=stream)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+if __name__ == "__main__":
+    # 保存済みの .pstats の概要を表示する
+    if len(sys.argv) < 2:
+        print("使い方: python scripts/profiling.py <ファイル.pstats> [表示件数]")
+        sys.exit(1)
+    print(summary(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 30))
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+publish_tiles.py - ダッシュボード向けに系列ごとのJSONタイルを作成するスクリプト
+
+ダッシュボードがCSVを読み込んでブラウザで計算しなくてよいように、系列ごとに
+丸め済みの値だけを持つ小さなJSONを作り、gzip・brotliで圧縮したファイルも一緒に保存する。
+
+    data/tiles/<系列名>.json        {"name", "freq", "start", "end", "values"}（values は start からの連続した期間、欠損はnull）
+    data/tiles/<系列名>.<点数>.json  点を減らした版（LEVELS の点数ごと、"offsets" は start からの期間数）
+    data/tiles/*.json.gz           gzip（mtime=0 で毎回同じバイト列になる）
+    data/tiles/*.json.br           brotli（brotli パッケージがある場合のみ）
+    data/tiles/index.json          タイルの一覧とSHA-256
+
+長い系列は downsample.py のLTTBで点を減らした版も作る（全点・500点・100点のピラミッド）。
+クライアントは表示する幅に合った点数のタイルを選ぶ（小さなカードなら100点）。
+
+タイルの内容が変わらなければファイルを書き換えないため、更新がない週はファイルの
+更新日時もハッシュも変わらず、クライアントやCDNのキャッシュがそのまま使われる。
+
+使い方:
+    python scripts/publish_tiles.py [--full]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+
+import derived
+import downsample
+import metrics
+import profiling
+import series_store
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+tiles_dir = os.path.join(project_root, "data", "tiles")
+
+# タイルの値の小数点以下の桁数
+DECIMALS = 4
+
+# 点を減らした版の点数（系列の点数がこれより多い場合のみ作る）
+LEVELS = [500, 100]
+
+# 圧縮したファイルの拡張子
+COMPRESSED_SUFFIXES = ['.gz', '.br']
+
+
+def _period_ordinals(labels, freq):
+    """表示用の期間の文字列（YYYY/MM, YYYYQn, YYYY）を期間の序数に変換する"""
+    import pandas as pd
+
+    index = pd.PeriodIndex([str(label).replace('/', '-') for label in labels], freq=series_store.PANDAS_FREQ[freq])
+    return index.asi8
+
+
+def collect_series(data_root=None):
+    """
+    タイルにする系列を集める（保存済みの系列と派生指標、それぞれ元の頻度のまま）
+
+    Returns:
+        dict: 系列名 -> (頻度, 期間の序数の配列, 値の配列)
+    """
+    import numpy as np
+    import pandas as pd
+
+    collected = {}
+    for name, spec in series_store.SERIES.items():
+        if not os.path.exists(os.path.join(data_root or series_store.data_dir, spec['file'])):
+            print(f"ファイルが見つからないため {name} をスキップします: {spec['file']}")
+            continue
+        ordinals, values = series_store.load_series(name, data_root)
+        collected[name] = (spec['freq'], ordinals, values)
+
+    for freq, (filename, period_column) in derived.OUTPUTS.items():
+        path = os.path.join(derived.derived_dir, filename)
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path, dtype={period_column: str})
+        ordinals = _period_ordinals(df.pop(period_column), freq)
+        for name in df.columns:
+            values = df[name].to_numpy(dtype=np.float64)
+            keep = ~np.isnan(values)
+            collected[name] = (freq, ordinals[keep], values[keep])
+    return collected
+
+
+def encode_tile(name, freq, ordinals, values):
+    """系列をタイルのJSONのバイト列にする（同じ内容なら毎回同じバイト列になる）"""
+    import numpy as np
+
+    if len(ordinals):
+        start, end = int(ordinals.min()), int(ordinals.max())
+        dense = np.full(end - start + 1, np.nan)
+        dense[ordinals - start] = np.round(values, DECIMALS)
+        points = [None if np.isnan(v) else float(v) for v in dense]
+        start_label, end_label = series_store.period_label(start, freq), series_store.period_label(end, freq)
+    else:
+        points, start_label, end_label = [], None, None
+
+    tile = {'name': name, 'freq': freq, 'start': start_label, 'end': end_label, 'values': points}
+    return json.dumps(tile, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def encode_level(name, freq, ordinals, values, level):
+    """点を減らした版のタイル（間隔が不規則なので、各点の start からの期間数を offsets に持つ）"""
+    import numpy as np
+
+    x, y = downsample.downsample(ordinals, values, level)
+    start = int(x[0])
+    tile = {
+        'name': name,
+        'freq': freq,
+        'level': level,
+        'start': series_store.period_label(start, freq),
+        'end': series_store.period_label(x[-1], freq),
+        'offsets': [int(offset) for offset in x - start],
+        'values': [float(v) for v in np.round(y, DECIMALS)],
+    }
+    return json.dumps(tile, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compress_variants(payload):
+    """
+    圧縮したバイト列を作る
+
+    Returns:
+        dict: 拡張子 -> 圧縮したバイト列（brotli パッケージがなければ .br は含まない）
+    """
+    variants = {'.gz': gzip.compress(payload, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        return variants
+    variants['.br'] = brotli.compress(payload, quality=11)
+    return variants
+
+
+def _write_bytes(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _tile_paths(entry):
+    """一覧の1系列分のタイルのファイル名（点を減らした版を含む）"""
+    return frozenset([entry['path']] + [level['path'] for level in entry.get('levels', {}).values()])
+
+
+def _load_index(index_path):
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('tiles', {})
+
+
+def _publish_tile(filename, payload, previous_entry, written, rows):
+    """
+    タイルを書き込む（前回とハッシュが同じで、ファイルがそろっていれば書き込まない）
+
+    Returns:
+        dict: 一覧に載せるタイルの情報
+    """
+    digest = hashlib.sha256(payload).hexdigest()
+    json_path = os.path.join(tiles_dir, filename)
+    up_to_date = (
+        previous_entry is not None and previous_entry['sha256'] == digest and os.path.exists(json_path)
+        and all(os.path.exists(json_path + suffix) for suffix in previous_entry.get('encodings', {}))
+    )
+    if up_to_date:
+        metrics.cache_hit('tiles')
+        return {key: previous_entry[key] for key in ('path', 'sha256', 'bytes', 'encodings')}
+    metrics.cache_hit('tiles', hit=False)
+
+    variants = compress_variants(payload)
+    _write_bytes(json_path, payload)
+    metrics.record_output(json_path, rows=rows, sha256=digest)
+    written.append(json_path)
+    for suffix, data in variants.items():
+        _write_bytes(json_path + suffix, data)
+        written.append(json_path + suffix)
+    # brotli が使えなくなった場合など、今回作らなかった圧縮ファイルは古い内容のまま残さない
+    for suffix in COMPRESSED_SUFFIXES:
+        if suffix not in variants and os.path.exists(json_path + suffix):
+            os.remove(json_path + suffix)
+
+    return {
+        'path': filename,
+        'sha256': digest,
+        'bytes': len(payload),
+        'encodings': {suffix: len(data) for suffix, data in sorted(variants.items())},
+    }
+
+
+@metrics.timed()
+def publish_tiles(full=False, data_root=None):
+    """
+    すべての系列のタイルを作成し、内容が変わったものだけを書き込む
+
+    Returns:
+        list: 書き込んだファイルのパス
+    """
+    os.makedirs(tiles_dir, exist_ok=True)
+    index_path = os.path.join(tiles_dir, "index.json")
+    previous = {} if full else _load_index(index_path)
+
+    tiles = {}
+    written = []
+    for name, (freq, ordinals, values) in sorted(collect_series(data_root).items()):
+        entry = _publish_tile(f"{name}.json", encode_tile(name, freq, ordinals, values),
+                              previous.get(name), written, rows=len(ordinals))
+        entry.update({'freq': freq, 'points': int(len(ordinals))})
+
+        levels = {}
+        for level in LEVELS:
+            if len(ordinals) <= level:
+                continue
+            previous_level = (previous.get(name) or {}).get('levels', {}).get(str(level))
+            levels[str(level)] = _publish_tile(f"{name}.{level}.json",
+                                               encode_level(name, freq, ordinals, values, level),
+                                               previous_level, written, rows=level)
+        if levels:
+            entry['levels'] = levels
+        tiles[name] = entry
+
+    # 系列や点を減らした版がなくなったタイルを削除する
+    current = set().union(*(_tile_paths(entry) for entry in tiles.values()))
+    for entry in previous.values():
+        for filename in _tile_paths(entry) - current:
+            for suffix in [''] + COMPRESSED_SUFFIXES:
+                path = os.path.join(tiles_dir, filename + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    index_payload = (json.dumps({'tiles': tiles}, ensure_ascii=False, indent=2, sort_keys=True) + '\n').encode('utf-8')
+    old_payload = None
+    if os.path.exists(index_path):
+        with open(index_path, 'rb') as f:
+            old_payload = f.read()
+    if index_payload != old_payload:
+        _write_bytes(index_path, index_payload)
+        metrics.record_output(index_path, rows=len(tiles))
+        written.append(index_path)
+
+    total = sum(len(_tile_paths(entry)) for entry in tiles.values())
+    updated = sum(1 for path in written if path.endswith('.json') and path != index_path)
+    print(f"タイル: {len(tiles)}系列・{total}件（更新 {updated}件, 変更なし {total - updated}件）: {tiles_dir}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ダッシュボード向けの系列ごとのJSONタイルを作成する")
+    parser.add_argument('--full', action='store_true', help="前回の一覧を使わずにすべてのタイルを書き直す")
+    args = parser.parse_args()
+    publish_tiles(full=args.full)
+    return True
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+raw_archive.py - 取得した元のファイル（Excel・CSVなど）を内容のハッシュで保存するアーカイブ
+
+get_cpi はCSVに変換した後にExcelを削除し、毎月勤労統計・景気動向指数・不動産価格指数のExcelは
+同じパスに上書きされるため、過去のデータを加工し直すには取得し直すしかない。ここでは
+ダウンロードしたファイルを内容のSHA-256ごとに一度だけ圧縮して保存し、
+（取得元のスクリプト, 取得日時, URL, ハッシュ）を索引に追記する。同じ内容は何度取得しても1つしか保存しない。
+
+http_utils のダウンロード（download_to_path / save_response）と日銀のCSVの取得は自動的にアーカイブする。
+checkout / reprocess で過去の時点のファイルを元のパスに戻し、ネットワークなしで加工し直せる。
+
+アーカイブの場所は環境変数 BOJDATA_ARCHIVE_DIR（既定: archive/、gitの管理外）。
+BOJDATA_ARCHIVE=0 で自動的なアーカイブを無効にする。ワークフローでは actions/cache で実行をまたいで引き継ぐ。
+
+    <アーカイブ>/objects/<先頭2文字>/<SHA-256>.gz  ファイルの内容（gzipで小さくならない場合は .gz なし）
+    <アーカイブ>/index.ndjson                     1行1エントリ（追記のみ）
+        {"path", "sha256", "size", "stored_size", "encoding", "source", "url", "fetched_at"}
+
+使い方:
+    python scripts/raw_archive.py add data/*.xlsx [--source get_payroll]
+    python scripts/raw_archive.py list [パス]
+    python scripts/raw_archive.py restore data/毎月勤労統計調査.xlsx [--at 2025-03-01] [--out 出力先]
+    python scripts/raw_archive.py checkout <取得元> [--at 2025-03-01] [--out-dir DIR]
+    python scripts/raw_archive.py reprocess <データソース> [--at 2025-03-01]   # bojdata.py のデータソース名
+"""
+
+import argparse
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# プロジェクトのルートディレクトリとアーカイブの場所
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+# 索引のURLに残さないクエリパラメータ（APIキー）
+SECRET_PARAMS = {'appId', 'api_key'}
+
+# 取得した後にExcelをCSVに変換してExcelを削除する取得元と、その変換処理（モジュール名, 関数名）
+# 加工し直す前に、取り出したExcelから同じCSVを作る
+CONVERTERS = {
+    'get_cpi': ('get_cpi', 'convert_excel_to_csv'),
+}
+
+# gzipでこの割合より小さくならない内容（xlsxなど圧縮済みの形式）はそのまま保存する
+MIN_COMPRESSION_RATIO = 0.9
+
+_lock = threading.Lock()
+
+
+def archive_dir():
+    return os.environ.get('BOJDATA_ARCHIVE_DIR') or os.path.join(project_root, "archive")
+
+
+def enabled():
+    return os.environ.get('BOJDATA_ARCHIVE', '1') not in ('0', 'false', '')
+
+
+def _index_path():
+    return os.path.join(archive_dir(), "index.ndjson")
+
+
+def object_path(digest, encoding='gzip'):
+    suffix = '.gz' if encoding == 'gzip' else ''
+    return os.path.join(archive_dir(), "objects", digest[:2], digest + suffix)
+
+
+def _relative(path):
+    """プロジェクトルートからの相対パス（アーカイブを実行環境に依存させない）"""
+    path = os.path.abspath(str(path))
+    if path.startswith(project_root + os.sep):
+        return os.path.relpath(path, project_root).replace(os.sep, '/')
+    return path
+
+
+def _redact(url):
+    """URLからAPIキーを除く"""
+    if not url:
+        return url
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def load_index():
+    """索引のエントリ（追記した順）。以前の形式の index.json（圧縮なし）のエントリを先に含める"""
+    entries = []
+    legacy_path = os.path.join(archive_dir(), "index.json")
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            for entry in json.load(f):
+                entries.append({'path': entry['path'], 'sha256': entry['sha256'], 'size': entry['size'],
+                                'stored_size': entry['size'], 'encoding': 'identity', 'source': None,
+                                'url': None, 'fetched_at': entry['archived_at']})
+    if os.path.exists(_index_path()):
+        with open(_index_path(), 'r', encoding='utf-8') as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    return entries
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _store_object(path, digest):
+    """内容を保存する（保存済みなら何もしない）。保存した (エンコーディング, 保存サイズ) を返す"""
+    for encoding in ('gzip', 'identity'):
+        existing = object_path(digest, encoding)
+        if os.path.exists(existing):
+            return encoding, os.path.getsize(existing)
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    compressed = gzip.compress(content, compresslevel=6, mtime=0)
+    if len(compressed) < len(content) * MIN_COMPRESSION_RATIO:
+        encoding, payload = 'gzip', compressed
+    else:
+        encoding, payload = 'identity', content
+
+    target = object_path(digest, encoding)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, target)
+    return encoding, len(payload)
+
+
+def archive_file(path, url=None, source=None, sha256=None):
+    """
+    ファイルをアーカイブに追加する
+
+    Args:
+        path: ファイルのパス
+        url: 取得元のURL（APIキーは記録しない）
+        source: 取得したスクリプト（省略時は実行中のスクリプト名）
+        sha256: 計算済みのハッシュ（ダウンロード時に計算したもの）
+
+    Returns:
+        dict: 索引に追記したエントリ
+    """
+    digest = sha256 or file_sha256(path)
+    if source is None:
+        source = os.path.splitext(os.path.basename(sys.argv[0] or ''))[0] or None
+    with _lock:
+        encoding, stored_size = _store_object(path, digest)
+        entry = {
+            'path': _relative(path),
+            'sha256': digest,
+            'size': os.path.getsize(path),
+            'stored_size': stored_size,
+            'encoding': encoding,
+            'source': source,
+            'url': _redact(url),
+            'fetched_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        os.makedirs(archive_dir(), exist_ok=True)
+        with open(_index_path(), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+    return entry
+
+
+def archive_download(path, url=None, sha256=None):
+    """
+    ダウンロードしたファイルをアーカイブする（http_utils などから呼ぶ）
+
+    アーカイブに失敗してもダウンロード自体は成功として扱う。
+    """
+    if not enabled():
+        return None
+    try:
+        return archive_file(path, url=url, sha256=sha256)
+    except OSError as e:
+        print(f"アーカイブに失敗しました（処理は続けます）: {path} ({e})")
+        return None
+
+
+def add(paths, source=None):
+    """
+    ファイルをアーカイブに追加する（同じパスの直前のエントリと同じ内容なら追記しない）
+
+    Returns:
+        list: 追記したエントリ
+    """
+    latest = {entry['path']: entry['sha256'] for entry in load_index()}
+    added = []
+    for path in paths:
+        if not os.path.isfile(path):
+            print(f"ファイルが見つかりません: {path}")
+            continue
+        digest = file_sha256(path)
+        if latest.get(_relative(path)) == digest:
+            continue
+        entry = archive_file(path, source=source or 'raw_archive', sha256=digest)
+        latest[entry['path']] = digest
+        added.append(entry)
+        print(f"アーカイブしました: {entry['path']} ({digest[:12]}, {entry['stored_size']:,} bytes)")
+    return added
+
+
+def _normalize_at(at):
+    """日付だけの指定はその日の終わりとする"""
+    if at is not None and len(at) == 10:
+        return at + 'T23:59:59'
+    return at
+
+
+def snapshot(source=None, at=None):
+    """
+    指定日時（省略時は最新）の時点での各パスの最新のエントリ
+
+    Returns:
+        dict: パス -> エントリ
+    """
+    at = _normalize_at(at)
+    selected = {}
+    for entry in load_index():
+        if source is not None and entry.get('source') != source:
+            continue
+        if at is not None and entry['fetched_at'] > at:
+            continue
+        selected[entry['path']] = entry
+    return selected
+
+
+def _extract(entry, out):
+    """エントリの内容を out に書き出す"""
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    tmp_path = out + '.tmp'
+    encoding = entry['encoding']
+    with open(object_path(entry['sha256'], encoding), 'rb') as f:
+        content = f.read()
+    if encoding == 'gzip':
+        content = gzip.decompress(content)
+    if hashlib.sha256(content).hexdigest() != entry['sha256']:
+        raise ValueError(f"アーカイブの内容がハッシュと一致しません: {entry['sha256']}")
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, out)
+    return out
+
+
+def restore(path, at=None, out=None):
+    """アーカイブから1つのファイルを取り出す（成功した場合は出力先のパス）"""
+    entry = snapshot(at=at).get(_relative(path))
+    if entry is None:
+        print(f"アーカイブにありません: {path}")
+        return None
+    out = _extract(entry, out or path)
+    print(f"取り出しました: {entry['path']} ({entry['fetched_at']}, {entry['sha256'][:12]}) -> {out}")
+    return out
+
+
+def checkout(source, at=None, out_dir=None):
+    """
+    取得元のスクリプトが指定日時の時点で取得していたファイルを、元のパス（または out_dir）に戻す
+
+    Returns:
+        list: 書き出したファイルのパス
+    """
+    written = []
+    for relpath, entry in sorted(snapshot(source, at).items()):
+        out = os.path.join(out_dir, os.path.basename(relpath)) if out_dir else os.path.join(project_root, relpath)
+        written.append(_extract(entry, out))
+        print(f"取り出しました: {relpath} ({entry['fetched_at']}, {entry['sha256'][:12]})")
+    if not written:
+        print(f"{source} のアーカイブがありません" + (f"（{at} 以前）" if at else ''))
+    return written
+
+
+def reprocess(source, at=None):
+    """bojdata.py のデータソースの取得ファイルを指定日時の時点に戻し、ネットワークなしで加工し直す"""
+    import bojdata
+
+    actions = bojdata.SOURCES[source]
+    if 'fetch' not in actions or 'process' not in actions:
+        print(f"{source} には取得と加工の両方の処理がありません")
+        return False
+    fetch_module = actions['fetch'][0]
+    written = checkout(fetch_module, at)
+    if not written:
+        return False
+    if fetch_module in CONVERTERS and not _convert(fetch_module, written):
+        return False
+    return bojdata.run_step(source, 'process')
+
+
+def _convert(fetch_module, paths):
+    """取り出した data/ 直下のExcelを、取得元のスクリプトと同じようにCSVに変換してExcelを削除する"""
+    module_name, func_name = CONVERTERS[fetch_module]
+    convert = getattr(importlib.import_module(module_name), func_name)
+    data_dir = os.path.join(project_root, "data")
+    for path in paths:
+        if not path.endswith('.xlsx') or os.path.dirname(os.path.abspath(path)) != data_dir:
+            continue
+        if not convert(path, os.path.splitext(os.path.basename(path))[0]):
+            print(f"CSVに変換できませんでした: {path}")
+            return False
+        os.remove(path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="取得した元のファイルを内容のハッシュで保存するアーカイブ")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_parser = subparsers.add_parser('add', help="ファイルをアーカイブに追加する")
+    add_parser.add_argument('paths', nargs='+')
+    add_parser.add_argument('--source', default=None, help="取得元として記録する名前")
+    list_parser = subparsers.add_parser('list', help="アーカイブの記録を表示する")
+    list_parser.add_argument('path', nargs='?', default=None)
+    restore_parser = subparsers.add_parser('restore', help="アーカイブからファイルを取り出す")
+    restore_parser.add_argument('path')
+    restore_parser.add_argument('--at', default=None, help="この日時の時点の内容（省略時は最新）")
+    restore_parser.add_argument('--out', default=None, help="出力先（省略時は元のパス）")
+    checkout_parser = subparsers.add_parser('checkout', help="取得元のスクリプトが取得したファイルをまとめて戻す")
+    checkout_parser.add_argument('source', help="取得元のスクリプト名（例: get_payroll）")
+    checkout_parser.add_argument('--at', default=None, help="この日時の時点の内容（省略時は最新）")
+    checkout_parser.add_argument('--out-dir', default=None, help="出力先（省略時は元のパス）")
+    reprocess_parser = subparsers.add_parser('reprocess', help="過去の時点の取得ファイルで加工し直す")
+    reprocess_parser.add_argument('source', help="bojdata.py のデータソース名（例: payroll）")
+    reprocess_parser.add_argument('--at', default=None, help="この日時の時点の内容（省略時は最新）")
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        add(args.paths, args.source)
+    elif args.command == 'list':
+        relpath = _relative(args.path) if args.path else None
+        for entry in load_index():
+            if relpath is None or entry['path'] == relpath:
+                print(f"{entry['fetched_at']}  {entry['sha256'][:12]}  {entry['size']:>10,} bytes "
+                      f"({entry['stored_size']:>10,})  {entry.get('source') or '-':<32}  {entry['path']}")
+    elif args.command == 'restore':
+        return restore(args.path, args.at, args.out) is not None
+    elif args.command == 'checkout':
+        return bool(checkout(args.source, args.at, args.out_dir))
+    else:
+        return reprocess(args.source, args.at)
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+replay_server.py - 取得元サイトの応答を記録・再生するローカルHTTPサーバー
+
+e-Stat、日銀、国土交通省、内閣府ESRI、FRED APIに実際にアクセスせずに
+get_*スクリプトのテストやベンチマークを行うためのサーバー。
+各スクリプトは環境変数 BOJDATA_BASE_URL でこのサーバーを向く（http_utils.source_url）。
+
+リクエストのパスは /<ホスト名>/<元のパス>?<クエリ> の形式で、記録済みの応答を
+recordings/ から返す。--record を付けると未記録のURLを本番から取得して保存する。
+遅延・スループット制限・エラー注入・転送の途中切断を設定でき、並列化・リトライ・
+キャッシュの挙動をオフラインで再現性よく測定できる。
+
+使い方:
+    # 記録（本番にアクセスしながら応答を保存）
+    python scripts/replay_server.py --record
+    BOJDATA_BASE_URL=http://127.0.0.1:8766 python scripts/get_cpi.py
+
+    # 再生（遅延200ms、1MB/s、5%の確率で503）
+    python scripts/replay_server.py --latency 0.2 --throughput 1000000 --error-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+# プロジェクトのルートディレクトリと記録の保存先
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+default_recordings_dir = os.path.join(project_root, "recordings")
+
+# 記録のキーから除外するクエリパラメータ（APIキーを記録に残さない）
+SECRET_PARAMS = {'appId', 'api_key'}
+
+# 記録する応答ヘッダー
+RECORDED_HEADERS = ('Content-Type', 'Content-Disposition', 'Last-Modified')
+
+
+def recording_key(host, path, query):
+    """ホスト・パス・クエリから記録のキーを作る（クエリは並べ替え、APIキーは除外）"""
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in SECRET_PARAMS)
+    key = f"{host}{path}"
+    if params:
+        key += f"?{urlencode(params)}"
+    return key
+
+
+class Recordings:
+    """記録済みの応答（index.json と内容アドレスで保存した本文）"""
+
+    def __init__(self, recordings_dir):
+        self.recordings_dir = recordings_dir
+        self.bodies_dir = os.path.join(recordings_dir, "bodies")
+        self.index_path = os.path.join(recordings_dir, "index.json")
+        self.lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def get(self, key):
+        """記録済みの応答を (status, headers, body) で返す（未記録ならNone）"""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        with open(os.path.join(self.bodies_dir, entry['body']), 'rb') as f:
+            body = f.read()
+        return entry['status'], entry['headers'], body
+
+    def put(self, key, status, headers, body):
+        """応答を記録する（同じ本文は一度だけ保存する）"""
+        digest = hashlib.sha256(body).hexdigest()
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        body_path = os.path.join(self.bodies_dir, digest)
+        if not os.path.exists(body_path):
+            with open(body_path, 'wb') as f:
+                f.write(body)
+
+        with self.lock:
+            self.index[key] = {
+                'status': status,
+                'headers': {k: headers[k] for k in RECORDED_HEADERS if k in headers},
+                'body': digest,
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """記録済みの応答を遅延・帯域制限・エラー注入付きで返すハンドラー"""
+
+    protocol_version = 'HTTP/1.1'
+
+    # serve() で設定する
+    recordings = None
+    options = None
+    rng = random.Random()
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        path = '/' + path
+        key = recording_key(host, path, parts.query)
+
+        if self.options.latency:
+            time.sleep(self.options.latency + self.rng.uniform(0, self.options.jitter))
+
+        # エラー注入
+        if self.rng.random() < self.options.error_rate:
+            self.send_simple(self.options.error_status, b'injected error', send_body)
+            return
+
+        recorded = self.recordings.get(key)
+        if recorded is None and self.options.record:
+            recorded = self.record_upstream(host, path, parts.query, key)
+        if recorded is None:
+            self.send_simple(404, f"not recorded: {key}".encode('utf-8'), send_body)
+            return
+
+        status, headers, body = recorded
+        self.send_recorded(status, headers, body, send_body)
+
+    def record_upstream(self, host, path, query, key):
+        """本番から取得して記録する"""
+        url = f"https://{host}{path}" + (f"?{query}" if query else '')
+        try:
+            response = requests.get(url, headers={'User-Agent': self.headers.get('User-Agent', '')}, timeout=(10, 120))
+        except requests.exceptions.RequestException as e:
+            self.log_error("記録に失敗しました: %s (%s)", url, e)
+            return None
+        self.recordings.put(key, response.status_code, response.headers, response.content)
+        print(f"記録しました: {key} ({response.status_code}, {len(response.content)} bytes)")
+        return self.recordings.get(key)
+
+    def send_simple(self, status, body, send_body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def send_recorded(self, status, headers, body, send_body):
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        start, end = 0, len(body) - 1
+
+        # Rangeリクエスト（If-Rangeが一致する場合のみ）
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        partial = False
+        if status == 200 and range_header and range_header.startswith('bytes=') and if_range in (None, etag):
+            first, _, last = range_header[len('bytes='):].partition('-')
+            if first.isdigit():
+                start = int(first)
+                end = min(int(last), len(body) - 1) if last.isdigit() else len(body) - 1
+                if start >= len(body):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{len(body)}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                partial = True
+
+        payload = body[start:end + 1]
+        self.send_response(206 if partial else status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        if partial:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(body)}")
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if not send_body:
+            return
+
+        # 途中切断の注入（ダウンロード再開の検証用）
+        if self.rng.random() < self.options.truncate_rate:
+            payload = payload[:len(payload) // 2]
+            self.close_connection = True
+
+        self.write_throttled(payload)
+
+    def write_throttled(self, payload):
+        """スループット制限付きで本文を書き込む"""
+        chunk_size = 64 * 1024
+        throughput = self.options.throughput
+        for i in range(0, len(payload), chunk_size):
+            chunk = payload[i:i + chunk_size]
+            started = time.monotonic()
+            self.wfile.write(chunk)
+            if throughput:
+                remaining = len(chunk) / throughput - (time.monotonic() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+
+def build_server(options):
+    """設定済みのサーバーを作成する（ポート0なら空いているポートを使う）"""
+    handler = type('ConfiguredReplayHandler', (ReplayHandler,), {
+        'recordings': Recordings(options.recordings_dir),
+        'options': options,
+        'rng': random.Random(options.seed),
+    })
+    return ThreadingHTTPServer((options.host, options.port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="取得元サイトの応答を記録・再生するローカルHTTPサーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--recordings-dir', default=default_recordings_dir, help="記録の保存先")
+    parser.add_argument('--record', action='store_true', help="未記録のURLを本番から取得して記録する")
+    parser.add_argument('--latency', type=float, default=0.0, help="応答ごとの遅延（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="遅延に加えるランダムな揺らぎの上限（秒）")
+    parser.add_argument('--throughput', type=float, default=0.0, help="1接続あたりの転送速度の上限（バイト/秒、0で無制限）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="エラー応答を返す確率")
+    parser.add_argument('--error-status', type=int, default=503, help="注入するエラーのステータスコード")
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help="本文を途中で切断する確率")
+    parser.add_argument('--seed', type=int, default=None, help="エラー注入の乱数シード")
+    parser.add_argument('--verbose', action='store_true', help="アクセスログを表示する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    server = build_server(options)
+    mode = "記録" if options.record else "再生"
+    print(f"リプレイサーバーを起動しました（{mode}モード）: http://{options.host}:{server.server_port}")
+    print(f"取得スクリプトは BOJDATA_BASE_URL=http://{options.host}:{server.server_port} で接続できます")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+run_history.py - 実行レポートの履歴をSQLiteに蓄積し、性能の変化を検出するスクリプト
+
+metrics.py が出力した実行レポート（reports/run_report.json）のステージごとの実行時間・行数、
+ホストごとの受信バイト数・レイテンシ、出力ファイルのサイズを reports/run_history.sqlite に追記する。
+trends では直近の実行の値を過去の実行の中央値と比較し、しきい値を超えて変化した項目を表示する
+（ESRIのExcelブックのサイズが倍になった、e-Statの応答が遅くなった、など）。
+公表予定に合わせた取得（scheduler.py、実行IDが scheduler- で始まる）は1つのデータソースだけを数秒で
+処理するため、すべてを処理する実行とは別の種類として、同じ種類の実行どうしで比較する。
+
+使い方:
+    python scripts/run_history.py record [reports/run_report.json]
+    python scripts/run_history.py trends [--window 10] [--threshold 0.5] [--fail-on-regression]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+from datetime import datetime
+
+# プロジェクトのルートディレクトリと履歴の保存先
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+reports_dir = os.path.join(project_root, "reports")
+default_db_path = os.path.join(reports_dir, "run_history.sqlite")
+default_report_path = os.path.join(reports_dir, "run_report.json")
+
+# 比較に必要な過去の実行数
+MIN_HISTORY = 3
+
+# 公表予定に合わせた取得の実行IDの接頭辞（scheduler.py）
+POLL_RUN_PREFIX = 'scheduler-'
+
+# 小さすぎる変化は誤検出になりやすいため、指標ごとに無視する差の下限を設ける
+MIN_ABS_DELTA = {
+    'wall_time': 0.5,        # 秒
+    'latency_mean': 0.2,     # 秒
+    'bytes': 10 * 1024,      # バイト
+    'rows': 1,
+    'requests': 1,
+    'errors': 1,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT,
+    finished_at TEXT,
+    recorded_at TEXT,
+    run_kind TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, kind, name, metric)
+);
+CREATE INDEX IF NOT EXISTS metrics_series ON metrics (kind, name, metric);
+"""
+
+
+def connect(db_path=default_db_path):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    # 実行の種類の列がない古い履歴には列を追加し、実行IDから種類を埋める
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(runs)")]
+    if 'run_kind' not in columns:
+        with conn:
+            conn.execute("ALTER TABLE runs ADD COLUMN run_kind TEXT")
+            conn.execute("UPDATE runs SET run_kind = CASE WHEN run_id LIKE ? THEN 'poll' ELSE 'full' END",
+                         (POLL_RUN_PREFIX + '%',))
+    return conn
+
+
+def run_kind(run_id):
+    """実行の種類（'poll': 公表予定に合わせた取得, 'full': それ以外）"""
+    return 'poll' if str(run_id).startswith(POLL_RUN_PREFIX) else 'full'
+
+
+def iter_report_metrics(report):
+    """実行レポートから (種類, 名前, 指標, 値) を列挙する"""
+    for stage, entry in report.get('stages', {}).items():
+        yield 'stage', stage, 'wall_time', entry.get('wall_time')
+        yield 'stage', stage, 'rows', entry.get('rows')
+        # 失敗したステージは実行時間の比較が意味をなさないため状態も残す
+        yield 'stage', stage, 'ok', 1 if entry.get('status', 'ok') == 'ok' else 0
+
+    for host, entry in report.get('http', {}).items():
+        requests_count = entry.get('requests') or 0
+        yield 'http', host, 'bytes', entry.get('bytes')
+        yield 'http', host, 'requests', requests_count
+        yield 'http', host, 'errors', entry.get('errors')
+        if requests_count:
+            yield 'http', host, 'latency_mean', round(entry.get('latency_total', 0) / requests_count, 4)
+
+    for path, entry in report.get('outputs', {}).items():
+        yield 'output', path, 'bytes', entry.get('bytes')
+        if 'rows' in entry:
+            yield 'output', path, 'rows', entry['rows']
+
+
+def record(conn, report):
+    """実行レポートを履歴に追加する（同じ実行IDは置き換える）"""
+    run_id = report['run_id']
+    with conn:
+        conn.execute("DELETE FROM metrics WHERE run_id = ?", (run_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO runs (run_id, started_at, finished_at, recorded_at, run_kind) VALUES (?, ?, ?, ?, ?)",
+            (run_id, report.get('started_at'), report.get('finished_at'), datetime.now().isoformat(timespec='seconds'),
+             run_kind(run_id)),
+        )
+        conn.executemany(
+            "INSERT INTO metrics (run_id, kind, name, metric, value) VALUES (?, ?, ?, ?, ?)",
+            [(run_id, kind, name, metric, value)
+             for kind, name, metric, value in iter_report_metrics(report) if value is not None],
+        )
+    return run_id
+
+
+def recent_runs(conn, limit, kind=None):
+    """新しい順に実行IDを返す（kind を指定した場合はその種類（run_kind）の実行のみ）"""
+    rows = conn.execute(
+        "SELECT run_id FROM runs WHERE ? IS NULL OR run_kind = ? ORDER BY started_at DESC, recorded_at DESC LIMIT ?",
+        (kind, kind, limit),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def latest_kind(conn):
+    """最新の実行の種類（履歴がなければ None）"""
+    row = conn.execute("SELECT run_kind FROM runs ORDER BY started_at DESC, recorded_at DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def find_changes(conn, window=10, threshold=0.5):
+    """
+    最新の実行の各指標を、同じ種類のそれ以前の直近window回の中央値と比較する
+
+    Returns:
+        list: (種類, 名前, 指標, 今回の値, 中央値, 変化率) のうち、しきい値を超えたもの
+    """
+    runs = recent_runs(conn, window + 1, latest_kind(conn))
+    if len(runs) < MIN_HISTORY + 1:
+        return []
+    current_run, history_runs = runs[0], runs[1:]
+
+    current = {
+        (kind, name, metric): value
+        for kind, name, metric, value in conn.execute(
+            "SELECT kind, name, metric, value FROM metrics WHERE run_id = ?", (current_run,)
+        )
+    }
+    placeholders = ','.join('?' * len(history_runs))
+    history = {}
+    for kind, name, metric, value in conn.execute(
+        f"SELECT kind, name, metric, value FROM metrics WHERE run_id IN ({placeholders})", history_runs
+    ):
+        history.setdefault((kind, name, metric), []).append(value)
+
+    changes = []
+    for key, value in sorted(current.items()):
+        kind, name, metric = key
+        past = history.get(key, [])
+        if metric == 'ok' or len(past) < MIN_HISTORY:
+            continue
+        median = statistics.median(past)
+        delta = value - median
+        if abs(delta) < MIN_ABS_DELTA.get(metric, 0):
+            continue
+        ratio = delta / median if median else float('inf')
+        if abs(ratio) > threshold:
+            changes.append((kind, name, metric, value, median, ratio))
+    return changes
+
+
+def print_trends(conn, window, threshold):
+    """直近の実行の主な指標を一覧表示し、変化した項目を返す"""
+    kind = latest_kind(conn)
+    runs = recent_runs(conn, window + 1, kind)
+    if not runs:
+        print("履歴がありません。先に record を実行してください。")
+        return []
+
+    print(f"直近{len(runs)}回の{kind}の実行（新しい順）: {', '.join(runs)}")
+    print("\nステージごとの実行時間（秒）:")
+    placeholders = ','.join('?' * len(runs))
+    series = {}
+    for run_id, name, value in conn.execute(
+        f"SELECT run_id, name, value FROM metrics WHERE kind = 'stage' AND metric = 'wall_time' "
+        f"AND run_id IN ({placeholders})", runs
+    ):
+        series.setdefault(name, {})[run_id] = value
+    for name in sorted(series):
+        values = [series[name].get(run_id) for run_id in runs]
+        formatted = ' '.join(f"{v:8.2f}" if v is not None else f"{'-':>8}" for v in values)
+        print(f"  {name:<55} {formatted}")
+
+    changes = find_changes(conn, window, threshold)
+    if len(runs) < MIN_HISTORY + 1:
+        print(f"\n比較には{MIN_HISTORY + 1}回以上の実行履歴が必要です")
+    elif not changes:
+        print(f"\n中央値から{threshold:.0%}を超えて変化した項目はありません")
+    else:
+        print(f"\n中央値から{threshold:.0%}を超えて変化した項目:")
+        for kind, name, metric, value, median, ratio in changes:
+            direction = "増加" if ratio > 0 else "減少"
+            print(f"  [{kind}] {name} {metric}: {value:g}（中央値 {median:g}, {ratio:+.0%} {direction}）")
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="実行レポートの履歴の蓄積と性能変化の検出")
+    parser.add_argument('--db', default=default_db_path, help="履歴データベースのパス")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="実行レポートを履歴に追加する")
+    record_parser.add_argument('report', nargs='?', default=None, help="実行レポートのパス")
+
+    trends_parser = subparsers.add_parser('trends', help="直近の実行の変化を表示する")
+    trends_parser.add_argument('--window', type=int, default=10, help="比較に使う過去の実行数")
+    trends_parser.add_argument('--threshold', type=float, default=0.5, help="変化とみなす中央値からの変化率")
+    trends_parser.add_argument('--fail-on-regression', action='store_true',
+                               help="変化した項目があれば終了コード1で終了する")
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    try:
+        if args.command == 'record':
+            report_path = args.report or os.environ.get('BOJDATA_REPORT') or default_report_path
+            if not os.path.exists(report_path):
+                print(f"実行レポートが見つかりません: {report_path}")
+                return 1
+            with open(report_path, 'r', encoding='utf-8') as f:
+                run_id = record(conn, json.load(f))
+            print(f"実行 {run_id} を履歴に追加しました: {args.db}")
+        else:
+            changes = print_trends(conn, args.window, args.threshold)
+            if changes and args.fail_on_regression:
+                return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+scheduler.py - 各データソースの公表予定に合わせて取得・加工を実行するスケジューラ
+
+毎週決まった時刻にすべてを取得すると、公表から最大1週間データが古いままになり、
+ほとんどの実行では新しいデータがない。ここではデータソースごとに公表予定の期間（日本時間）を持ち、
+その期間の間だけ bojdata.py fetch <データソース> を実行して、取得したファイル（ダウンロードした元の
+ファイルと取得時に書き出すCSV）のハッシュが前回と変わる（新しい公表値が取得できる）まで間隔を広げながら
+取得し直す。取得が成功したかと取得したファイルは、取得のプロセスの実行イベント（metrics.py の
+BOJDATA_EVENTS）の出力の記録から判断するため、加工で data/ のCSVが変わっても新しいデータとはみなさない。
+新しいデータを取得した場合は、そのデータソースの加工と、派生指標・パネル・タイル・変更履歴などの
+後段の処理（取得のないデータソース）を続けて実行する。
+
+    reports/scheduler_state.json  データソースごとの公表期間・取得済みかどうか・次に取得する日時・
+                                  前回取得したファイルのハッシュ
+
+公表期間の中で取得できた場合はその月は取得しない。取得できないまま期間が終わった場合は翌月の期間を待つ。
+
+使い方:
+    python scripts/scheduler.py              # 常駐して公表期間に取得する
+    python scripts/scheduler.py --once       # 今取得すべきデータソースだけを実行して終了する（cronから実行）
+    python scripts/scheduler.py --plan       # 各データソースの次の公表期間と状態を表示する
+"""
+
+import argparse
+import calendar
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import bojdata
+import raw_archive
+
+# プロジェクトのルートディレクトリと状態の保存先
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+state_path = os.path.join(project_root, "reports", "scheduler_state.json")
+
+JST = timezone(timedelta(hours=9))
+
+# 公表予定（日本時間）。days: 毎月の公表日の範囲、time: 公表時刻、months: 公表する月（省略時は毎月）
+RELEASE_CALENDAR = {
+    'call_rate': {'days': (1, 7), 'time': '09:00'},           # 日本銀行 無担保コールレート（前月の月中平均）
+    'cgpi': {'days': (8, 16), 'time': '08:50'},               # 日本銀行 企業物価指数（第8営業日ごろ）
+    'cpi': {'days': (17, 26), 'time': '08:30'},               # 総務省 全国消費者物価指数（下旬の金曜日）
+    'payroll': {'days': (4, 12), 'time': '08:30'},            # 厚生労働省 毎月勤労統計調査（速報）
+    'real_estate': {'days': (24, 31), 'time': '14:00'},       # 国土交通省 不動産価格指数
+    'di': {'days': (4, 12), 'time': '14:00'},                 # 内閣府 景気動向指数（速報）
+    'gdp': {'days': (24, 31), 'time': '22:30', 'months': (1, 4, 7, 10)},  # FRED（米国GDP速報の公表後）
+}
+
+# 公表予定の最終日から取得を続ける日数（公表の遅れに備える）
+GRACE_DAYS = 2
+
+# 取得し直す間隔（新しいデータが見つからないたびに倍にする）
+POLL_INTERVAL = timedelta(minutes=15)
+MAX_POLL_INTERVAL = timedelta(hours=4)
+
+# 常駐時に公表期間の外で待つ最長の時間（状態ファイルの変更などを反映するため）
+MAX_SLEEP = timedelta(hours=1)
+
+
+def downstream_sources():
+    """新しいデータを取得した後に実行する後段の処理（取得のないデータソース、bojdata.SOURCES の順）"""
+    return [source for source, actions in bojdata.SOURCES.items() if 'fetch' not in actions]
+
+
+def window(rule, year, month):
+    """
+    指定した月の公表期間
+
+    Returns:
+        tuple: (期間のキー 'YYYY-MM', 開始日時, 終了日時)。公表しない月は None
+    """
+    if 'months' in rule and month not in rule['months']:
+        return None
+    first_day, last_day = rule['days']
+    last_day = min(last_day, calendar.monthrange(year, month)[1])
+    hour, minute = (int(part) for part in rule['time'].split(':'))
+    start = datetime(year, month, first_day, hour, minute, tzinfo=JST)
+    end = datetime.combine(date(year, month, last_day) + timedelta(days=GRACE_DAYS + 1), datetime.min.time(), JST)
+    return f"{year}-{month:02d}", start, end
+
+
+def current_or_next_window(rule, now):
+    """now を含む公表期間、なければ次の公表期間"""
+    year, month = now.year, now.month
+    # 前月の期間が猶予の日数で今月にかかっている場合があるため、前月から順に調べる
+    year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    for _ in range(14):
+        found = window(rule, year, month)
+        if found is not None and found[2] > now:
+            return found
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return None
+
+
+def load_state():
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, state_path)
+
+
+def next_run(source, now, state):
+    """
+    データソースを次に取得する日時と公表期間のキー
+
+    Returns:
+        tuple: (日時, 期間のキー)。now 以前の日時なら今すぐ取得する
+    """
+    found = current_or_next_window(RELEASE_CALENDAR[source], now)
+    if found is None:
+        return None, None
+    period, start, end = found
+    entry = state.get(source, {})
+    if entry.get('period') == period:
+        if entry.get('done'):
+            # この期間は取得済みのため、次の期間を待つ
+            return next_run(source, end, state)
+        return max(start, datetime.fromisoformat(entry['next_poll'])), period
+    return start, period
+
+
+def due_sources(now, state):
+    """今取得すべきデータソースと公表期間のキー"""
+    due = []
+    for source in RELEASE_CALENDAR:
+        when, period = next_run(source, now, state)
+        if when is not None and when <= now:
+            due.append((source, period))
+    return due
+
+
+def data_fingerprint():
+    """data/ 直下の取得・加工済みファイル（CSV・Excel）の内容のハッシュ（プロジェクトルートからの相対パス -> ハッシュ）"""
+    fingerprint = {}
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if os.path.isfile(path) and name.endswith(('.csv', '.xlsx')):
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            fingerprint[f"data/{name}"] = hasher.hexdigest()
+    return fingerprint
+
+
+def known_hashes(source, entry):
+    """
+    前回取得したファイルのハッシュ
+
+    状態ファイルに記録がない場合（初回）は、生データのアーカイブ（raw_archive.py）の最新のエントリと
+    data/ 直下の現在のファイルから作る。
+    """
+    if entry.get('fetched'):
+        return dict(entry['fetched'])
+    known = {path: item['sha256'] for path, item in raw_archive.snapshot(bojdata.SOURCES[source]['fetch'][0]).items()}
+    known.update(data_fingerprint())
+    return known
+
+
+def run_bojdata(action, source, run_id, events_path=None):
+    """bojdata.py <処理> <データソース> を別のプロセスで実行する（成功した場合True）"""
+    env = dict(os.environ, BOJDATA_RUN_ID=run_id)
+    if events_path:
+        env['BOJDATA_EVENTS'] = events_path
+    command = [sys.executable, os.path.join(script_dir, "bojdata.py"), action, source]
+    return subprocess.run(command, cwd=project_root, env=env).returncode == 0
+
+
+def fetch(source, run_id):
+    """
+    データソースを取得し、取得が成功したかと取得したファイルのハッシュを返す
+
+    取得のスクリプトは失敗しても終了コードが0の場合があるため、終了コードに加えて、取得のステージが
+    成功し、1つ以上のファイルを書き出し、遮断中のホスト（circuit_breaker.py）で古いままになっていないことを確かめる。
+
+    Returns:
+        tuple: (成功した場合True, {プロジェクトルートからの相対パス: ハッシュ})
+    """
+    fd, events_path = tempfile.mkstemp(prefix=f"scheduler_{source}_", suffix='.ndjson')
+    os.close(fd)
+    try:
+        succeeded = run_bojdata('fetch', source, run_id, events_path)
+        with open(events_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    finally:
+        os.remove(events_path)
+    # 利用者が実行イベントを記録している場合はそちらにも書き写す
+    if os.environ.get('BOJDATA_EVENTS'):
+        with open(os.environ['BOJDATA_EVENTS'], 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    fetched = {}
+    for line in lines:
+        event = json.loads(line)
+        if event['event'] == 'output' and event.get('sha256'):
+            fetched[event['path']] = event['sha256']
+        elif event['event'] == 'stage_end' and event['stage'] == f"bojdata.fetch.{source}":
+            succeeded = succeeded and event.get('status', 'ok') == 'ok'
+        elif event['event'] == 'source' and event.get('stale'):
+            succeeded = False
+    return succeeded and bool(fetched), fetched
+
+
+def is_new(fetched, known):
+    """
+    取得したファイルが前回と変わったか
+
+    前回のハッシュが分かるファイルがあればそれだけで比べる（CPIのように取得後に削除するExcelは
+    前回のハッシュがない場合がある）。分かるファイルが1つもなければ、初めての取得として新しいとみなす。
+    """
+    compared = [path for path in fetched if path in known]
+    if not compared:
+        return True
+    return any(fetched[path] != known[path] for path in compared)
+
+
+def run_due(now=None, dry_run=False):
+    """
+    今取得すべきデータソースを実行し、状態を更新する
+
+    Returns:
+        bool: すべての処理が成功した場合True（取得すべきデータソースがない場合もTrue）
+    """
+    now = now or datetime.now(JST)
+    state = load_state()
+    due = due_sources(now, state)
+    if not due:
+        print(f"{now:%Y-%m-%d %H:%M} 取得すべきデータソースはありません")
+        return True
+    print(f"{now:%Y-%m-%d %H:%M} 取得するデータソース: {', '.join(f'{s}({p})' for s, p in due)}")
+    if dry_run:
+        return True
+
+    run_id = f"scheduler-{now:%Y%m%dT%H%M%S}"
+    ok = True
+    updated = []
+    for source, period in due:
+        entry = state.get(source, {})
+        known = known_hashes(source, entry)
+        succeeded, fetched = fetch(source, run_id)
+        new = succeeded and is_new(fetched, known)
+        ok = ok and succeeded
+        attempts = entry.get('attempts', 0) + 1 if entry.get('period') == period else 1
+        entry = {'period': period, 'attempts': attempts, 'last_poll': now.isoformat(timespec='seconds'),
+                 'fetched': dict(known, **fetched) if succeeded else known}
+        if new:
+            entry.update(done=True, updated_at=datetime.now(JST).isoformat(timespec='seconds'))
+            updated.append(source)
+            print(f"{source}: 新しいデータを取得しました（{period}、{attempts}回目）")
+        else:
+            interval = min(POLL_INTERVAL * 2 ** (attempts - 1), MAX_POLL_INTERVAL)
+            entry.update(done=False, next_poll=(datetime.now(JST) + interval).isoformat(timespec='seconds'))
+            reason = "新しいデータはまだありません" if succeeded else "取得に失敗しました"
+            print(f"{source}: {reason}（{period}、{attempts}回目、次は {interval} 後）")
+        state[source] = entry
+        save_state(state)
+
+    if updated:
+        # 新しいデータを取得したデータソースの加工と、後段の処理を実行する
+        for source in updated:
+            if 'process' in bojdata.SOURCES[source]:
+                ok = run_bojdata('process', source, run_id) and ok
+        for source in downstream_sources():
+            ok = run_bojdata('process', source, run_id) and ok
+    return ok
+
+
+def print_plan(now=None):
+    """各データソースの次の取得日時と状態を表示する"""
+    now = now or datetime.now(JST)
+    state = load_state()
+    for source in RELEASE_CALENDAR:
+        when, period = next_run(source, now, state)
+        entry = state.get(source, {})
+        status = '取得済み' if entry.get('done') else f"{entry.get('attempts', 0)}回取得"
+        last = f"前回: {entry['period']} {status}" if entry else '前回: なし'
+        print(f"  {source:<12} 次回 {when:%Y-%m-%d %H:%M}（{period}）  {last}")
+
+
+def serve():
+    """常駐して、公表期間に取得を繰り返す"""
+    print("公表予定に合わせて取得します（Ctrl+C で終了）")
+    while True:
+        run_due()
+        now = datetime.now(JST)
+        state = load_state()
+        upcoming = [next_run(source, now, state)[0] for source in RELEASE_CALENDAR]
+        wake = min([when for when in upcoming if when is not None] + [now + MAX_SLEEP])
+        print(f"次の確認: {wake:%Y-%m-%d %H:%M}")
+        time.sleep(max((wake - datetime.now(JST)).total_seconds(), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="公表予定に合わせて取得・加工を実行する")
+    parser.add_argument('--once', action='store_true', help="今取得すべきデータソースだけを実行して終了する")
+    parser.add_argument('--plan', action='store_true', help="各データソースの次の公表期間と状態を表示する")
+    parser.add_argument('--dry-run', action='store_true', help="取得すべきデータソースを表示するだけで実行しない")
+    args = parser.parse_args()
+
+    if args.plan:
+        print_plan()
+        return True
+    if args.once or args.dry_run:
+        return run_due(dry_run=args.dry_run)
+    try:
+        serve()
+    except KeyboardInterrupt:
+        print("\n終了します")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+series_store.py - data/ 以下のCSVに保存された各系列の定義と読み込み
+
+ファイルごとに異なる日付の形式（'YYYY/MM', 'yyyymm', 'YYYYMMDD', 年のみ）と
+日銀の時系列統計データ検索サイトの表形式（先頭の数行が系列名称などのメタ情報）を吸収し、
+系列を (期間の序数, 値) のNumPy配列として返す。
+
+期間の序数はpandasのPeriodと同じ定義（1970年1月・1970年第1四半期・1970年を0とする）で、
+頻度は 'M'（月次）・'Q'（四半期）・'A'（年次）。
+"""
+
+import functools
+import os
+import re
+
+# プロジェクトのルートディレクトリとデータディレクトリの設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+data_dir = os.path.join(project_root, "data")
+
+# 保存済みの系列の定義
+# file: data/ からのファイル名
+# date_column / date_format: 日付の列と形式（'boj' は日銀の表形式で、1列目の 'YYYY/MM' を日付とする）
+# column: 値の列
+# freq: 頻度
+# agg / upsample / require_complete: 頻度の変換規則（省略時は DEFAULT_RULES）
+SERIES = {
+    'cpi_yoy': {'file': "CPI_総合_統合.csv", 'date_column': '年月', 'date_format': 'YYYY/MM',
+                'column': '前年同月比', 'freq': 'M'},
+    'cpi_index': {'file': "CPI_総合_統合.csv", 'date_column': '年月', 'date_format': 'YYYY/MM',
+                  'column': '指数', 'freq': 'M'},
+    'call_rate': {'file': "boj_unsecured_call_rate.csv", 'date_column': '0', 'date_format': 'boj',
+                  'column': '2', 'freq': 'M'},  # 無担保コールレート・O/N 月平均
+    'call_rate_eom': {'file': "boj_unsecured_call_rate.csv", 'date_column': '0', 'date_format': 'boj',
+                      'column': '1', 'freq': 'M', 'agg': 'last'},  # 無担保コールレート・O/N 月末
+    'cgpi_yoy': {'file': "boj_corporate_price_index.csv", 'date_column': '0', 'date_format': 'boj',
+                 'column': '1', 'freq': 'M'},  # 国内企業物価指数 総平均（前年比）
+    'cgpi_index': {'file': "boj_corporate_price_index.csv", 'date_column': '0', 'date_format': 'boj',
+                   'column': '5', 'freq': 'M'},  # 国内企業物価指数 総平均
+    'ci_leading': {'file': "景気動向指数.csv", 'date_column': 'yyyymm', 'date_format': 'yyyymm',
+                   'column': 'CI_先行指数', 'freq': 'M'},
+    'ci_coincident': {'file': "景気動向指数.csv", 'date_column': 'yyyymm', 'date_format': 'yyyymm',
+                      'column': 'CI_一致指数', 'freq': 'M'},
+    'ci_lagging': {'file': "景気動向指数.csv", 'date_column': 'yyyymm', 'date_format': 'yyyymm',
+                   'column': 'CI_遅行指数', 'freq': 'M'},
+    'di_leading': {'file': "景気動向指数.csv", 'date_column': 'yyyymm', 'date_format': 'yyyymm',
+                   'column': 'DI_先行指数', 'freq': 'M'},
+    'di_coincident': {'file': "景気動向指数.csv", 'date_column': 'yyyymm', 'date_format': 'yyyymm',
+                      'column': 'DI_一致指数', 'freq': 'M'},
+    'di_lagging': {'file': "景気動向指数.csv", 'date_column': 'yyyymm', 'date_format': 'yyyymm',
+                   'column': 'DI_遅行指数', 'freq': 'M'},
+    'us_gdp': {'file': "all_gdp_data.csv", 'date_column': 'date', 'date_format': 'YYYYMMDD',
+               'column': 'us_gdp', 'freq': 'Q'},
+    'japan_gdp': {'file': "all_gdp_data.csv", 'date_column': 'date', 'date_format': 'YYYYMMDD',
+                  'column': 'japan_gdp', 'freq': 'Q'},
+    'world_gdp': {'file': "all_gdp_data.csv", 'date_column': 'date', 'date_format': 'YYYYMMDD',
+                  'column': 'world_gdp', 'freq': 'A'},
+    'payroll_index': {'file': "毎月勤労統計調査_年平均.csv", 'date_column': '年', 'date_format': 'YYYY',
+                      'column': '指数', 'freq': 'A'},
+    'tokyo_office': {'file': "tokyo_commercial_real_estate_price_index.csv", 'date_column': 'Year',
+                     'date_format': 'YYYY', 'column': 'Office', 'freq': 'A'},
+    'tokyo_commercial': {'file': "tokyo_commercial_real_estate_price_index.csv", 'date_column': 'Year',
+                         'date_format': 'YYYY', 'column': 'Commercial_Property', 'freq': 'A'},
+}
+
+# 頻度を変換する際の既定の集計方法（agg: 高頻度から低頻度, upsample: 低頻度から高頻度）
+# agg: mean（期間平均）, last（期末値）, sum（合計）
+# upsample: end（期末の期間にのみ置く）, ffill（同じ期間内のすべての期間に置く）
+DEFAULT_RULES = {'agg': 'mean', 'upsample': 'end', 'require_complete': True}
+
+# series_store の頻度とpandasのPeriodの頻度の対応
+PANDAS_FREQ = {'M': 'M', 'Q': 'Q', 'A': 'Y'}
+
+# 日付の形式ごとの正規表現（年・月の順に取り出す）
+DATE_PATTERNS = {
+    'YYYY/MM': re.compile(r'^(\d{4})/(\d{1,2})$'),
+    'boj': re.compile(r'^(\d{4})/(\d{1,2})$'),
+    'yyyymm': re.compile(r'^(\d{4})(\d{2})$'),
+    'YYYYMMDD': re.compile(r'^(\d{4})(\d{2})\d{2}$'),
+    'YYYY': re.compile(r'^(\d{4})$'),
+}
+
+# 日銀の表形式で欠損を表す値
+MISSING_VALUES = ['ND', '-', '*', '']
+
+
+def period_ordinal(year, month, freq):
+    """年・月から期間の序数を求める（配列でも可）"""
+    if freq == 'M':
+        return (year - 1970) * 12 + (month - 1)
+    if freq == 'Q':
+        return (year - 1970) * 4 + (month - 1) // 3
+    return year - 1970
+
+
+def period_label(ordinal, freq):
+    """期間の序数を表示用の文字列にする（月次: YYYY/MM, 四半期: YYYYQn, 年次: YYYY）"""
+    ordinal = int(ordinal)
+    if freq == 'M':
+        return f"{1970 + ordinal // 12}/{ordinal % 12 + 1:02d}"
+    if freq == 'Q':
+        return f"{1970 + ordinal // 4}Q{ordinal % 4 + 1}"
+    return str(1970 + ordinal)
+
+
+def series_rules(name):
+    """系列の頻度変換の規則"""
+    spec = SERIES[name]
+    return {key: spec.get(key, default) for key, default in DEFAULT_RULES.items()}
+
+
+def to_period_index(ordinals, freq):
+    """期間の序数をpandasのPeriodIndexに変換する"""
+    import pandas as pd
+
+    pandas_freq = PANDAS_FREQ[freq]
+    if hasattr(pd.PeriodIndex, 'from_ordinals'):
+        return pd.PeriodIndex.from_ordinals(ordinals, freq=pandas_freq)
+    return pd.PeriodIndex(ordinal=ordinals, freq=pandas_freq)
+
+
+def series_path(name):
+    return os.path.join(data_dir, SERIES[name]['file'])
+
+
+@functools.lru_cache(maxsize=16)
+def _read_table(path, mtime_ns):
+    """CSVを文字列のまま読み込む（同じファイルの複数の系列で読み込みを共有する）"""
+    import pandas as pd
+
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8')
+
+
+def parse_periods(values, date_format, freq):
+    """
+    日付の文字列の配列を期間の序数に変換する
+
+    Returns:
+        tuple: (序数の配列, 日付として解釈できた行のマスク)
+    """
+    import numpy as np
+
+    pattern = DATE_PATTERNS[date_format]
+    ordinals = np.zeros(len(values), dtype=np.int64)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        match = pattern.match(str(value).strip())
+        if not match:
+            continue
+        year = int(match.group(1))
+        month = int(match.group(2)) if match.lastindex and match.lastindex >= 2 else 1
+        ordinals[i] = period_ordinal(year, month, freq)
+        valid[i] = True
+    return ordinals, valid
+
+
+def load_series(name, data_root=None):
+    """
+    系列を読み込む
+
+    Returns:
+        tuple: (期間の序数の配列（昇順）, 値の配列（float64、欠損はNaN）)
+    """
+    import numpy as np
+    import pandas as pd
+
+    spec = SERIES[name]
+    path = os.path.join(data_root or data_dir, spec['file'])
+    table = _read_table(path, os.stat(path).st_mtime_ns)
+
+    ordinals, valid = parse_periods(table[spec['date_column']].to_numpy(), spec['date_format'], spec['freq'])
+    raw = table[spec['column']].where(~table[spec['column']].isin(MISSING_VALUES))
+    values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64)
+
+    ordinals, values = ordinals[valid], values[valid]
+    # 同じ期間が複数行ある場合は後の行を使う（年次系列を四半期の日付で保存している場合など）
+    ordinals, values = ordinals[::-1], values[::-1]
+    keep = ~np.isnan(values)
+    ordinals, values = ordinals[keep], values[keep]
+    ordinals, first = np.unique(ordinals, return_index=True)
+    return ordinals, values[first]
+
+
+def load_aligned(names, freq, data_root=None):
+    """
+    同じ頻度の複数の系列を共通の期間にそろえて読み込む
+
+    Returns:
+        tuple: (期間の序数の配列, 値の行列（期間×系列、欠損はNaN）)
+    """
+    import numpy as np
+
+    loaded = []
+    for name in names:
+        if SERIES[name]['freq'] != freq:
+            raise ValueError(f"{name} の頻度は {SERIES[name]['freq']} です（{freq} を指定）")
+        loaded.append(load_series(name, data_root))
+
+    non_empty = [ordinals for ordinals, _ in loaded if len(ordinals)]
+    if not non_empty:
+        return np.zeros(0, dtype=np.int64), np.full((0, len(names)), np.nan)
+    start = min(ordinals[0] for ordinals in non_empty)
+    end = max(ordinals[-1] for ordinals in non_empty)
+    periods = np.arange(start, end + 1, dtype=np.int64)
+    matrix = np.full((len(periods), len(names)), np.nan)
+    for j, (ordinals, values) in enumerate(loaded):
+        matrix[ordinals - start, j] = values
+    return periods, matrix
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+vintage_store.py - 改定される系列の公表ごとの値（ビンテージ）を差分で保存するスクリプト
+
+CPI・毎月勤労統計・景気動向指数・GDPは過去の値が改定されるが、毎回の実行で
+CPI_総合_統合.csv や 景気動向指数.csv を上書きするため、過去の公表値はgitの履歴にしか残らない。
+ここでは系列ごとに、前回のビンテージから変わったセル（期間と値）だけを公表日時と一緒に追記し、
+「X日時点で公表されていた値」を復元できるようにする。保存量は改定の量に比例し、全体の複製は持たない。
+
+    data/vintages/<系列名>.ndjson  1行1ビンテージ
+        差分:       {"release": 公表日時, "changes": [[期間の序数, 値 または null（削除）], ...]}
+        チェックポイント: {"release": 公表日時, "checkpoint": true, "start": 期間の序数, "values": [...]}
+    data/vintages/index.json       系列ごとの各ビンテージの公表日時・ファイル内の位置・チェックポイントかどうか
+
+公表日時はUTCの日時（タイムゾーンなしのISO形式、秒まで）で保存する。タイムゾーン付きの日時はUTCに変換し、
+タイムゾーンのない日時はUTCとみなす。
+
+CHECKPOINT_EVERY 回の差分ごとに全体の値（チェックポイント）を書き、復元は指定日時以前の
+直近のチェックポイントの位置から読み始めて、その後の差分だけを適用する。
+
+使い方:
+    python scripts/vintage_store.py record [--release 2025-03-21T08:30:00]
+    python scripts/vintage_store.py backfill      # gitの履歴にある過去のファイルからビンテージを作る
+    python scripts/vintage_store.py asof <系列名> <日時> [--period 2024/12]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+import metrics
+import profiling
+import series_store
+
+# プロジェクトのルートディレクトリと出力先の設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+vintages_dir = os.path.join(project_root, "data", "vintages")
+
+# 改定を記録する系列（派生指標はこれらから再計算できるため対象外）
+VINTAGE_SERIES = [
+    'cpi_yoy', 'cpi_index',
+    'payroll_index',
+    'ci_leading', 'ci_coincident', 'ci_lagging',
+    'di_leading', 'di_coincident', 'di_lagging',
+    'us_gdp', 'japan_gdp', 'world_gdp',
+]
+
+# この回数の差分ごとにチェックポイントを書く
+CHECKPOINT_EVERY = 12
+
+
+def _index_path():
+    return os.path.join(vintages_dir, "index.json")
+
+
+def _series_path(name):
+    return os.path.join(vintages_dir, f"{name}.ndjson")
+
+
+def load_index():
+    """系列名 -> [[公表日時, ファイル内の位置, チェックポイントかどうか], ...]"""
+    if not os.path.exists(_index_path()):
+        return {}
+    with open(_index_path(), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_index(index):
+    tmp_path = _index_path() + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, _index_path())
+
+
+def _normalize_release(value):
+    """公表日時をUTCのISO形式の文字列（秒まで、タイムゾーンなし）にそろえる（日付だけならその日の終わり）"""
+    if not isinstance(value, datetime):
+        text = str(value)
+        if len(text) == 10:
+            text += 'T23:59:59'
+        value = datetime.fromisoformat(text)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='seconds')
+
+
+def reconstruct(name, as_of=None, index=None):
+    """
+    指定日時時点の系列を復元する
+
+    Args:
+        name: 系列名
+        as_of: 日時（datetime またはISO形式の文字列、省略時は最新）
+        index: load_index() の結果（複数の系列を復元する場合に読み直さないため）
+
+    Returns:
+        tuple: (期間の序数の配列, 値の配列)。その時点でビンテージがなければ空の配列
+    """
+    import numpy as np
+
+    index = load_index() if index is None else index
+    entries = index.get(name, [])
+    if as_of is not None:
+        as_of = _normalize_release(as_of)
+        entries = [entry for entry in entries if entry[0] <= as_of]
+    if not entries:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    # 直近のチェックポイントから読み始める
+    start_i = max(i for i, entry in enumerate(entries) if entry[2])
+    values = {}
+    with open(_series_path(name), 'rb') as f:
+        f.seek(entries[start_i][1])
+        for _ in range(len(entries) - start_i):
+            record = json.loads(f.readline())
+            if record.get('checkpoint'):
+                values = {record['start'] + i: v for i, v in enumerate(record['values']) if v is not None}
+                continue
+            for ordinal, value in record['changes']:
+                if value is None:
+                    values.pop(ordinal, None)
+                else:
+                    values[ordinal] = value
+
+    ordinals = np.array(sorted(values), dtype=np.int64)
+    return ordinals, np.array([values[o] for o in ordinals], dtype=np.float64)
+
+
+def diff_cells(old_ordinals, old_values, ordinals, values):
+    """
+    前回のビンテージから変わったセルを求める（共通の期間の範囲の配列にそろえて一度に比較する）
+
+    Returns:
+        list: [[期間の序数, 新しい値 または None], ...]
+    """
+    import numpy as np
+
+    if not len(old_ordinals) and not len(ordinals):
+        return []
+    both = np.concatenate([old_ordinals, ordinals])
+    start, end = int(both.min()), int(both.max())
+    old = np.full(end - start + 1, np.nan)
+    new = np.full(end - start + 1, np.nan)
+    old[old_ordinals - start] = old_values
+    new[ordinals - start] = values
+    changed = np.flatnonzero(~((old == new) | (np.isnan(old) & np.isnan(new))))
+    return [[int(start + i), None if np.isnan(new[i]) else float(new[i])] for i in changed]
+
+
+def _append(name, record):
+    """1行追記して、その行の位置を返す"""
+    path = _series_path(name)
+    with open(path, 'ab') as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+    return offset
+
+
+@metrics.timed()
+def record_vintages(release=None, data_root=None, names=None):
+    """
+    現在のファイルの値を新しいビンテージとして記録する（前回から変わった系列のみ）
+
+    Args:
+        release: 公表日時（省略時は現在時刻）
+        data_root: 系列を読み込むディレクトリ（省略時は data/）
+        names: 記録する系列（省略時は VINTAGE_SERIES）
+
+    Returns:
+        dict: 系列名 -> 記録した変更セル数（変更がなかった系列は含まない）
+    """
+    release = _normalize_release(release or datetime.now(timezone.utc))
+    names = names or VINTAGE_SERIES
+    index = load_index()
+    # 途中の系列まで書き込んでから失敗しないように、先に公表日時の順序を確認する
+    for name in names:
+        if index.get(name) and index[name][-1][0] >= release:
+            raise ValueError(f"{name} の最新のビンテージ（{index[name][-1][0]}）以前の公表日時は記録できません: {release}")
+    os.makedirs(vintages_dir, exist_ok=True)
+
+    recorded = {}
+    for name in names:
+        path = os.path.join(data_root or series_store.data_dir, series_store.SERIES[name]['file'])
+        if not os.path.exists(path):
+            continue
+        ordinals, values = series_store.load_series(name, data_root)
+        entries = index.setdefault(name, [])
+
+        old_ordinals, old_values = reconstruct(name, index=index)
+        changes = diff_cells(old_ordinals, old_values, ordinals, values)
+        if not changes:
+            continue
+
+        deltas_since_checkpoint = len(entries) - 1 - max((i for i, e in enumerate(entries) if e[2]), default=-1)
+        if not entries or deltas_since_checkpoint >= CHECKPOINT_EVERY:
+            start = int(ordinals.min()) if len(ordinals) else 0
+            dense = [None] * ((int(ordinals.max()) - start + 1) if len(ordinals) else 0)
+            for ordinal, value in zip(ordinals, values):
+                dense[int(ordinal) - start] = float(value)
+            offset = _append(name, {'release': release, 'checkpoint': True, 'start': start, 'values': dense})
+            entries.append([release, offset, True])
+        else:
+            offset = _append(name, {'release': release, 'changes': changes})
+            entries.append([release, offset, False])
+        metrics.record_output(_series_path(name), rows=len(changes))
+        recorded[name] = len(changes)
+
+    index = {name: entries for name, entries in index.items() if entries}
+    _save_index(index)
+    if recorded:
+        print(f"ビンテージを記録しました（{release}）: " + ', '.join(f"{n}({c}セル)" for n, c in recorded.items()))
+    else:
+        print(f"前回のビンテージから変更はありません（{release}）")
+    return recorded
+
+
+def backfill(names=None):
+    """
+    gitの履歴にある過去のファイルを、コミット日時を公表日時としてビンテージに記録する
+
+    記録済みの最新のビンテージより後のコミットのみを対象にする。
+    """
+    names = names or VINTAGE_SERIES
+    files = sorted({series_store.SERIES[name]['file'] for name in names})
+    index = load_index()
+    latest = max((entries[-1][0] for name, entries in index.items() if name in names and entries), default='')
+
+    commits = {}
+    for filename in files:
+        relpath = os.path.relpath(os.path.join(series_store.data_dir, filename), project_root)
+        log = subprocess.run(['git', 'log', '--format=%H %cI', '--', relpath], cwd=project_root,
+                             capture_output=True, text=True, check=True).stdout
+        for line in log.splitlines():
+            commit, committed_at = line.split(' ', 1)
+            release = _normalize_release(committed_at)
+            if release > latest:
+                commits.setdefault((release, commit), set()).add(filename)
+
+    # 古いコミットから順に、そのコミット時点のファイルを一時ディレクトリに取り出して記録する
+    for (release, commit), changed_files in sorted(commits.items()):
+        with tempfile.TemporaryDirectory() as tmp:
+            for filename in changed_files:
+                relpath = os.path.relpath(os.path.join(series_store.data_dir, filename), project_root)
+                content = subprocess.run(['git', 'show', f"{commit}:{relpath.replace(os.sep, '/')}"], cwd=project_root,
+                                         capture_output=True, check=True).stdout
+                with open(os.path.join(tmp, filename), 'wb') as f:
+                    f.write(content)
+            targets = [name for name in names if series_store.SERIES[name]['file'] in changed_files]
+            print(f"{commit[:10]} ({release}): {', '.join(sorted(changed_files))}")
+            record_vintages(release=release, data_root=tmp, names=targets)
+    return len(commits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="改定される系列のビンテージを差分で保存・復元する")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help="現在のファイルの値をビンテージとして記録する")
+    record_parser.add_argument('--release', default=None, help="公表日時（UTC、省略時は現在時刻）")
+    subparsers.add_parser('backfill', help="gitの履歴にある過去のファイルからビンテージを作る")
+    asof_parser = subparsers.add_parser('asof', help="指定日時時点の系列を表示する")
+    asof_parser.add_argument('series', choices=VINTAGE_SERIES, help="系列名")
+    asof_parser.add_argument('as_of', help="日時（UTC、YYYY-MM-DD または ISO形式）")
+    asof_parser.add_argument('--period', default=None, help="この期間の値だけを表示する（例: 2024/12）")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_vintages(release=args.release)
+    elif args.command == 'backfill':
+        backfill()
+    else:
+        freq = series_store.SERIES[args.series]['freq']
+        ordinals, values = reconstruct(args.series, args.as_of)
+        for ordinal, value in zip(ordinals, values):
+            label = series_store.period_label(ordinal, freq)
+            if args.period is None or label == args.period:
+                print(f"{label}\t{value}")
+    return True
+
+
+if __name__ == "__main__":
+    profiling.consume_flag()
+    main()